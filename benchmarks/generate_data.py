@@ -0,0 +1,190 @@
+import argparse
+import json
+import uuid
+import numpy as np
+import pandas as pd
+
+
+VERBS = ["interacted", "answered", "attempted", "completed", "consumed", "progressed"]
+VERB_WEIGHTS = [0.55, 0.15, 0.08, 0.07, 0.1, 0.05]
+ELEMENT_URL = "https://chem109.wisc.edu/wp-admin/admin-ajax.php?action=h5p_embed&id="
+# The verbs whose IRI doesn't end in the verb itself
+VERB_IRIS = {"consumed": "http://activitystrea.ms/schema/1.0/consume"}
+
+
+def generate(csv_path, json_path, num_rows, num_students=300, num_elements=400, num_days=37, seed=0,
+             chunk_size=1000000, statements=False):
+    """
+    Writes a synthetic Learning Locker export and a matching DayElement.json. The export looks like the real thing:
+    students work through a Day's elements in sessions of statements a minute or two apart, a few students use more than
+    one browser (uuid), some type their email into the email element, and a small share of rows has a bad timestamp or
+    no uuid. The same arguments always produce the same files.
+
+    :param csv_path: where to write the csv
+    :param json_path: where to write the DayElement.json file
+    :param num_rows: number of statements to generate
+    :param num_students: number of students in the class
+    :param num_elements: number of H5P elements (at most 999)
+    :param num_days: number of Days the elements are split into (at most 99)
+    :param seed: the random seed
+    :param chunk_size: max number of rows generated and written at a time, which bounds memory use
+    :param statements: if True, write the same statements as newline-delimited raw xAPI statements instead of a csv
+    """
+    rng = np.random.default_rng(seed)
+
+    # About one in ten students uses a second browser, so has two uuids
+    num_uuids = num_students + num_students // 10
+    uuids = np.array([str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(num_uuids)], dtype=object)
+    uuid_student = np.concatenate([np.arange(num_students), rng.integers(0, num_students, num_uuids - num_students)])
+    emails = np.array(["student%d@wisc.edu" % student for student in range(num_students)], dtype=object)
+
+    # Split the elements into Days, the first element of Day 1 being where students enter their email
+    element_ids = rng.choice(np.arange(1, 1000), num_elements, replace=False)
+    day_elements = np.array_split(element_ids, num_days)
+    email_element = day_elements[0][0]
+
+    write_day_info(json_path, day_elements)
+
+    term_start = np.datetime64("2021-01-19T08:00:00", "ns")
+    header = True
+    for start in range(0, num_rows, chunk_size):
+        chunk = generate_chunk(rng, min(chunk_size, num_rows - start), uuids, uuid_student, emails, day_elements,
+                               email_element, term_start)
+        if statements:
+            write_statements(chunk, csv_path, start, mode="w" if header else "a")
+        else:
+            chunk.to_csv(csv_path, mode="w" if header else "a", header=header, index=False)
+        header = False
+
+
+def generate_chunk(rng, num_rows, uuids, uuid_student, emails, day_elements, email_element, term_start):
+    """
+    Generates one chunk of statements, as whole sessions of one uuid working through one Day.
+
+    :param rng: the numpy random Generator
+    :param num_rows: number of statements in the chunk
+    :param uuids: array of every uuid
+    :param uuid_student: array mapping each uuid (by position) to the student it belongs to
+    :param emails: array of each student's email
+    :param day_elements: list of arrays of the H5P IDs in each Day
+    :param email_element: H5P ID of the element students type their email into
+    :param term_start: numpy datetime64 of when Day 1 is released
+    :return: a dataframe with the raw data csv's columns
+    """
+    # Sessions of ~20 statements, each on a Day that was released two days after the last one
+    session_lengths = rng.geometric(1 / 20, num_rows)
+    session_lengths = session_lengths[:np.searchsorted(np.cumsum(session_lengths), num_rows) + 1]
+    session_lengths[-1] -= session_lengths.sum() - num_rows
+    num_sessions = len(session_lengths)
+
+    session_uuids = rng.integers(0, len(uuids), num_sessions)
+    session_days = rng.integers(0, len(day_elements), num_sessions)
+    lag_seconds = rng.exponential(3 * 24 * 3600, num_sessions)
+    session_starts = term_start + (session_days * 2 * 24 * 3600 + lag_seconds).astype("timedelta64[s]")
+
+    # Statements within a session are a minute and a half apart on average, with the occasional long break
+    session_of_row = np.repeat(np.arange(num_sessions), session_lengths)
+    gaps = rng.exponential(90, num_rows)
+    long_breaks = rng.random(num_rows) < 0.02
+    gaps[long_breaks] = rng.exponential(3600, long_breaks.sum())
+    offsets = np.cumsum(gaps)
+    session_firsts = np.cumsum(session_lengths) - session_lengths
+    offsets -= np.repeat(offsets[session_firsts], session_lengths)
+    timestamps = session_starts[session_of_row] + (offsets * 1e9).astype("timedelta64[ns]")
+
+    # Each statement is on a random element of the session's Day
+    day_sizes = np.array([len(elements) for elements in day_elements])
+    day_offsets = np.concatenate([[0], np.cumsum(day_sizes)[:-1]])
+    all_elements = np.concatenate(day_elements)
+    row_days = session_days[session_of_row]
+    object_ids = all_elements[day_offsets[row_days] + (rng.random(num_rows) * day_sizes[row_days]).astype("int64")]
+
+    names = uuids[session_uuids[session_of_row]]
+    verbs = rng.choice(VERBS, num_rows, p=VERB_WEIGHTS)
+    has_name = rng.random(num_rows) < 0.6
+    question_names = np.where(has_name, "Element " + pd.Series(object_ids).astype(str), None)
+    durations = np.where(verbs == "answered", np.round(rng.exponential(30, num_rows), 2), np.nan)
+
+    # Answers are free text, except on the email element where some students type in their email
+    responses = np.where(verbs == "answered", "Some answer text", None).astype(object)
+    gives_email = (object_ids == email_element) & (verbs == "answered") & (rng.random(num_rows) < 0.7)
+    responses[gives_email] = emails[uuid_student[session_uuids[session_of_row][gives_email]]]
+
+    # Some sub-content URLs carry a query after the ID, just like the real exports
+    urls = pd.Series(object_ids).astype(str).radd(ELEMENT_URL)
+    urls[rng.random(num_rows) < 0.1] += "?subContentId=" + str(uuid.UUID(int=0))
+
+    timestamp_strings = pd.Series(timestamps).dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str.slice(0, 23) + "Z"
+    timestamp_strings[rng.random(num_rows) < 0.0005] = "Invalid date"
+    names = pd.Series(names, dtype=object)
+    names[rng.random(num_rows) < 0.0005] = None
+
+    # Learning Locker exports newest statements first (the analyzer sorts the whole file anyway)
+    chunk = pd.DataFrame({"Name": names, "Verb": verbs, "object id": urls, "Question/Slide": question_names,
+                          "Timestamp": timestamp_strings, "Duration": durations, "Response": responses})
+    return chunk.iloc[np.argsort(timestamps, kind="stable")[::-1]]
+
+
+def write_statements(chunk, statements_path, first_row, mode="w"):
+    """
+    Writes a chunk of the export as newline-delimited xAPI statements, shaped like the ones H5P sends to the LRS.
+
+    :param chunk: a dataframe from ``generate_chunk``
+    :param statements_path: where to write the statements
+    :param first_row: number of statements written before this chunk, which numbers the statement ids
+    :param mode: "w" to start a new file, "a" to add to it
+    """
+    with open(statements_path, mode) as f:
+        for row_num, row in enumerate(chunk.itertuples(index=False), first_row):
+            name, verb, object_id, question_name, timestamp, duration, response = row
+            statement = {
+                "id": str(uuid.UUID(int=row_num, version=4)),
+                "actor": {"objectType": "Agent", "account": {"name": name, "homePage": "https://chem109.wisc.edu"}}
+                if isinstance(name, str) else {"objectType": "Agent"},
+                "verb": {"id": VERB_IRIS.get(verb, "http://adlnet.gov/expapi/verbs/" + verb),
+                         "display": {"en-US": verb}},
+                "object": {"id": object_id, "objectType": "Activity", "definition": {
+                    "extensions": {"http://h5p.org/x-api/h5p-local-content-id":
+                                   int(object_id[len(ELEMENT_URL):].split("?")[0])},
+                    "name": {"en-US": question_name} if isinstance(question_name, str) else {}}},
+                "timestamp": timestamp,
+                "version": "1.0.0"}
+            if isinstance(response, str) or not np.isnan(duration):
+                statement["result"] = {}
+                if isinstance(response, str):
+                    statement["result"]["response"] = response
+                if not np.isnan(duration):
+                    statement["result"]["duration"] = "PT" + str(duration) + "S"
+            f.write(json.dumps(statement) + "\n")
+
+
+def write_day_info(json_path, day_elements):
+    """
+    Writes a DayElement.json file for the given Days.
+
+    :param json_path: where to write the file
+    :param day_elements: list of arrays of the H5P IDs in each Day
+    """
+    days = {}
+    for day_num, elements in enumerate(day_elements, 1):
+        days["Day_" + str(day_num)] = {"Title": "Day " + str(day_num), "DayNumber": day_num,
+                                       "Unit": (day_num - 1) // 4 + 1, "Elements": [int(e) for e in elements]}
+    with open(json_path, "w") as f:
+        json.dump({"Filter_Emails": [], "Time_Delta": 30, "Days": days}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a synthetic Learning Locker xAPI export and a matching "
+                                                 "DayElement.json file.")
+    parser.add_argument("csv_path", help="where to write the csv (or statements)")
+    parser.add_argument("json_path", help="where to write the DayElement.json file")
+    parser.add_argument("--rows", type=int, default=10000, help="number of statements (default: 10000)")
+    parser.add_argument("--students", type=int, default=300, help="number of students (default: 300)")
+    parser.add_argument("--elements", type=int, default=400, help="number of H5P elements, at most 999 (default: 400)")
+    parser.add_argument("--days", type=int, default=37, help="number of Days, at most 99 (default: 37)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--statements", action="store_true",
+                        help="write newline-delimited raw xAPI statements instead of a csv")
+    args = parser.parse_args()
+    generate(args.csv_path, args.json_path, args.rows, args.students, args.elements, args.days, args.seed,
+             statements=args.statements)
@@ -0,0 +1,224 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent / "xapi_data_analyzer"))
+
+import numpy as np
+import pandas as pd
+import GlobalData
+import Reporter
+from ElementCollection import ElementCollection
+from Main import use_json
+from generate_data import generate
+
+
+DEFAULT_SIZES = [10000, 1000000, 10000000]
+DATA_DIR = BENCHMARK_DIR / "data"
+RESULTS_DIR = BENCHMARK_DIR / "results"
+
+
+class QuietReporter:
+    """
+    Swallows the analyzer's popups and progress updates so they don't end up in the timings.
+    """
+
+    def popup(self, message, title=""):
+        pass
+
+    def progress(self, title, current, total):
+        pass
+
+    def status(self, message):
+        pass
+
+    def cancelled(self):
+        return False
+
+
+def measure(function, repeat=1, memory=True):
+    """
+    Times ``function`` and measures the peak memory it allocates. The timing runs are done without tracemalloc, which
+    slows down allocation-heavy code, and the peak memory comes from one more run with tracemalloc on.
+
+    :param function: a function taking no arguments
+    :param repeat: number of timing runs (the fastest is kept)
+    :param memory: if False, skip the memory run
+    :return: dict of "seconds" and "peak_bytes" (None if ``memory`` is False)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    peak_bytes = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {"seconds": min(times), "peak_bytes": peak_bytes}
+
+
+def benchmark_size(num_rows, args):
+    """
+    Runs every benchmark stage on a generated export of ``num_rows`` statements.
+
+    :param num_rows: number of statements in the export
+    :param args: the parsed command-line arguments
+    :return: dict of the results for this size
+    """
+    csv_path, json_path = data_files(num_rows, args)
+    element_ids = [element_id for day in json.load(open(json_path))["Days"].values() for element_id in day["Elements"]]
+
+    def load():
+        GlobalData.set_data_vars(str(csv_path), str(json_path), use_cache=False)
+
+    def get_dataframe():
+        ElementCollection(element_ids, GlobalData.raw_data, GlobalData.identity,
+                          GlobalData.interaction_matrix).get_dataframe()
+
+    def get_students_duration():
+        ElementCollection(element_ids, GlobalData.raw_data, GlobalData.identity,
+                          GlobalData.interaction_matrix).get_students_duration(GlobalData.delta_max)
+
+    def full_use_json():
+        with tempfile.TemporaryDirectory() as output_dir:
+            use_json("benchmark", list(GlobalData.DayInfo["Days"].values()), output_dir=output_dir,
+                     workers=args.workers)
+
+    stages = {}
+    if args.statements:
+        statements_path, _ = data_files(num_rows, args, statements=True)
+        print("  set_data_vars_statements...", flush=True)
+        stages["set_data_vars_statements"] = measure(
+            lambda: GlobalData.set_data_vars(str(statements_path), str(json_path), use_cache=False), args.repeat,
+            not args.no_memory)
+
+    for name, function in [("set_data_vars", load), ("get_dataframe", get_dataframe),
+                           ("get_students_duration", get_students_duration), ("use_json", full_use_json)]:
+        print("  " + name + "...", flush=True)
+        stages[name] = measure(function, args.repeat, not args.no_memory)
+
+    return {"rows": num_rows, "csv_bytes": csv_path.stat().st_size, "students": GlobalData.identity.num_people,
+            "raw_data_bytes_per_row": GlobalData.bytes_per_row(GlobalData.raw_data), "stages": stages}
+
+
+def data_files(num_rows, args, statements=False):
+    """
+    Finds the generated export for these settings, generating it first if it isn't there yet.
+
+    :param num_rows: number of statements in the export
+    :param args: the parsed command-line arguments
+    :param statements: if True, find the export as newline-delimited raw xAPI statements rather than a csv
+    :return: tuple of the Paths of the csv (or statements) and DayElement.json files
+    """
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    name = "xapi_%d_rows_%d_students_%d_elements_seed%d" % (num_rows, args.students, args.elements, args.seed)
+    csv_path = DATA_DIR / (name + (".ndjson" if statements else ".csv"))
+    json_path = DATA_DIR / (name + ".json")
+    if not (csv_path.exists() and json_path.exists()):
+        print("  generating " + csv_path.name + "...", flush=True)
+        generate(csv_path, json_path, num_rows, args.students, args.elements, seed=args.seed, statements=statements)
+    return csv_path, json_path
+
+
+def git_commit():
+    """
+    :return: the short hash of the checked out commit, or None if it can't be found
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    """
+    Prints a table of the results, and the change from ``previous`` where the same stage and size was measured there.
+
+    :param results: the results dict of this run
+    :param previous: the results dict of an earlier run to compare against (optional)
+    """
+    previous_stages = {}
+    if previous is not None:
+        for size in previous["sizes"]:
+            for stage, values in size["stages"].items():
+                previous_stages[(size["rows"], stage)] = values
+
+    print()
+    print("%12s  %-26s %10s %12s %10s" % ("rows", "stage", "seconds", "peak MiB", "vs prev"))
+    for size in results["sizes"]:
+        for stage, values in size["stages"].items():
+            peak = "-" if values["peak_bytes"] is None else "%.1f" % (values["peak_bytes"] / 1024 ** 2)
+            change = ""
+            if (size["rows"], stage) in previous_stages:
+                change = "%+.0f%%" % ((values["seconds"] / previous_stages[(size["rows"], stage)]["seconds"] - 1) * 100)
+            print("%12d  %-26s %10.3f %12s %10s" % (size["rows"], stage, values["seconds"], peak, change))
+        print("%12d  raw_data takes up %.1f bytes per row" % (size["rows"], size["raw_data_bytes_per_row"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times and measures the peak memory of the analysis pipeline on "
+                                                 "generated Learning Locker exports, and saves the results as JSON.")
+    parser.add_argument("--sizes", type=lambda s: [int(size) for size in s.split(",")], default=DEFAULT_SIZES,
+                        help="comma-separated list of the numbers of rows to benchmark (default: 10000,1000000,"
+                             "10000000)")
+    parser.add_argument("--students", type=int, default=300, help="number of students (default: 300)")
+    parser.add_argument("--elements", type=int, default=400, help="number of H5P elements (default: 400)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generated exports (default: 0)")
+    parser.add_argument("--repeat", type=int, default=1, help="number of timing runs per stage, the fastest is kept "
+                                                              "(default: 1)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="report worker processes for use_json (default: 0, so all of the work is measured)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slower) peak memory runs")
+    parser.add_argument("--statements", action="store_true",
+                        help="also time loading the same export as newline-delimited raw xAPI statements")
+    parser.add_argument("--compare", type=Path, default=None,
+                        help="results file to compare against (default: the latest one in the --out folder)")
+    parser.add_argument("--out", type=Path, default=RESULTS_DIR,
+                        help="folder to save the results in (default: benchmarks/results, which git ignores)")
+    args = parser.parse_args(argv)
+
+    Reporter.set_reporter(QuietReporter())
+    previous_files = sorted(args.out.glob("*.json")) if args.out.exists() else []
+    compare_path = args.compare or (previous_files[-1] if previous_files else None)
+
+    results = {"created": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+               "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+               "platform": platform.platform(), "settings": {"students": args.students, "elements": args.elements,
+                                                             "seed": args.seed, "workers": args.workers},
+               "sizes": []}
+    for num_rows in args.sizes:
+        print("Benchmarking " + str(num_rows) + " rows", flush=True)
+        results["sizes"].append(benchmark_size(num_rows, args))
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    results_path = args.out / (datetime.now().strftime("%Y%m%d-%H%M%S") + "_" + (results["commit"] or "unknown")
+                                  + ".json")
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=2)
+
+    previous = None
+    if compare_path is not None:
+        with open(compare_path) as f:
+            previous = json.load(f)
+    print_results(results, previous)
+    print("\nSaved results to " + str(results_path)
+          + ("" if compare_path is None else " (compared against " + compare_path.name + ")"))
+
+
+if __name__ == "__main__":
+    main()
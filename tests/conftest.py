@@ -0,0 +1,16 @@
+import os
+import sys
+from pathlib import Path
+import pytest
+
+# The modules in xapi_data_analyzer import each other as top-level modules (that's how Main.py and Cli.py are run)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "xapi_data_analyzer"))
+
+
+@pytest.fixture
+def fixtures():
+    """
+    :return: Path of the folder of small exports the tests run on (export.csv, the same statements as raw xAPI
+        statements, and their DayElement.json)
+    """
+    return Path(__file__).parent / "fixtures"
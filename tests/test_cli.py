@@ -0,0 +1,34 @@
+import json
+import Cli
+
+
+def write_inputs(folder):
+    # Day 1's element has statements in February 2021, Day 2's element only counts from 2030 on
+    lines = ["Name,Verb,object id,Question/Slide,Timestamp,Duration,Response"]
+    for minute in range(6):
+        lines.append("u%d,interacted,https://x/?action=h5p_embed&id=%d,Slide,2021-02-01T16:%02d:00Z,,"
+                     % (minute % 2, 10 + minute % 2, minute))
+    (folder / "data.csv").write_text("\n".join(lines) + "\n")
+    days = {"Day_1": {"Title": "Day 1", "DayNumber": 1, "Unit": 1, "Elements": [10]},
+            "Day_2": {"Title": "Day 2", "DayNumber": 2, "Unit": 1, "Elements": [11], "Start": "2030-01-01"}}
+    (folder / "DayElement.json").write_text(json.dumps({"Filter_Emails": [], "Time_Delta": 30, "Days": days}))
+    return [str(folder / "data.csv"), str(folder / "DayElement.json"), "--output-dir", str(folder), "--no-cache",
+            "--workers", "0"]
+
+
+def test_date_range_without_statements(tmp_path, capsys):
+    args = write_inputs(tmp_path)
+    assert Cli.main(args + ["--days", "all", "--start", "2030-01-01", "--sweep", "--weekly", "--metrics"]) == 0
+    assert "no statements in the date range" in capsys.readouterr().out
+    assert not list(tmp_path.glob("xAPI-Data-Analyzer_*"))
+
+
+def test_day_window_without_statements(tmp_path):
+    # There are statements, just none of them in Day 2's window
+    args = write_inputs(tmp_path)
+    assert Cli.main(args + ["--days", "2", "--sweep", "--weekly", "--metrics"]) == 0
+    output_folder, = tmp_path.glob("xAPI-Data-Analyzer_*")
+    assert (output_folder / "TimeDeltaSweep.csv").exists()
+    assert (output_folder / "WeeklyEngagement.csv").exists()
+    assert not (output_folder / "time_delta_sweep.png").exists()
+    assert not (output_folder / "Day2").exists()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import pandas as pd
+import pytest
+import DataCache
+import GlobalData
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(DataCache, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(DataCache, "_fingerprints", {})
+
+
+@pytest.fixture
+def export(fixtures, tmp_path):
+    export = tmp_path / "export.csv"
+    shutil.copyfile(fixtures / "export.csv", export)
+    return export
+
+
+def save_entry(key, rows=10):
+    raw_data = pd.DataFrame({"Name": pd.Categorical(["student"] * rows), "Duration": range(rows)})
+    DataCache.save(key, key + ".csv", raw_data, pd.DataFrame(columns=["Name", "Email"]), 0, 0)
+    return sum(file.stat().st_size for file in DataCache.CACHE_DIR.glob(key + ".*"))
+
+
+def set_last_used(key, seconds):
+    for file in DataCache.CACHE_DIR.glob(key + ".*"):
+        os.utime(file, (seconds, seconds))
+
+
+def test_fingerprint_is_memoized_by_file_stat(export):
+    key = DataCache.fingerprint(str(export))
+    assert list(DataCache._fingerprints.values()) == [key]
+
+    # Same size and modification time: the memo is trusted without reading the file again
+    stat = export.stat()
+    contents = export.read_bytes()
+    export.write_bytes(b"#" + contents[1:])
+    os.utime(export, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert DataCache.fingerprint(str(export)) == key
+    DataCache._fingerprints.clear()
+    assert DataCache.fingerprint(str(export)) != key
+
+    export.write_bytes(contents + b",,,,,,\n")
+    assert DataCache.fingerprint(str(export)) != key
+    assert len(DataCache._fingerprints) == 2
+
+
+def test_fingerprint_changes_with_the_cache_version(export, monkeypatch):
+    key = DataCache.fingerprint(str(export))
+    monkeypatch.setattr(DataCache, "CACHE_VERSION", DataCache.CACHE_VERSION + 1)
+    DataCache._fingerprints.clear()
+    assert DataCache.fingerprint(str(export)) != key
+
+
+def test_load_file_round_trip(export):
+    first = GlobalData.load_file(str(export))
+    assert len(list(DataCache.CACHE_DIR.iterdir())) == 2
+    cached = GlobalData.load_file(str(export))
+    pd.testing.assert_frame_equal(cached[0], first[0])
+    pd.testing.assert_frame_equal(cached[1], first[1], check_dtype=False)
+    assert cached[2:] == first[2:]
+
+
+def test_evict_least_recently_used():
+    entry_bytes = save_entry("a")
+    save_entry("b")
+    save_entry("c")
+    set_last_used("a", 300)
+    set_last_used("b", 100)
+    set_last_used("c", 200)
+
+    DataCache.evict(2 * entry_bytes)
+    assert {file.stem for file in DataCache.CACHE_DIR.iterdir()} == {"a", "c"}
+
+    # Loading an entry makes it the most recently used
+    assert DataCache.load("c") is not None
+    DataCache.evict(entry_bytes)
+    assert {file.stem for file in DataCache.CACHE_DIR.iterdir()} == {"c"}
+
+    DataCache.clear()
+    assert list(DataCache.CACHE_DIR.iterdir()) == []
+
+
+def test_save_evicts_beyond_max_cache_bytes(monkeypatch):
+    entry_bytes = save_entry("a")
+    set_last_used("a", 100)
+    save_entry("b")
+    set_last_used("b", 200)
+    monkeypatch.setattr(DataCache, "MAX_CACHE_BYTES", 2 * entry_bytes + entry_bytes // 2)
+    save_entry("c")
+    assert {file.stem for file in DataCache.CACHE_DIR.iterdir()} == {"b", "c"}
+    assert DataCache.load("a") is None
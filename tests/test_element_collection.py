@@ -0,0 +1,119 @@
+import datetime
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import GlobalData
+from ElementCollection import sum_engaged_gaps, sweep_days, timestamps_ns
+from GapIndex import GapIndex
+from IdentityIndex import IdentityIndex
+
+
+def loop_durations(codes, timestamps, delta_max):
+    """
+    The per-row loop ``get_students_duration`` used before it was vectorized: each student's rows are walked in data
+    order and every gap shorter than ``delta_max`` minutes is added up. Only students with at least two rows get a
+    duration.
+    """
+    data = pd.DataFrame({"Name": codes, "Timestamp": pd.to_datetime(timestamps, unit="ns")})
+    durations = {}
+    delta_max = datetime.timedelta(minutes=delta_max)
+    for student in pd.unique(data["Name"]):
+        student_df = data[data["Name"] == student].reset_index()
+        duration = datetime.timedelta()
+        for index in range(0, len(student_df) - 1):
+            delta = student_df.iloc[index]["Timestamp"] - student_df.iloc[index + 1]["Timestamp"]
+            if delta < delta_max:
+                duration += delta
+            durations[student] = duration.total_seconds() / 60
+    return durations
+
+
+def vectorized_durations(codes, timestamps, delta_max, num_groups):
+    totals, counts = sum_engaged_gaps(codes, num_groups, timestamps, delta_max)
+    return {code: totals[code] / 1e9 / 60 for code in range(num_groups) if counts[code] > 1}
+
+
+def descending_timestamps(rng, num_rows, gaps_minutes=None):
+    if gaps_minutes is None:
+        gaps_minutes = rng.integers(0, 90, num_rows)
+    start = pd.Timestamp("2021-02-01").value
+    return start - np.cumsum(np.asarray(gaps_minutes, dtype="int64") * 60 * 10 ** 9)
+
+
+@pytest.mark.parametrize("delta_max", [1, 10, 30])
+def test_matches_loop_on_generated_data(delta_max):
+    rng = np.random.default_rng(delta_max)
+    timestamps = descending_timestamps(rng, 500)
+    codes = rng.integers(0, 20, len(timestamps))
+    assert vectorized_durations(codes, timestamps, delta_max, 20) == pytest.approx(
+        loop_durations(codes, timestamps, delta_max))
+
+
+def test_empty_input():
+    totals, counts = sum_engaged_gaps(np.array([], dtype="int64"), 3, np.array([], dtype="int64"), 30)
+    assert totals.tolist() == [0, 0, 0]
+    assert counts.tolist() == [0, 0, 0]
+    assert loop_durations([], np.array([], dtype="int64"), 30) == {}
+
+
+def test_single_statement():
+    timestamps = descending_timestamps(np.random.default_rng(0), 1)
+    assert vectorized_durations(np.array([0]), timestamps, 30, 1) == loop_durations([0], timestamps, 30) == {}
+
+
+def test_gaps_exactly_at_time_delta_are_ignored():
+    # Gaps of 29, 30 and 31 minutes with a Time_Delta of 30: only the 29 minute one counts
+    timestamps = descending_timestamps(None, 4, [0, 29, 30, 31])
+    codes = np.zeros(4, dtype="int64")
+    assert vectorized_durations(codes, timestamps, 30, 1) == loop_durations(codes, timestamps, 30) == {0: 29.0}
+
+
+def test_unsorted_input():
+    # Rows out of timestamp order give negative gaps, which both add up just the same
+    rng = np.random.default_rng(1)
+    timestamps = rng.permutation(descending_timestamps(rng, 200))
+    codes = rng.integers(0, 5, len(timestamps))
+    assert vectorized_durations(codes, timestamps, 30, 5) == pytest.approx(loop_durations(codes, timestamps, 30))
+
+
+def test_gap_index_matches_sum_engaged_gaps_and_the_loop():
+    # Whole-minute gaps, so Time_Deltas land exactly on gap lengths. Group 3 has a single statement, group 4 none.
+    rng = np.random.default_rng(2)
+    timestamps = descending_timestamps(rng, 300, rng.integers(0, 40, 300))
+    codes = rng.integers(0, 3, len(timestamps))
+    codes[150] = 3
+    deltas = [1, 2, 5, 13, 20, 30, 39, 40]
+    gap_index = GapIndex(codes, 5, timestamps, max(deltas))
+    assert gap_index.counts.tolist() == np.bincount(codes, minlength=5).tolist()
+
+    sweep = gap_index.sweep(deltas)
+    for i, delta_max in enumerate(deltas):
+        totals, counts = sum_engaged_gaps(codes, 5, timestamps, delta_max)
+        assert gap_index.totals(delta_max).tolist() == sweep[i].tolist() == totals.tolist()
+        assert {code: totals[code] / 1e9 / 60 for code in range(5) if counts[code] > 1} == pytest.approx(
+            loop_durations(codes, timestamps, delta_max))
+    assert sweep[:, 3:].tolist() == [[0, 0]] * len(deltas)
+
+
+def test_gap_index_rejects_a_larger_time_delta():
+    gap_index = GapIndex(np.zeros(2, dtype="int64"), 1, descending_timestamps(None, 2, [0, 5]), 10)
+    assert gap_index.totals(10).tolist() == [5 * 60 * 10 ** 9]
+    with pytest.raises(ValueError):
+        gap_index.totals(11)
+
+
+def test_sweep_days_matches_sum_engaged_gaps(fixtures):
+    data, email_pairs, _, _ = GlobalData.load_file(str(fixtures / "export.csv"), use_cache=False)
+    identity = IdentityIndex(set(data["Name"].unique()), email_pairs)
+    with open(fixtures / "DayElement.json") as f:
+        days = list(json.load(f)["Days"].values())
+    deltas = [1, 5, 30, 60]
+    sweep_df = sweep_days(days, data, identity, deltas)
+    assert list(sweep_df.columns) == ["Day1", "Day2", "Day3"]
+    for day in days:
+        rows = np.flatnonzero(data["object id"].isin(day["Elements"]).to_numpy())
+        codes = identity.codes(data["Name"].take(rows))
+        for delta_max in deltas:
+            totals, _ = sum_engaged_gaps(codes, identity.num_people, timestamps_ns(data["Timestamp"])[rows], delta_max)
+            assert sweep_df.loc[delta_max, "Day" + str(day["DayNumber"])] == pytest.approx(totals.sum() / 1e9 / 60)
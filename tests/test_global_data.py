@@ -0,0 +1,110 @@
+import pandas as pd
+import pytest
+import GlobalData
+
+
+def write_csv(path, rows):
+    lines = ["Name,Verb,object id,Question/Slide,Timestamp,Duration,Response"]
+    lines += [",".join(row) for row in rows]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def write_chunked_csv(path):
+    # The first chunk (of 4 rows) has no element names or responses at all, the second one does
+    rows = [("u" + str(i), "interacted", "https://x/?action=h5p_embed&id=" + str(10 + i), "",
+             "2021-04-19T16:%02d:00Z" % i, "", "") for i in range(4)]
+    rows += [("u" + str(i), "answered", "https://x/?action=h5p_embed&id=" + str(10 + i), "Slide " + str(i),
+              "2021-04-19T17:%02d:00Z" % i, "", "yes") for i in range(4)]
+    write_csv(path, rows)
+
+
+def test_load_file_with_a_column_empty_in_one_chunk(tmp_path, monkeypatch):
+    write_chunked_csv(tmp_path / "data.csv")
+    monkeypatch.setattr(GlobalData, "CHUNK_SIZE", 4)
+
+    data, _, dropped_timestamp, dropped_name_nan = GlobalData.load_file(str(tmp_path / "data.csv"), use_cache=False,
+                                                                        responses=True)
+
+    assert (len(data), dropped_timestamp, dropped_name_nan) == (8, 0, 0)
+    for column in GlobalData.CATEGORY_COLUMNS + [GlobalData.RESPONSE_COLUMN]:
+        assert data[column].dtype == "category"
+    assert sorted(data["Question/Slide"].cat.categories) == ["Slide 0", "Slide 1", "Slide 2", "Slide 3"]
+    assert list(data["Response"].cat.categories) == ["yes"]
+    assert data["Question/Slide"].isna().sum() == 4
+    assert data["Response"].isna().sum() == 4
+
+
+def test_responses_only_kept_when_asked_for(tmp_path):
+    write_csv(tmp_path / "data.csv", [("u1", "answered", "https://x/?action=h5p_embed&id=10", "Slide",
+                                        "2021-04-19T17:00:00Z", "", "u1@wisc.edu")])
+
+    data, email_pairs, _, _ = GlobalData.load_file(str(tmp_path / "data.csv"), use_cache=False)
+    assert list(data.columns) == GlobalData.RAW_DATA_COLUMNS
+    # Emails are still found in the responses
+    assert email_pairs.values.tolist() == [["u1", "u1@wisc.edu"]]
+
+    data, _, _, _ = GlobalData.load_file(str(tmp_path / "data.csv"), use_cache=False, responses=True)
+    assert list(data.columns) == GlobalData.RAW_DATA_COLUMNS + [GlobalData.RESPONSE_COLUMN]
+    assert list(data[GlobalData.RESPONSE_COLUMN]) == ["u1@wisc.edu"]
+
+
+def comparable(result):
+    # Files merged in pieces find their categories in another order than one file does, so only the values are compared
+    data, email_pairs, dropped_timestamp, dropped_name_nan = result
+    data = data.astype({column: object for column in data.columns if data[column].dtype == "category"})
+    return data, sorted(map(tuple, email_pairs.values)), dropped_timestamp, dropped_name_nan
+
+
+def split_export(fixtures, tmp_path, parts):
+    """
+    Writes pieces of the fixture export as their own csvs.
+
+    :param parts: a list of (file name, list of row positions of the export) pairs
+    :return: the list of paths written
+    """
+    export = pd.read_csv(fixtures / "export.csv", dtype=str)
+    paths = []
+    for file_name, rows in parts:
+        export.iloc[rows].to_csv(tmp_path / file_name, index=False)
+        paths.append(str(tmp_path / file_name))
+    return paths
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_merge_overlapping_exports(fixtures, tmp_path, workers):
+    # The weekly export overlaps the first one by 60 rows, and the bad rows (5 and 17) are in both
+    paths = split_export(fixtures, tmp_path, [("first.csv", list(range(0, 150))), ("weekly.csv", list(range(90, 240))),
+                                              ("bad.csv", [5, 17])])
+    merged = GlobalData.load_data(paths, use_cache=False, workers=workers)
+    whole = GlobalData.load_file(str(fixtures / "export.csv"), use_cache=False)
+    data, email_pairs, _, _ = comparable(merged)
+    whole_data, whole_email_pairs, _, _ = comparable(whole)
+    pd.testing.assert_frame_equal(data, whole_data)
+    assert email_pairs == whole_email_pairs
+    # Rows dropped while cleaning are counted in every file they're in
+    assert merged[2:] == (whole[2] + 1, whole[3] + 1)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_merge_keeps_a_duplicate_within_a_file(fixtures, tmp_path, workers):
+    # Row 30 is in the first export once, and really is in the overlapping one twice, so it's kept twice
+    rows = list(range(20, 240)) + [30]
+    paths = split_export(fixtures, tmp_path, [("first.csv", list(range(0, 150))), ("weekly.csv", rows),
+                                              ("combined.csv", list(range(0, 20)) + rows)])
+    merged = GlobalData.load_data(paths[:2], use_cache=False, workers=workers)
+    combined = GlobalData.load_file(paths[2], use_cache=False)
+    assert len(merged[0]) == len(combined[0]) == len(GlobalData.load_file(str(fixtures / "export.csv"),
+                                                                          use_cache=False)[0]) + 1
+    pd.testing.assert_frame_equal(comparable(merged)[0], comparable(combined)[0])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_merge_files_given_out_of_order(fixtures, tmp_path, workers):
+    paths = split_export(fixtures, tmp_path, [("a.csv", list(range(160, 240))), ("b.csv", list(range(0, 100))),
+                                              ("c.csv", list(range(80, 180)))])
+    merged = GlobalData.merge_files(paths, use_cache=False, workers=workers)
+    whole = GlobalData.load_file(str(fixtures / "export.csv"), use_cache=False)
+    data, email_pairs, _, _ = comparable(merged)
+    whole_data, whole_email_pairs, _, _ = comparable(whole)
+    pd.testing.assert_frame_equal(data, whole_data)
+    assert email_pairs == whole_email_pairs
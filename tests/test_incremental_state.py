@@ -0,0 +1,105 @@
+import pandas as pd
+import pytest
+import GlobalData
+import IncrementalState
+from ElementCollection import analyze_days
+
+
+@pytest.fixture
+def exports(fixtures, tmp_path, monkeypatch):
+    """
+    :return: a function writing a cumulative export of the fixture's statements up to a time (plus any extra rows), and
+        returning its path
+    """
+    monkeypatch.setattr(IncrementalState, "STATE_DIR", tmp_path / "incremental")
+    export = pd.read_csv(fixtures / "export.csv", dtype=str)
+    timestamps = pd.to_datetime(export["Timestamp"], errors="coerce", format="ISO8601", utc=True)
+
+    def write(file_name, before=None, extra_rows=()):
+        rows = export if before is None else export[(timestamps < before) | timestamps.isna()]
+        rows = pd.concat([pd.DataFrame(list(extra_rows), columns=export.columns), rows])
+        rows.to_csv(tmp_path / file_name, index=False)
+        return str(tmp_path / file_name)
+    write.export = export
+    write.timestamps = timestamps
+    return write
+
+
+def run(fixtures, data_path, incremental):
+    """
+    :return: the per-Day results of an incremental run or a full recompute of every Day over ``data_path``
+    """
+    GlobalData.set_data_vars(data_path, str(fixtures / "DayElement.json"), use_cache=False, incremental=incremental)
+    days = list(GlobalData.DayInfo["Days"].values())
+    if incremental:
+        return IncrementalState.analyze_days(GlobalData.incremental_state, days, GlobalData.raw_data,
+                                             GlobalData.identity)
+    return analyze_days(days, GlobalData.raw_data, GlobalData.identity, GlobalData.delta_max,
+                        GlobalData.interaction_matrix)
+
+
+def session_split(exports):
+    """
+    :return: the timestamp of a statement that follows the same student's previous statement on the same element within
+        the Time_Delta, so splitting the export there leaves a gap to bridge across the high water mark
+    """
+    rows = exports.export.assign(Timestamp=exports.timestamps).dropna(subset=["Timestamp", "Name"])
+    rows = rows.sort_values("Timestamp")
+    gaps = rows.groupby(["Name", "object id"])["Timestamp"].diff()
+    bridged = rows[(gaps > pd.Timedelta(0)) & (gaps < pd.Timedelta(minutes=30))]
+    return bridged["Timestamp"].iloc[len(bridged) // 2]
+
+
+def email_row(exports, name, email, minutes_after):
+    """
+    :return: a csv row of ``name`` entering ``email`` into the email element, after the newest statement of the export
+    """
+    row = exports.export[exports.export["Response"].str.contains("@", na=False)].iloc[0].copy()
+    row["Name"], row["Response"] = name, email
+    row["Timestamp"] = (exports.timestamps.max() + pd.Timedelta(minutes=minutes_after)).strftime(
+        "%Y-%m-%dT%H:%M:%S.000Z")
+    return row.tolist()
+
+
+def test_gaps_are_bridged_across_the_high_water_mark(fixtures, exports):
+    split = session_split(exports)
+    first = exports("first.csv", before=split)
+    incremental = run(fixtures, first, True)
+    assert GlobalData.incremental_state["high_water_mark"] < split.value
+    assert IncrementalState.compare_results(incremental, run(fixtures, first, False)) == []
+
+    second = exports("second.csv")
+    incremental = run(fixtures, second, True)
+    # Only the statements from the split on were read
+    full_data = GlobalData.load_file(second, use_cache=False)[0]
+    assert len(GlobalData.raw_data) == (full_data["Timestamp"] >= split).sum()
+    assert IncrementalState.compare_results(incremental, run(fixtures, second, False)) == []
+
+
+def test_new_email_for_a_known_uuid(fixtures, exports):
+    # A uuid that never gave an email gets one, which changes its key in the state but merges nobody
+    uuid = exports.export["Name"].value_counts().index[2]
+    split = session_split(exports)
+    run(fixtures, exports("first.csv", before=split), True)
+    second = exports("second.csv", extra_rows=[email_row(exports, uuid, "new@wisc.edu", 5)])
+    incremental = run(fixtures, second, True)
+    assert len(GlobalData.raw_data) < len(exports.export)
+    assert "new@wisc.edu" in GlobalData.identity.names
+    assert IncrementalState.compare_results(incremental, run(fixtures, second, False)) == []
+
+
+def test_uuid_linked_to_an_existing_email(fixtures, exports):
+    # A later export links a uuid to the email another uuid already gave, so the two people the state kept apart are
+    # one student now, and the state is rebuilt from the whole export
+    email_pairs = exports.export.loc[exports.export["Response"].str.contains("@", na=False), ["Name", "Response"]]
+    uuid, email = email_pairs.iloc[0]
+    other_uuid = next(name for name in exports.export["Name"].value_counts().index
+                      if name not in set(email_pairs["Name"]))
+    split = session_split(exports)
+    run(fixtures, exports("first.csv", before=split), True)
+    second = exports("second.csv", extra_rows=[email_row(exports, other_uuid, email, 5)])
+    incremental = run(fixtures, second, True)
+    assert len(GlobalData.raw_data) == len(GlobalData.load_file(second, use_cache=False)[0])
+    codes = GlobalData.identity.codes(pd.Series([uuid, other_uuid]))
+    assert codes[0] == codes[1]
+    assert IncrementalState.compare_results(incremental, run(fixtures, second, False)) == []
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+from ElementCollection import ElementCollection
+from IdentityIndex import IdentityIndex
+from InteractionMatrix import InteractionMatrix
+
+
+def make_data():
+    # Sorted by descending timestamp, like raw_data. u2 and u3 are the same person (they entered the same email).
+    data = pd.DataFrame({
+        "Name": ["u1", "u2", "u1", "u3", "u4", "u2"],
+        "object id": [10, 10, 20, 20, 20, 10],
+        "Question/Slide": ["A", None, "B", None, None, "A"],
+        "Timestamp": pd.to_datetime(["2021-02-01 10:05", "2021-02-01 10:04", "2021-02-01 10:03", "2021-02-01 10:02",
+                                     "2021-02-01 10:01", "2021-02-01 10:00"], utc=True),
+    })
+    data["Name"] = data["Name"].astype("category")
+    data["Question/Slide"] = data["Question/Slide"].astype("category")
+    identity = IdentityIndex(data["Name"].unique(), pd.DataFrame({"Name": ["u2", "u3"], "Email": ["b@x", "b@x"]}))
+    return data, identity
+
+
+def test_users_in_order_of_first_appearance():
+    data, identity = make_data()
+    matrix = InteractionMatrix(data, identity)
+    assert list(matrix.users(10)) == ["u1", "b@x"]
+    assert list(matrix.users(20)) == ["u1", "b@x", "u4"]
+    assert list(matrix.users(30)) == []
+
+
+def test_num_users():
+    data, identity = make_data()
+    matrix = InteractionMatrix(data, identity)
+    assert matrix.num_users([20, 30, 10]).tolist() == [3, 0, 2]
+    assert InteractionMatrix(data.iloc[:0], identity).num_users([10]).tolist() == [0]
+
+
+def test_statement_counts():
+    data, identity = make_data()
+    matrix = InteractionMatrix(data, identity)
+    assert matrix.statement_counts(10).to_dict() == {"u1": 1, "b@x": 2}
+    assert matrix.statement_counts(20).to_dict() == {"u1": 1, "b@x": 1, "u4": 1}
+    assert matrix.statement_counts(30).empty
+
+
+def test_students_with_all_and_any():
+    data, identity = make_data()
+    matrix = InteractionMatrix(data, identity)
+    # 10 and 20 overlap in u1 and b@x (who reached 10 as u2 and 20 as u3)
+    assert sorted(matrix.students_with_all([10, 20])) == ["b@x", "u1"]
+    assert sorted(matrix.students_with_any([10, 20])) == ["b@x", "u1", "u4"]
+    # Repeated ids count once
+    assert sorted(matrix.students_with_all([20, 20])) == ["b@x", "u1", "u4"]
+    # Nobody interacted with 30, so nobody interacted with all of them
+    assert list(matrix.students_with_all([10, 30])) == []
+    assert sorted(matrix.students_with_any([10, 30])) == ["b@x", "u1"]
+    assert list(matrix.students_with_all([])) == []
+    assert list(matrix.students_with_any([])) == []
+
+
+def test_queries_on_elements_missing_from_the_data():
+    data, identity = make_data()
+    # Element 20 only has rows outside of the matrix's rows
+    matrix = InteractionMatrix(data, identity, np.array([0, 1, 5]))
+    assert list(matrix.users(20)) == []
+    assert matrix.statement_counts(20).empty
+    assert list(matrix.students_with_all([10, 20])) == []
+    assert sorted(matrix.students_with_any([10, 20, 999])) == ["b@x", "u1"]
+    # Students without a single row in the matrix are still known, just never returned
+    assert len(matrix.students) == identity.num_people
+
+
+def test_rows_limit_the_matrix():
+    data, identity = make_data()
+    matrix = InteractionMatrix(data, identity, np.array([0, 1, 2]))
+    assert matrix.num_users([10, 20]).tolist() == [2, 1]
+
+
+def test_dataframe_counts_match_interacted_lists():
+    data, identity = make_data()
+    for matrix in (None, InteractionMatrix(data, identity)):
+        df = ElementCollection([10, 20, 30], data, identity, matrix).get_dataframe()
+        assert df["Number of users who interacted"].tolist() == [2, 3, 0]
+        assert df["Number of users who interacted"].tolist() == df["List of users who interacted"].map(len).tolist()
+        assert df["% of users who interacted"].tolist() == [2 / 3 * 100, 100.0, 0.0]
+
+
+def test_identity_codes_merge_uuids_sharing_an_email():
+    data, identity = make_data()
+    codes = identity.codes(data["Name"])
+    assert identity.num_people == 3
+    assert codes[1] == codes[3] == codes[5]
+    assert identity.names[codes[1]] == "b@x"
+    assert identity.codes(pd.Series(["nobody"])).tolist() == [-1]
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+import Reports
+
+
+def day_report():
+    day_df = pd.DataFrame({"object id": [1, 2], "Number of users who interacted": [3, 1],
+                           "% of users who interacted": [75.0, 25.0]}, index=[1, 2])
+    return day_df, {"student-a": 5.0, "student-b": 12.5}
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_report_pool_writes_the_reports(tmp_path, monkeypatch, workers):
+    monkeypatch.chdir(tmp_path)
+    pool = Reports.ReportPool(workers)
+    if workers:
+        assert pool.executor._mp_context.get_start_method() == "spawn"
+    for day_num in [1, 2]:
+        (tmp_path / str(day_num)).mkdir()
+        pool.submit(Reports.write_day_reports, tmp_path / str(day_num), day_num, *day_report(), 4)
+    assert pool.close() == 0
+
+    for day_num, (_, graphs) in zip([1, 2], pool.results):
+        day_folder = tmp_path / str(day_num)
+        assert (day_folder / ("Day" + str(day_num) + ".csv")).exists()
+        assert (day_folder / ("StudentDurations_Day" + str(day_num) + ".csv")).exists()
+        assert graphs and all(graph.parent == day_folder and graph.exists() for graph in graphs)
+
+
+def test_report_pool_logs_worker_errors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pool = Reports.ReportPool(1)
+    # The Day's folder doesn't exist, so the worker fails
+    pool.submit(Reports.write_day_reports, tmp_path / "missing", 1, *day_report(), 4)
+    assert pool.close() == 1
+    assert pool.results == [None]
+    assert str(tmp_path / "missing") in (tmp_path / Reports.ERROR_LOG).read_text()
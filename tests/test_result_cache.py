@@ -0,0 +1,129 @@
+import json
+import shutil
+import pandas as pd
+import pytest
+import Cli
+import DataCache
+import GlobalData
+import ResultCache
+
+
+@pytest.fixture(autouse=True)
+def cache_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(ResultCache, "RESULT_CACHE_DIR", tmp_path / "results")
+    monkeypatch.setattr(DataCache, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(DataCache, "_fingerprints", {})
+
+
+def report(id_list):
+    day_df = pd.DataFrame({"object id": id_list, "users": range(len(id_list))}, index=id_list)
+    return day_df, {"student-a": 5.0, "student-b": 12.5}
+
+
+def test_key_ignores_id_order():
+    assert ResultCache.key("data", [3, 1, 2], 30) == ResultCache.key("data", [1, 2, 3], 30)
+
+
+def test_key_changes_with_the_config(monkeypatch):
+    window = (pd.Timestamp("2021-02-01", tz="UTC"), None)
+    base = ResultCache.key("data", [1, 2], 30)
+    changed = [ResultCache.key("other data", [1, 2], 30), ResultCache.key("data", [1, 2, 3], 30),
+               ResultCache.key("data", [1, 2], 31), ResultCache.key("data", [1, 2], 30, extended=True),
+               ResultCache.key("data", [1, 2], 30, window=window),
+               ResultCache.key("data", [1, 2], 30, window=window[::-1])]
+    monkeypatch.setattr(ResultCache, "RESULT_CACHE_VERSION", ResultCache.RESULT_CACHE_VERSION + 1)
+    changed.append(ResultCache.key("data", [1, 2], 30))
+    assert len({base, *changed}) == len(changed) + 1
+
+
+def test_data_fingerprint_follows_the_files(fixtures, tmp_path, monkeypatch):
+    export = tmp_path / "export.csv"
+    shutil.copyfile(fixtures / "export.csv", export)
+    before = GlobalData.fingerprint_data(str(export))
+    assert GlobalData.fingerprint_data(str(export)) == before
+
+    with open(export, "a") as f:
+        f.write(",,,,,,\n")
+    after = GlobalData.fingerprint_data(str(export))
+    assert after != before
+
+    # A new cleaned data format makes the old reports stale too
+    monkeypatch.setattr(DataCache, "CACHE_VERSION", DataCache.CACHE_VERSION + 1)
+    monkeypatch.setattr(DataCache, "_fingerprints", {})
+    assert GlobalData.fingerprint_data(str(export)) != after
+
+
+def test_round_trip(tmp_path):
+    graph = tmp_path / "graph.png"
+    graph.write_bytes(b"png")
+    day_df, students_dict = report([7, 8, 9])
+    ResultCache.save("entry", [7, 8, 9], day_df, students_dict, [graph])
+
+    cached_df, cached_students, graphs = ResultCache.load("entry", [7, 8, 9])
+    pd.testing.assert_frame_equal(cached_df, day_df)
+    assert cached_students == students_dict
+    assert [path.read_bytes() for path in graphs] == [b"png"]
+
+    # The same elements in another order: the table is reordered and the graphs have to be redrawn
+    cached_df, _, graphs = ResultCache.load("entry", [9, 7, 8])
+    assert list(cached_df["object id"]) == [9, 7, 8]
+    assert list(cached_df.index) == [9, 7, 8]
+    assert graphs is None
+
+    assert ResultCache.load("missing", [7, 8, 9]) is None
+
+
+@pytest.mark.parametrize("contents", [b"", b"not a pickle", b"\x80\x04\x95"])
+def test_corrupt_entry_is_removed(contents):
+    entry = ResultCache.RESULT_CACHE_DIR / "entry"
+    entry.mkdir(parents=True)
+    (entry / ResultCache.RESULT_FILE).write_bytes(contents)
+    assert ResultCache.load("entry", [1]) is None
+    assert not entry.exists()
+
+    # So the report can be cached again
+    day_df, students_dict = report([1])
+    ResultCache.save("entry", [1], day_df, students_dict)
+    assert ResultCache.load("entry", [1])[1] == students_dict
+
+
+def test_evict_least_recently_used():
+    for name in ["old", "new"]:
+        ResultCache.save(name, [1], *report([1]))
+    ResultCache.load("old", [1])  # "old" becomes the most recently used
+    entry_bytes = (ResultCache.RESULT_CACHE_DIR / "new" / ResultCache.RESULT_FILE).stat().st_size
+    ResultCache.evict(entry_bytes + 1)
+    assert ResultCache.load("new", [1]) is None
+    assert ResultCache.load("old", [1]) is not None
+
+    ResultCache.clear()
+    assert list(ResultCache.RESULT_CACHE_DIR.iterdir()) == []
+
+
+def test_cli_reuses_reports_until_the_inputs_change(fixtures, tmp_path, capsys):
+    export = tmp_path / "export.csv"
+    day_element = tmp_path / "DayElement.json"
+    shutil.copyfile(fixtures / "export.csv", export)
+    shutil.copyfile(fixtures / "DayElement.json", day_element)
+
+    def run():
+        output_dir = tmp_path / ("run" + str(len(list(tmp_path.glob("run*")))))
+        output_dir.mkdir()
+        assert Cli.main([str(export), str(day_element), "--ids", "245,661", "--output-dir", str(output_dir)]) == 0
+        output = capsys.readouterr().out
+        assert "Result cache:" in output
+        return "1 hit(s)" in output
+
+    assert not run()
+    assert run()
+
+    with open(export, "a") as f:
+        f.write(",,,,,,\n")
+    assert not run()
+    assert run()
+
+    day_info = json.loads(day_element.read_text())
+    day_info["Time_Delta"] = 10
+    day_element.write_text(json.dumps(day_info))
+    assert not run()
+    assert run()
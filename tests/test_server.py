@@ -0,0 +1,96 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+import GlobalData
+import Server
+from ElementCollection import ElementCollection, analyze_days
+from Main import total_durations
+
+
+@pytest.fixture
+def start_server(fixtures):
+    servers = []
+
+    def start(responses=False):
+        service = Server.QueryService(str(fixtures / "export.csv"), str(fixtures / "DayElement.json"),
+                                      use_cache=False, responses=responses)
+        server = Server.make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return "http://127.0.0.1:" + str(server.server_port)
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(url):
+    """
+    :return: a tuple of (HTTP status, decoded JSON body)
+    """
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_elements(start_server):
+    url = start_server()
+    day_1 = GlobalData.DayInfo["Days"]["Day_1"]["Elements"]
+    status, rows = get(url + "/elements?day=1")
+    assert status == 200
+    assert [row["object id"] for row in rows] == day_1
+    expected = ElementCollection(day_1, GlobalData.raw_data, GlobalData.identity).get_dataframe()
+    assert [row["Number of users who interacted"] for row in rows] == \
+        expected["Number of users who interacted"].tolist()
+
+    status, rows = get(url + "/elements?ids=" + ",".join(map(str, day_1[:2])))
+    assert status == 200 and [row["object id"] for row in rows] == day_1[:2]
+
+
+def test_durations(start_server):
+    url = start_server()
+    day_2 = GlobalData.DayInfo["Days"]["Day_2"]["Elements"]
+    for delta_max in (1, 5, 30):
+        status, durations = get(url + "/durations?day=2&delta_max=" + str(delta_max))
+        assert status == 200
+        expected = ElementCollection(day_2, GlobalData.raw_data, GlobalData.identity).get_students_duration(delta_max)
+        assert durations == pytest.approx(expected)
+    # Without a delta_max, the Time_Delta from the JSON file is used
+    assert get(url + "/durations?day=2")[1] == get(url + "/durations?day=2&delta_max=30")[1]
+
+
+def test_totals(start_server):
+    url = start_server()
+    status, totals = get(url + "/totals?days=1,3&delta_max=20")
+    assert status == 200
+    days = [GlobalData.DayInfo["Days"]["Day_1"], GlobalData.DayInfo["Days"]["Day_3"]]
+    expected = json.loads(total_durations(analyze_days(days, GlobalData.raw_data, GlobalData.identity, 20),
+                                          GlobalData.identity).to_json(orient="index"))
+    assert totals == expected
+    assert get(url + "/totals")[1].keys() == expected.keys()
+
+
+@pytest.mark.parametrize("query", ["/durations?day=1&delta_max=0", "/durations?day=1&delta_max=-5",
+                                   "/durations?day=1&delta_max=99999999", "/totals?delta_max=abc",
+                                   "/elements?ids=1,x", "/elements", "/totals?start=yesterday",
+                                   "/durations?day=1&start=2021-03-01&end=2021-02-01", "/elements?day=1&metrics=1"])
+def test_bad_parameters(start_server, query):
+    status, body = get(start_server() + query)
+    assert status == 400
+    assert body["error"]
+
+
+@pytest.mark.parametrize("query", ["/nope", "/elements?day=99", "/durations?day=99"])
+def test_unknown_paths(start_server, query):
+    assert get(start_server() + query)[0] == 404
+
+
+def test_metrics_with_responses(start_server):
+    url = start_server(responses=True)
+    status, rows = get(url + "/elements?day=1&metrics=1")
+    assert status == 200
+    assert "Number of distinct responses" in rows[0]
@@ -0,0 +1,57 @@
+import json
+import pandas as pd
+import pytest
+import GlobalData
+import StatementReader
+
+STATEMENT_FILES = ["statements.ndjson", "statements_wrapped.ndjson", "statements.json"]
+
+
+@pytest.fixture(params=["pyarrow", "json"])
+def reader(request, monkeypatch):
+    """
+    Runs a test once with pyarrow reading the newline-delimited files, and once with the json module reading them.
+    """
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(StatementReader, "pa", None)
+    return request.param
+
+
+def comparable(data):
+    # Each file finds its categories in its own order, so only the values are compared
+    return data.astype({column: object for column in data.columns if data[column].dtype == "category"})
+
+
+@pytest.mark.parametrize("file_name", STATEMENT_FILES)
+def test_statements_load_like_the_csv(fixtures, reader, file_name):
+    csv_result = GlobalData.load_file(str(fixtures / "export.csv"), use_cache=False, responses=True)
+    statements_result = GlobalData.load_file(str(fixtures / file_name), use_cache=False, responses=True)
+
+    pd.testing.assert_frame_equal(comparable(statements_result[0]), comparable(csv_result[0]))
+    pd.testing.assert_frame_equal(statements_result[1].sort_values("Name", ignore_index=True),
+                                  csv_result[1].sort_values("Name", ignore_index=True))
+    # The same bad timestamps and missing uuid are dropped
+    assert statements_result[2:] == csv_result[2:] == (2, 1)
+
+
+@pytest.mark.parametrize("file_name", STATEMENT_FILES)
+def test_statements_in_several_chunks(fixtures, reader, file_name, monkeypatch):
+    whole = pd.concat(StatementReader.read_statements(str(fixtures / file_name), 1000), ignore_index=True)
+    monkeypatch.setattr(StatementReader, "BLOCK_SIZE", 4096)
+    monkeypatch.setattr(StatementReader, "READ_SIZE", 100)
+    chunks = list(StatementReader.read_statements(str(fixtures / file_name), 7))
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), whole)
+
+
+def test_account_name_over_display_name(tmp_path, reader):
+    statements = [{"actor": {"name": "Ann", "account": {"name": "uuid-1"}}, "verb": {"id": "x/answered"},
+                   "object": {"id": "https://x/?action=h5p_embed&id=1"}, "timestamp": "2021-02-01T10:00:00Z"},
+                  {"actor": {"name": "Bob"}, "verb": {"id": "x/answered"},
+                   "object": {"id": "https://x/?action=h5p_embed&id=1"}, "timestamp": "2021-02-01T10:01:00Z"}]
+    (tmp_path / "statements.ndjson").write_text("\n".join(json.dumps(statement) for statement in statements))
+    df = pd.concat(StatementReader.read_statements(str(tmp_path / "statements.ndjson"), 10))
+    assert df["Name"].tolist() == ["uuid-1", "Bob"]
+    assert df["Verb"].tolist() == ["answered", "answered"]
@@ -0,0 +1,143 @@
+import argparse
+import json
+import multiprocessing
+import sys
+import traceback
+import jsonschema
+import GlobalData
+import DataCache
+import IncrementalState
+import ResultCache
+import Reporter
+import Profiler
+import TimeWindow
+from Main import use_json, use_id_list, select_days, generate_timestamp
+
+
+def parse_args(argv):
+    """
+    Parses the command-line arguments.
+
+    :param argv: list of arguments (not including the program name)
+    :return: an argparse Namespace
+    """
+    parser = argparse.ArgumentParser(
+        description="Headless batch mode for the UW-Madison xAPI Data Analyzer. Produces the same output folder as the "
+                    "GUI without opening any windows.")
+    parser.add_argument("data_csv", nargs="+",
+                        help="the non-cleaned xAPI data .csv file from the DoIT Learning Locker, or a "
+                             ".json/.jsonl/.ndjson file of raw xAPI statements. Several files (or glob patterns) are "
+                             "read in parallel and merged, keeping statements that are in more than one of them only "
+                             "once")
+    parser.add_argument("day_element_json", help="the DayElement.json file")
+    method = parser.add_mutually_exclusive_group(required=True)
+    method.add_argument("--days", help="comma-separated list of Day numbers to analyze, or \"all\"")
+    method.add_argument("--ids", help="comma-separated list of H5P IDs to analyze")
+    parser.add_argument("--output-dir", default=".",
+                        help="directory to create the 'xAPI-Data-Analyzer_$TIMESTAMP/' folder in (default: current "
+                             "directory)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only read statements newer than the last incremental run (only works with --days)")
+    parser.add_argument("--verify", action="store_true",
+                        help="with --incremental, check the results against a full recompute")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes writing per-Day files and graphs (0 writes them in the main "
+                             "process)")
+    parser.add_argument("--profile", action="append", choices=Profiler.CAPTURE_MODES, default=[],
+                        help="also save a cProfile or tracemalloc capture of the run next to RunProfile.json (can be "
+                             "given twice to capture both, slows the run down)")
+    parser.add_argument("--sweep", action="store_true",
+                        help="also save the total durations for every Time_Delta from 1 to 60 minutes "
+                             "(TimeDeltaSweep.csv and time_delta_sweep.png, not with --incremental)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="add more element metrics to the element csvs: verb counts, first and last interaction, "
+                             "median time from first to last statement and distinct responses (not with --incremental)")
+    parser.add_argument("--consolidated", action="store_true",
+                        help="with --days, write all Days into Elements.parquet, StudentDurations.parquet, "
+                             "TotalDurations.parquet and Graphs.pdf instead of a folder per Day (needs pyarrow)")
+    parser.add_argument("--weekly", action="store_true",
+                        help="also save every student's engaged time in each week (WeeklyEngagement.csv and "
+                             "weekly_engagement.png, not with --incremental)")
+    parser.add_argument("--start",
+                        help="only analyze statements from this date (YYYY-MM-DD) or time (YYYY-MM-DDTHH:MM) on, in "
+                             "Central Time unless it has a UTC offset")
+    parser.add_argument("--end",
+                        help="only analyze statements before this time, or through this date if only a date is given")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't read or write the cleaned data cache or the result cache")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="clear the cleaned data cache, result cache and incremental state before running")
+    args = parser.parse_args(argv)
+    if args.incremental and args.days is None:
+        parser.error("--incremental only works with --days")
+    if args.consolidated and args.days is None:
+        parser.error("--consolidated only works with --days")
+    try:
+        args.start, args.end = TimeWindow.parse_window(args.start, args.end)
+    except ValueError as e:
+        parser.error("invalid --start/--end: " + str(e))
+    return args
+
+
+def main(argv=None):
+    """
+    Runs an analysis from the command line.
+
+    :param argv: list of arguments (defaults to ``sys.argv[1:]``)
+    :return: the exit code
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.clear_cache:
+        DataCache.clear()
+        ResultCache.clear()
+        IncrementalState.clear()
+
+    # Load in the data and JSON files
+    Profiler.start(args.profile)
+    try:
+        GlobalData.set_data_vars(args.data_csv, args.day_element_json, use_cache=not args.no_cache,
+                                 incremental=args.incremental, responses=args.metrics)
+    except FileNotFoundError as e:
+        Reporter.popup("ERROR: A provided file was not found: " + str(e.filename), title="Error")
+        return 1
+    except json.JSONDecodeError:
+        Reporter.popup("ERROR: The provided JSON file could not be read. Please ensure its formatting is correct.",
+                       title="Error")
+        return 1
+    except jsonschema.exceptions.ValidationError as e:
+        message = str(e.message).replace("^Day_\\\\d{1,2}$", "Day_XX")
+        Reporter.popup("ERROR: The DayElement.json file is invalid, please check the Schema to ensure validity. \n"
+                       + message, title="Error")
+        return 1
+
+    timestamp = generate_timestamp()
+    if args.days is not None:
+        try:
+            day_dict_list = select_days(args.days)
+        except ValueError:
+            Reporter.popup("ERROR: The items entered in the Days list were not valid integers!", title="Error")
+            return 1
+        use_json(timestamp, day_dict_list, args.data_csv if args.verify else None, args.output_dir, args.workers,
+                 args.sweep, args.metrics, args.consolidated, args.weekly, args.start, args.end)
+    else:
+        try:
+            id_list = [int(item.strip()) for item in args.ids.split(",")]
+        except ValueError:
+            Reporter.popup("ERROR: The items entered in the H5P ID list were not valid integers!", title="Error")
+            return 1
+        use_id_list(id_list, timestamp, args.output_dir, args.sweep, args.metrics, args.weekly, args.start, args.end)
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    try:
+        sys.exit(main())
+    except Exception:
+        Reporter.popup("An unexpected error occurred that caused the program to crash. An error log text file was "
+                       "created in the current directory called 'xAPI-Data-Analyzer-ERROR-LOG.txt'.",
+                       title="Fatal Error")
+        with open("xAPI-Data-Analyzer-ERROR-LOG.txt", "a") as error_file:
+            traceback.print_exc(file=error_file)
+        sys.exit(1)
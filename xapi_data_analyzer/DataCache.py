@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import pandas as pd
+
+# pyarrow is optional: without it, the cache is simply never used
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+
+# Where cached datasets are stored, and the max number of bytes the cache may take up before old entries are evicted
+CACHE_DIR = Path.home() / ".xapi-data-analyzer" / "cache"
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+# Bump this whenever the cleaned raw_data format changes so old cache entries are no longer used
+CACHE_VERSION = 6
+
+# Keys already worked out in this process, by (path, size, modification time), so a file is only hashed once
+_fingerprints = {}
+
+
+def is_available():
+    """
+    :return: True if the libraries needed for caching are installed
+    """
+    return feather is not None
+
+
+def fingerprint(data_path):
+    """
+    Creates a key identifying the given data file, based on its path, size, modification time and a hash of its
+    contents.
+
+    :param data_path: path to the raw data csv
+    :return: a hex string key for the file
+    """
+    data_path = os.path.abspath(data_path)
+    stat = os.stat(data_path)
+    file_id = (data_path, stat.st_size, stat.st_mtime_ns)
+    if file_id in _fingerprints:
+        return _fingerprints[file_id]
+
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(data_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            content_hash.update(block)
+
+    key = "|".join([str(CACHE_VERSION), data_path, str(stat.st_size), str(stat.st_mtime_ns), content_hash.hexdigest()])
+    _fingerprints[file_id] = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return _fingerprints[file_id]
+
+
+def load(key):
+    """
+    Loads the cleaned dataset for the given data file from the cache, if it's there.
+
+    :param key: the data file's key from ``fingerprint``
+    :return: a tuple of (raw_data, dataframe of (uuid, email) pairs, rows dropped for timestamp, rows dropped for NaN
+        name), or None if the file isn't cached
+    """
+    if not is_available():
+        return None
+
+    data_file = CACHE_DIR / (key + ".feather")
+    info_file = CACHE_DIR / (key + ".json")
+    if not (data_file.exists() and info_file.exists()):
+        return None
+
+    # Categorical columns are stored dictionary-encoded, and come back as categoricals
+    raw_data = feather.read_table(data_file, memory_map=True).to_pandas()
+    with open(info_file) as f:
+        info = json.load(f)
+
+    # Mark the entry as recently used so it's the last to be evicted
+    os.utime(data_file)
+    os.utime(info_file)
+
+    email_pairs = pd.DataFrame(info["email_pairs"], columns=["Name", "Email"], dtype=object)
+    return raw_data, email_pairs, info["rows_dropped_timestamp"], info["rows_dropped_name_nan"]
+
+
+def save(key, data_path, raw_data, email_pairs, rows_dropped_timestamp, rows_dropped_name_nan):
+    """
+    Saves the cleaned dataset for the given data file to the cache, then evicts the least recently used entries if the
+    cache has grown past ``MAX_CACHE_BYTES``. Failing to write the cache never stops the analysis.
+
+    :param key: the data file's key from ``fingerprint``
+    :param data_path: path to the raw data csv
+    :param raw_data: the cleaned and sorted raw data dataframe (with a RangeIndex)
+    :param email_pairs: dataframe of the (uuid, email) pairs found in the data file
+    :param rows_dropped_timestamp: number of rows dropped for a bad timestamp
+    :param rows_dropped_name_nan: number of rows dropped for a missing UUID
+    """
+    if not is_available():
+        return
+
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        feather.write_feather(raw_data, CACHE_DIR / (key + ".feather"))
+        with open(CACHE_DIR / (key + ".json"), "w") as f:
+            json.dump({"data_path": os.path.abspath(data_path),
+                       "email_pairs": email_pairs[["Name", "Email"]].values.tolist(),
+                       "rows_dropped_timestamp": rows_dropped_timestamp,
+                       "rows_dropped_name_nan": rows_dropped_name_nan}, f)
+        evict()
+    except (OSError, ValueError, TypeError):
+        # e.g. a full disk, or a column pyarrow can't store
+        pass
+
+
+def evict(max_bytes=None):
+    """
+    Deletes the least recently used cache entries until the cache takes up at most ``max_bytes``.
+
+    :param max_bytes: the max size of the cache in bytes, defaults to ``MAX_CACHE_BYTES``
+    """
+    if max_bytes is None:
+        max_bytes = MAX_CACHE_BYTES
+    if not CACHE_DIR.exists():
+        return
+
+    # Group each entry's files together by key
+    entries = {}
+    for file in CACHE_DIR.iterdir():
+        stat = file.stat()
+        size, last_used = entries.get(file.stem, (0, 0))
+        entries[file.stem] = (size + stat.st_size, max(last_used, stat.st_mtime))
+
+    total_bytes = sum(size for size, _ in entries.values())
+    for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+        if total_bytes <= max_bytes:
+            break
+        for file in CACHE_DIR.glob(key + ".*"):
+            file.unlink()
+        total_bytes -= size
+
+
+def clear():
+    """
+    Invalidates the whole cache by deleting every cached dataset.
+    """
+    evict(max_bytes=0)
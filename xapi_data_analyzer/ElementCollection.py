@@ -1,6 +1,15 @@
 import pandas as pd
+import numpy as np
 import collections
-import datetime
+import Profiler
+import TimeWindow
+from ElementMetrics import element_metrics, EXTENDED_COLUMNS
+from GapIndex import GapIndex
+from InteractionMatrix import InteractionMatrix
+
+
+# The Time_Deltas (in minutes) the Time_Delta sweep reports engaged time for
+SWEEP_DELTAS = list(range(1, 61))
 
 
 class ElementCollection:
@@ -13,16 +22,22 @@ class ElementCollection:
     - The time spent on the element
     """
 
-    def __init__(self, id_list, data, class_list, uuid_email_dict):
+    def __init__(self, id_list, data, identity, interaction_matrix=None, rows=None):
         self.id_list = id_list
-        self.data = data[data["object id"].isin(self.id_list)]  # Now data can be trimmed
-        self.class_list = class_list
-        self.class_size = len(class_list)
-        self.uuid_email_dict = uuid_email_dict
+        # Rather than copying out the rows for these elements, keep the (shared) data and the positions of those rows.
+        # ``rows`` can be passed in when they're already known.
+        self.data = data
+        self.rows = np.flatnonzero(data["object id"].isin(self.id_list).to_numpy()) if rows is None else rows
+        self.identity = identity  # IdentityIndex resolving uuids to people
+        self.class_size = identity.num_people
+        # Shared InteractionMatrix over all the data, if one was already built (otherwise one is built from self.rows)
+        self.interaction_matrix = interaction_matrix
 
         # Below are vars that are expensive time-wise to calculate, so we make em instance vars and calculate only once
         self.question_name_dict = None
         self.interacted_dict = None
+        self.gap_index = None
+        self.metrics = None
 
     def set_expensive_instance_vars(self):
         """
@@ -33,94 +48,386 @@ class ElementCollection:
 
         For question_name_dict: If "Question/Slide" for a row is populated, it adds it to a dictionary.
         For interacted_dict: Adds a user to a dictionary if they interacted with an element (defined by certain verbs
-        in xAPI).
+        in xAPI). The users come straight out of the InteractionMatrix.
+        """
+        with Profiler.stage("element_users", rows=len(self.rows)):
+            if self.interaction_matrix is None:
+                self.interaction_matrix = InteractionMatrix(self.data, self.identity, self.rows)
+
+            # The last populated name in the data wins
+            question_names = element_names(self.data, self.rows)
+            interacted_users = {k: self.interaction_matrix.users(k) for k in self.id_list}
+
+            self.set_precomputed_instance_vars(question_names, interacted_users)
+
+    def set_precomputed_instance_vars(self, question_names, interacted_users):
+        """
+        Alternative to set_expensive_instance_vars for when the element names and interacted users were already found
+        for many elements at once (see ``analyze_days``).
+
+        :param question_names: a dict mapping H5P IDs to their element name (IDs without a name can be left out)
+        :param interacted_users: a dict mapping H5P IDs to a list of the people who interacted, in order of first
+            appearance
         """
         question_name_dict = dict.fromkeys(self.id_list)
         interacted_dict = {k: [] for k in self.id_list}
+        for key in question_name_dict:
+            if key in question_names:
+                question_name_dict[key] = question_names[key]
+            if key in interacted_users:
+                interacted_dict[key] = list(interacted_users[key])
 
-        for row in zip(self.data["Name"], self.data["object id"], self.data["Question/Slide"]):
-            # Question name dict stuff
-            if pd.notna(row[2]):
-                question_name_dict[row[1]] = row[2]
-            # Interacted dict stuff
-            if not (row[0] in interacted_dict[row[1]]):
-                interacted_dict[row[1]].append(row[0])
+        self.question_name_dict = collections.OrderedDict(sorted(question_name_dict.items()))
+        self.interacted_dict = interacted_dict
 
-        question_name_dict = collections.OrderedDict(sorted(question_name_dict.items()))
+    def get_num_interacted(self):
+        """
+        Counts the users who interacted with each H5P element. The counts come straight out of the InteractionMatrix
+        the users were found with; only when there isn't one (in incremental mode) are the interacted lists counted.
 
-        self.question_name_dict = question_name_dict
-        self.interacted_dict = interacted_dict
+        :return: int array of the number of users who interacted with each element of ``id_list``
+        """
+        if self.interaction_matrix is not None:
+            return self.interaction_matrix.num_users(self.id_list)
+        return np.array([len(self.interacted_dict[key]) for key in self.id_list], dtype="int64")
 
     def get_percent_interacted(self):
         """
-        Iterates over the dictionary returned by get_interacted_dict to calculate the percent of users who interacted
-        with each H5P element.
+        Calculates the percent of users who interacted with each H5P element.
 
         :param: none
         :return: a dict with keys = H5P ID and values = % of users who interacted
         """
-        percent_interacted_dict = dict.fromkeys(self.id_list)
-        interacted_dict = self.interacted_dict
-        for key in interacted_dict:
-            num_interacted = len(interacted_dict[key])
-            percent_interacted_dict[key] = num_interacted / self.class_size * 100
-
-        return percent_interacted_dict
+        return dict(zip(self.id_list, self.get_num_interacted() / self.class_size * 100))
 
     def get_students_duration(self, delta_max):
         """
         Calculates each student's time spent on the range of H5P IDs.
 
+        Statements from all of a person's uuids are merged into one timeline. The gaps are indexed once (see
+        ``get_gap_index``), so calling this again with another Time_Delta doesn't go back over the data.
+
         :param: delta_max
         :return: a dictionary mapping students to their duration
         """
-        durations = {}
-        delta_max = datetime.timedelta(minutes=delta_max)
+        with Profiler.stage("student_durations", rows=len(self.rows)):
+            gap_index = self.get_gap_index(delta_max)
+            return durations_by_student(gap_index.totals(delta_max), gap_index.counts, self.identity)
 
-        # swap out emails for uuids anywhere we can before creating the dict
-        uuid_and_email_class_list = []
-        for uuid in self.class_list:
-            if uuid in self.uuid_email_dict:
-                uuid_and_email_class_list.append(self.uuid_email_dict[uuid])
-            else:
-                uuid_and_email_class_list.append(uuid)
+    def get_duration_sweep(self, deltas=SWEEP_DELTAS):
+        """
+        Calculates the total time all students spent on the range of H5P IDs under each of ``deltas``.
+
+        :param deltas: a list of Time_Deltas in minutes
+        :return: a Series of the total duration in minutes for each Time_Delta
+        """
+        totals = self.get_gap_index(max(deltas)).sweep(deltas).sum(axis=1)
+        return pd.Series(totals / 1e9 / 60, index=pd.Index(deltas, name="Time_Delta (min)"), name="Total")
 
-        for student, uuid in zip(uuid_and_email_class_list, self.class_list):
-            student_df = self.data[self.data['Name'] == uuid].reset_index()
-            duration = datetime.timedelta()
-            for index in range(0, len(student_df) - 1):
-                delta = student_df.iloc[index]['Timestamp'] - student_df.iloc[index + 1]['Timestamp']
-                if delta < delta_max:
-                    duration += delta
-                durations[student] = duration.total_seconds() / 60
-        return durations
+    def get_gap_index(self, delta_max):
+        """
+        :param delta_max: the largest Time_Delta in minutes that will be asked for
+        :return: a GapIndex over each person's gaps between statements on the range of H5P IDs, built the first time
+            it's needed (or when a larger Time_Delta comes along)
+        """
+        if self.gap_index is None or self.gap_index.max_delta < delta_max:
+            codes = self.identity.codes(self.column("Name"))
+            self.gap_index = GapIndex(codes, self.identity.num_people, timestamps_ns(self.column("Timestamp")),
+                                      max(delta_max, *SWEEP_DELTAS))
+        return self.gap_index
+
+    def column(self, column):
+        """
+        :param column: a column name of the data
+        :return: just that column, for just the rows of these elements
+        """
+        return self.data[column].take(self.rows)
 
-    def get_dataframe(self):
+    def get_element_metrics(self):
+        """
+        :return: the dataframe of ``ElementMetrics.element_metrics`` for the range of H5P IDs, worked out the first time
+            it's needed
+        """
+        if self.metrics is None:
+            with Profiler.stage("element_metrics", rows=len(self.rows)):
+                self.metrics = element_metrics(self.data, self.rows, self.identity,
+                                               timestamps_ns(self.column("Timestamp")))
+        return self.metrics
+
+    def get_dataframe(self, extended=False):
         """
         Puts everything together into a dataframe specific for the range of H5P IDs.
 
-        :param: none
+        :param extended: if True, the ``ElementMetrics.EXTENDED_COLUMNS`` are added after the usual columns (and if the
+            element names and interacted users aren't known yet, they come out of the same scan)
         :return: a complete dataframe containing all we want to know from the raw data regarding specific elements
         """
-        self.set_expensive_instance_vars()
+        if self.interacted_dict is None:
+            if extended:
+                metrics = self.get_element_metrics()
+                self.set_precomputed_instance_vars(metrics["Element Name"].dropna().to_dict(),
+                                                   metrics["List of users who interacted"].to_dict())
+            else:
+                self.set_expensive_instance_vars()
 
         df = pd.DataFrame(index=self.id_list)
         df["object id"] = self.id_list
         df["Element Name"] = self.question_name_dict.values()
         interacted_dict_values = self.interacted_dict.values()
 
-        # replace all uuids with names, if we're able to
-        users_who_interacted = []  # This is a 2-D list
-        for list_of_uuids in interacted_dict_values:
-            users_for_this_element = []
-            for uuid in list_of_uuids:
-                if uuid in self.uuid_email_dict:
-                    users_for_this_element.append(self.uuid_email_dict[uuid])
-                else:
-                    users_for_this_element.append(uuid)
-            users_who_interacted.append(users_for_this_element)
-
-        df["List of users who interacted"] = users_who_interacted
-        df["Number of users who interacted"] = [len(val) for val in interacted_dict_values]
+        # uuids were already resolved to names by the IdentityIndex
+        df["List of users who interacted"] = list(interacted_dict_values)
+        df["Number of users who interacted"] = self.get_num_interacted()
         df["% of users who interacted"] = self.get_percent_interacted().values()
+        if extended:
+            metrics = self.get_element_metrics().reindex(self.id_list)
+            for column in EXTENDED_COLUMNS:
+                # Elements without any statements have no times, and counts of 0
+                df[column] = metrics[column].fillna(0).astype("int64") if column.startswith("Number of") \
+                    else metrics[column]
         return df
+
+
+def analyze_days(day_dict_list, data, identity, delta_max, interaction_matrix=None):
+    """
+    Analyzes many Days at once. Instead of building a fresh ElementCollection over all of ``data`` for every Day, each
+    row is tagged with its Day(s) through a single element id -> Day index, and element names, interacted users and
+    student durations are then found for every Day in one grouped pass.
+
+    :param day_dict_list: a list of the day dictionary objects (from JSON file) that we're analyzing
+    :param data: the raw data dataframe, sorted by descending timestamp
+    :param identity: IdentityIndex resolving the uuids in ``data`` to people
+    :param delta_max: the Time_Delta in minutes
+    :param interaction_matrix: an InteractionMatrix over ``data``, if one was already built
+    :return: a list of (day dict, ElementCollection, student durations dict) tuples, one per Day that has data, in the
+        order of ``day_dict_list``
+    """
+    day_dict_list = list(day_dict_list)
+    day_windows = [TimeWindow.bounds(day) for day in day_dict_list]
+    with Profiler.stage("tag_days", rows=len(data)):
+        tagged_rows, tagged_days = window_days(*tag_days(data["object id"], day_dict_list), day_windows, data)
+
+    # Element names and interacted users don't depend on the Day, so find them once per element
+    with Profiler.stage("element_users", rows=len(tagged_rows)):
+        element_rows = np.unique(tagged_rows)
+        if interaction_matrix is None:
+            interaction_matrix = InteractionMatrix(data, identity, element_rows)
+        question_names = element_names(data, element_rows)
+        interacted_users = {element_id: interaction_matrix.users(element_id)
+                            for day in day_dict_list for element_id in day["Elements"]}
+
+    # Student durations for every (Day, person) pair in one pass
+    with Profiler.stage("student_durations", rows=len(tagged_rows)):
+        person_codes = identity.codes(data["Name"])
+        num_people = identity.num_people
+        totals, counts = sum_engaged_gaps(tagged_days * num_people + person_codes[tagged_rows],
+                                          len(day_dict_list) * num_people,
+                                          timestamps_ns(data["Timestamp"])[tagged_rows], delta_max)
+        totals = totals.reshape(len(day_dict_list), num_people)
+        counts = counts.reshape(len(day_dict_list), num_people)
+
+    results = []
+    days_with_data = np.unique(tagged_days)
+    for day_pos in days_with_data:
+        day = day_dict_list[day_pos]
+        day_rows = tagged_rows[tagged_days == day_pos]
+        day_matrix, day_users = interaction_matrix, interacted_users
+        if day_windows[day_pos] != (None, None):
+            # Only the statements in the Day's window count towards who interacted
+            day_matrix = InteractionMatrix(data, identity, day_rows)
+            day_users = {element_id: day_matrix.users(element_id) for element_id in day["Elements"]}
+        element_collection = ElementCollection(day["Elements"], data, identity, day_matrix, day_rows)
+        element_collection.set_precomputed_instance_vars(question_names, day_users)
+        students_dict = durations_by_student(totals[day_pos], counts[day_pos], identity)
+
+        results.append((day, element_collection, students_dict))
+    return results
+
+
+def sweep_days(day_dict_list, data, identity, deltas=SWEEP_DELTAS):
+    """
+    Finds how the total time spent on each Day depends on the Time_Delta. Every (Day, person) pair's gaps go into one
+    GapIndex, after which each Time_Delta only takes a binary search per pair.
+
+    :param day_dict_list: a list of the day dictionary objects (from JSON file) that we're analyzing
+    :param data: the raw data dataframe, sorted by descending timestamp
+    :param identity: IdentityIndex resolving the uuids in ``data`` to people
+    :param deltas: a list of Time_Deltas in minutes
+    :return: a dataframe of the total duration in minutes of every student on each Day (columns, only Days with data)
+        under each Time_Delta (rows)
+    """
+    day_dict_list = list(day_dict_list)
+    with Profiler.stage("tag_days", rows=len(data)):
+        tagged_rows, tagged_days = window_days(*tag_days(data["object id"], day_dict_list),
+                                               [TimeWindow.bounds(day) for day in day_dict_list], data)
+
+    with Profiler.stage("time_delta_sweep", rows=len(tagged_rows)):
+        num_people = identity.num_people
+        gap_index = GapIndex(tagged_days * num_people + identity.codes(data["Name"])[tagged_rows],
+                             len(day_dict_list) * num_people, timestamps_ns(data["Timestamp"])[tagged_rows],
+                             max(deltas))
+        totals = gap_index.sweep(deltas).reshape(len(deltas), len(day_dict_list), num_people).sum(axis=2)
+
+    days_with_data = np.unique(tagged_days)
+    return pd.DataFrame(totals[:, days_with_data] / 1e9 / 60, index=pd.Index(deltas, name="Time_Delta (min)"),
+                        columns=["Day" + str(day_dict_list[day_pos]["DayNumber"]) for day_pos in days_with_data])
+
+
+def weekly_days(day_dict_list, data, identity, delta_max, start=None):
+    """
+    Finds every student's engaged time in each week on the elements of the given Days (only the statements in each
+    Day's window count). An element in more than one Day is counted once.
+
+    :param day_dict_list: a list of the day dictionary objects (from JSON file) that we're analyzing
+    :param data: the raw data dataframe, sorted by descending timestamp
+    :param identity: IdentityIndex resolving the uuids in ``data`` to people
+    :param delta_max: the Time_Delta in minutes
+    :param start: UTC Timestamp the first week starts at (see ``TimeWindow.week_edges``)
+    :return: the dataframe of ``weekly_durations``
+    """
+    day_dict_list = list(day_dict_list)
+    with Profiler.stage("tag_days", rows=len(data)):
+        tagged_rows, _ = window_days(*tag_days(data["object id"], day_dict_list),
+                                     [TimeWindow.bounds(day) for day in day_dict_list], data)
+    return weekly_durations(data, np.unique(tagged_rows), identity, delta_max, start)
+
+
+def weekly_durations(data, rows, identity, delta_max, start=None):
+    """
+    Finds every student's engaged time in each week. The week boundaries are found with a binary search on the sorted
+    timestamps, which splits ``rows`` into one run per week, and then every (week, person) pair is summed up in one
+    pass. Gaps that span two weeks aren't counted.
+
+    :param data: the raw data dataframe, sorted by descending timestamp
+    :param rows: positions of the rows of ``data`` to look at, in ascending order
+    :param identity: IdentityIndex resolving the uuids in ``data`` to people
+    :param delta_max: the Time_Delta in minutes
+    :param start: UTC Timestamp the first week starts at (see ``TimeWindow.week_edges``)
+    :return: a dataframe of durations in minutes, with one row per person and one column per week from the earliest to
+        the latest statement (only students with at least two statements in a week get a duration that week)
+    """
+    with Profiler.stage("weekly_engagement", rows=len(rows)):
+        timestamps = timestamps_ns(data["Timestamp"])
+        if len(rows) == 0:
+            return pd.DataFrame(index=list(identity.names))
+        edges = TimeWindow.week_edges(pd.Timestamp(timestamps[rows[-1]], tz="UTC"),
+                                      pd.Timestamp(timestamps[rows[0]], tz="UTC"), start)
+        num_weeks = len(edges) - 1
+
+        # Rows from each week's start on, then how many of ``rows`` that is. Latest first, so the last week comes first.
+        edge_rows = [TimeWindow.window_slice(timestamps, start=edge).stop for edge in edges]
+        ends = np.searchsorted(rows, edge_rows)
+        rows = rows[ends[-1]:ends[0]]
+        week_codes = np.repeat(np.arange(num_weeks - 1, -1, -1), (ends[:-1] - ends[1:])[::-1])
+
+        num_people = identity.num_people
+        totals, counts = sum_engaged_gaps(week_codes * num_people + identity.codes(data["Name"])[rows],
+                                          num_weeks * num_people, timestamps[rows], delta_max)
+        minutes = np.where(counts > 1, totals / 1e9 / 60, np.nan).reshape(num_weeks, num_people)
+    return pd.DataFrame(minutes.T, index=list(identity.names),
+                        columns=["Week of " + edge.strftime("%Y-%m-%d") for edge in edges[:-1]])
+
+
+def window_days(rows, days, day_windows, data):
+    """
+    Drops the tagged rows outside of their Day's window. Each window is one run of rows (see
+    ``TimeWindow.window_slice``), so this only takes two binary searches per Day on top of a pass over the tagged rows.
+
+    :param rows: row positions from ``tag_days``
+    :param days: Day positions from ``tag_days``
+    :param day_windows: a (start, end) tuple for every Day (see ``TimeWindow.bounds``)
+    :param data: the raw data dataframe, sorted by descending timestamp
+    :return: a tuple of (row positions, Day positions) of the rows in their Day's window, in row order
+    """
+    if all(window == (None, None) for window in day_windows):
+        return rows, days
+    timestamps = timestamps_ns(data["Timestamp"])
+    slices = [TimeWindow.window_slice(timestamps, start, end) for start, end in day_windows]
+    firsts = np.array([window.start for window in slices], dtype="int64")
+    stops = np.array([window.stop for window in slices], dtype="int64")
+    in_window = (rows >= firsts[days]) & (rows < stops[days])
+    return rows[in_window], days[in_window]
+
+
+def element_names(data, rows):
+    """
+    Finds the name of each element from the "Question/Slide" column. The last populated name in the data wins.
+
+    :param data: the raw data dataframe, sorted by descending timestamp
+    :param rows: positions of the rows of ``data`` to look at
+    :return: a dict mapping H5P IDs to their element name (IDs without a name are left out)
+    """
+    names = data["Question/Slide"].take(rows)
+    named = names.notna().to_numpy()
+    return names[named].groupby(data["object id"].take(rows)[named].to_numpy(), sort=False).last().to_dict()
+
+
+def tag_days(object_ids, day_dict_list):
+    """
+    Tags every row with each Day it belongs to, using a single element id -> Day index. An element may show up in more
+    than one Day, in which case its rows are tagged once per Day.
+
+    :param object_ids: the "object id" column of the data
+    :param day_dict_list: a list of the day dictionary objects (from JSON file)
+    :return: a tuple of (row positions, Day positions in ``day_dict_list``) as int64 arrays, in row order
+    """
+    day_index = pd.DataFrame([(element_id, day_pos) for day_pos, day in enumerate(day_dict_list)
+                              for element_id in day["Elements"]], columns=["object id", "Day"], dtype="int64")
+    day_index = day_index.drop_duplicates()
+
+    rows = pd.DataFrame({"object id": object_ids.to_numpy(dtype="int64"), "row": np.arange(len(object_ids))})
+    tagged = rows.merge(day_index, on="object id").sort_values(by=["row"], kind="stable")
+    return tagged["row"].to_numpy(), tagged["Day"].to_numpy()
+
+
+def durations_by_student(totals, counts, identity):
+    """
+    Turns per-person engaged time into the student -> duration dict that gets reported. Only students with at least two
+    statements get a duration.
+
+    :param totals: int64 array of engaged nanoseconds for every person code
+    :param counts: int64 array of the number of statements for every person code
+    :param identity: the IdentityIndex the person codes come from
+    :return: a dictionary mapping students to their duration in minutes, in person code order
+    """
+    has_duration = counts > 1
+    return dict(zip(identity.names[has_duration], totals[has_duration] / 1e9 / 60))
+
+
+def timestamps_ns(timestamps):
+    """
+    Converts a Timestamp column into an int64 numpy array of nanoseconds since the epoch.
+
+    :param timestamps: a Series of datetime objects (timezone-aware or not)
+    :return: an int64 numpy array
+    """
+    return np.asarray(timestamps.values).astype("datetime64[ns]", copy=False).view("int64")
+
+
+def sum_engaged_gaps(codes, num_groups, timestamps, delta_max):
+    """
+    Sums up the gaps between consecutive statements within each group, ignoring any gap of ``delta_max`` minutes or
+    more. Rows are expected to already be in (descending) timestamp order, which is how ``GlobalData.raw_data`` is
+    sorted.
+
+    :param codes: integer group code for every row (e.g. from ``pd.factorize``)
+    :param num_groups: the number of distinct group codes
+    :param timestamps: int64 nanosecond timestamps for every row (see ``timestamps_ns``)
+    :param delta_max: the max gap in minutes that still counts as engaged time
+    :return: a tuple of (int64 array of summed nanoseconds per group, int64 array of row counts per group)
+    """
+    codes = np.asarray(codes, dtype="int64")
+    delta_max_ns = pd.Timedelta(minutes=delta_max).value
+
+    # A stable sort keeps each group's rows in their original timestamp order
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    sorted_timestamps = timestamps[order]
+
+    gaps = sorted_timestamps[:-1] - sorted_timestamps[1:]
+    engaged = (sorted_codes[:-1] == sorted_codes[1:]) & (gaps < delta_max_ns)
+
+    totals = np.zeros(num_groups, dtype="int64")
+    np.add.at(totals, sorted_codes[:-1][engaged], gaps[engaged])
+    counts = np.bincount(codes, minlength=num_groups)
+    return totals, counts
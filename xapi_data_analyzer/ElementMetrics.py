@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+# The verbs whose statements are counted for every element, each getting a "Number of <verb> statements" column
+METRIC_VERBS = ["answered", "interacted", "completed"]
+# The columns ``element_metrics`` finds on top of the ones ``ElementCollection.get_dataframe`` always has
+EXTENDED_COLUMNS = (["Number of " + verb + " statements" for verb in METRIC_VERBS]
+                    + ["First interaction", "Last interaction", "Median minutes from first to last statement",
+                       "Number of distinct responses"])
+
+
+def element_metrics(data, rows, identity, timestamps):
+    """
+    Works out everything reported about each element in one grouped scan over its rows. Elements, people, verbs,
+    element names and responses all go by integer codes, and the rows are sorted once by (element, person) code, after
+    which every metric is a vectorized reduction over the sorted runs:
+
+    * "Element Name": the last populated "Question/Slide" in the data
+    * "List of users who interacted": the people with a statement on the element, in order of first appearance
+    * "Number of users who interacted"
+    * the ``EXTENDED_COLUMNS``: statement counts for each of ``METRIC_VERBS``, the times of the earliest and latest
+      statements, the median over people of the time between their earliest and latest statements (0 for people with
+      just one), and the number of distinct responses
+
+    :param data: the raw data dataframe, sorted by descending timestamp
+    :param rows: positions of the rows of ``data`` to look at, in order
+    :param identity: IdentityIndex resolving the uuids in ``data`` to people
+    :param timestamps: int64 nanosecond timestamps of those rows (see ``ElementCollection.timestamps_ns``)
+    :return: a dataframe of the metrics, indexed by H5P ID (only elements with at least one row), in order of first
+        appearance in the data
+    """
+    element_codes, element_ids = pd.factorize(data["object id"].take(rows).to_numpy())
+    df = pd.DataFrame(index=pd.Index(element_ids))
+    num_elements = len(element_ids)
+    if num_elements == 0:
+        return df.reindex(columns=["Element Name", "List of users who interacted", "Number of users who interacted"]
+                          + EXTENDED_COLUMNS)
+    element_codes = element_codes.astype("int64")
+    num_people = max(identity.num_people, 1)
+
+    # The scan: one stable sort by (element, person), so each (element, person) cell's rows stay in data order, i.e.
+    # from latest to earliest
+    cell_keys = element_codes * num_people + identity.codes(data["Name"].take(rows))
+    order = np.argsort(cell_keys, kind="stable")
+    sorted_keys = cell_keys[order]
+    cell_starts = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+    cell_elements = sorted_keys[cell_starts] // num_people
+    cell_people = sorted_keys[cell_starts] % num_people
+    latest = timestamps[order[cell_starts]]
+    earliest = timestamps[order[np.append(cell_starts[1:], len(order)) - 1]]
+    element_starts = np.searchsorted(cell_elements, np.arange(num_elements + 1))
+    num_users = np.diff(element_starts)
+
+    # The last populated name in the data wins
+    names = data["Question/Slide"].take(rows)
+    name_codes = names.cat.codes.to_numpy()
+    named = np.flatnonzero(name_codes >= 0)
+    last_named = np.full(num_elements, -1, dtype="int64")
+    np.maximum.at(last_named, element_codes[named], named)
+    df["Element Name"] = np.full(num_elements, None, dtype=object)
+    df.loc[last_named >= 0, "Element Name"] = names.cat.categories.to_numpy(dtype=object)[
+        name_codes[last_named[last_named >= 0]]]
+
+    # Users in order of first appearance: by element, then by the position of their first row
+    by_appearance = np.lexsort((order[cell_starts], cell_elements))
+    df["List of users who interacted"] = [list(users) for users in np.split(identity.names[cell_people[by_appearance]],
+                                                                              element_starts[1:-1])]
+    df["Number of users who interacted"] = num_users
+
+    verbs = data["Verb"].take(rows)
+    num_verbs = len(verbs.cat.categories)
+    verb_counts = np.bincount(element_codes * num_verbs + verbs.cat.codes.to_numpy(),
+                              minlength=num_elements * num_verbs).reshape(num_elements, num_verbs)
+    for verb in METRIC_VERBS:
+        has_verb = verb in verbs.cat.categories
+        df["Number of " + verb + " statements"] = verb_counts[:, verbs.cat.categories.get_loc(verb)] if has_verb else 0
+
+    # Every element has at least one cell, and its cells are next to each other
+    df["First interaction"] = pd.to_datetime(np.minimum.reduceat(earliest, element_starts[:-1]), utc=True)
+    df["Last interaction"] = pd.to_datetime(np.maximum.reduceat(latest, element_starts[:-1]), utc=True)
+
+    # Median span: by element, then by span, so each element's median is in the middle of its run
+    sorted_spans = (latest - earliest)[np.lexsort((latest - earliest, cell_elements))]
+    middle_low = sorted_spans[element_starts[:-1] + (num_users - 1) // 2]
+    middle_high = sorted_spans[element_starts[:-1] + num_users // 2]
+    df["Median minutes from first to last statement"] = (middle_low + middle_high) / 2 / 1e9 / 60
+
+    response_codes = data["Response"].take(rows).cat.codes.to_numpy().astype("int64")
+    responded = response_codes >= 0
+    num_responses = max(response_codes.max() + 1, 1)
+    distinct_responses = np.unique(element_codes[responded] * num_responses + response_codes[responded])
+    df["Number of distinct responses"] = np.bincount(distinct_responses // num_responses, minlength=num_elements)
+    return df
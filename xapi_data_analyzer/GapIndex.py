@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+
+class GapIndex:
+    """
+    The gaps between consecutive statements of every group (e.g. every (Day, student) pair), kept sorted within each
+    group alongside their running sums. A group's engaged time under any Time_Delta is then the running sum up to the
+    first gap that's too long, which takes one binary search, so durations for many Time_Deltas don't have to go back
+    over the data.
+
+    Gaps are stored as one sorted array of ``group * (cap + 1) + gap`` keys, where ``cap`` is ``max_delta`` in
+    nanoseconds and longer gaps are stored as ``cap`` (they never count anyway). This way a single ``np.searchsorted``
+    finds the cut-off in every group at once.
+    """
+
+    def __init__(self, codes, num_groups, timestamps, max_delta):
+        """
+        :param codes: integer group code for every row
+        :param num_groups: the number of distinct group codes
+        :param timestamps: int64 nanosecond timestamps for every row, in (descending) timestamp order within each group
+        :param max_delta: the largest Time_Delta in minutes that will be asked for
+        """
+        codes = np.asarray(codes, dtype="int64")
+        self.num_groups = num_groups
+        self.max_delta = max_delta
+        self.counts = np.bincount(codes, minlength=num_groups)
+        self._cap = pd.Timedelta(minutes=max_delta).value
+        if num_groups * (self._cap + 1) >= np.iinfo("int64").max:
+            raise ValueError("Too many groups to index gaps of up to " + str(max_delta) + " minutes")
+
+        # A stable sort keeps each group's rows in their original timestamp order
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        sorted_timestamps = timestamps[order]
+        same_group = sorted_codes[:-1] == sorted_codes[1:]
+        gaps = np.minimum(sorted_timestamps[:-1] - sorted_timestamps[1:], self._cap)[same_group]
+
+        self._keys = np.sort(sorted_codes[:-1][same_group] * (self._cap + 1) + gaps)
+        sorted_gaps = self._keys % (self._cap + 1)
+        self._running_sums = np.concatenate([[0], np.cumsum(np.where(sorted_gaps < self._cap, sorted_gaps, 0))])
+        self._group_starts = np.searchsorted(self._keys, np.arange(num_groups, dtype="int64") * (self._cap + 1))
+
+    def totals(self, delta_max):
+        """
+        :param delta_max: the Time_Delta in minutes (at most ``max_delta``)
+        :return: int64 array of the engaged nanoseconds of every group, counting only gaps shorter than ``delta_max``
+        """
+        delta_max_ns = pd.Timedelta(minutes=delta_max).value
+        if delta_max_ns > self._cap:
+            raise ValueError("Time_Delta " + str(delta_max) + " is larger than the indexed " + str(self.max_delta))
+        group_cutoffs = np.arange(self.num_groups, dtype="int64") * (self._cap + 1) + delta_max_ns
+        return self._running_sums[np.searchsorted(self._keys, group_cutoffs)] - self._running_sums[self._group_starts]
+
+    def sweep(self, deltas):
+        """
+        :param deltas: a list of Time_Deltas in minutes
+        :return: int64 array of shape (len(deltas), num_groups) with the engaged nanoseconds of every group under each
+            Time_Delta
+        """
+        return np.array([self.totals(delta) for delta in deltas], dtype="int64").reshape(len(deltas), self.num_groups)
@@ -1,114 +1,490 @@
+import collections
+import glob
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import json
-from jsonschema import validate
+from jsonschema import validate, ValidationError
 from os import path
 import sys
-import PySimpleGUI as sg
+import Reporter
+import Profiler
+import DataCache
+import IncrementalState
+import StatementReader
+import TimeWindow
+from ElementCollection import timestamps_ns
+from InteractionMatrix import InteractionMatrix
+from IdentityIndex import IdentityIndex
 
 
 raw_data = None
-class_list = None
+identity = None
 DayInfo = None
 delta_max = None
-UUID_to_email = None
+incremental_state = None
+interaction_matrix = None
+data_fingerprint = None
 
+# The columns we need from the raw data csv, and how many rows of it to read in at a time
+DATA_COLUMNS = ["Name", "Verb", "object id", "Question/Slide", "Timestamp", "Response"]
+CHUNK_SIZE = 200000
+# The columns raw_data keeps once emails have been found, and the ones among them that are stored as categoricals (each
+# distinct uuid, verb and element name is stored once, and every row just holds a small integer code)
+RAW_DATA_COLUMNS = ["Name", "Verb", "object id", "Question/Slide", "Timestamp"]
+CATEGORY_COLUMNS = ["Name", "Verb", "Question/Slide"]
+# Only the extra element metrics use the responses (see ``ElementMetrics``), so raw_data only keeps this column (as
+# another categorical) when it is loaded with ``responses=True``
+RESPONSE_COLUMN = "Response"
+# The columns a statement's fingerprint is made from, when several files are merged (the "object id" URL as it is in the
+# file, and the timestamp once parsed, so the same statement in a csv and a statements file gets the same fingerprint)
+FINGERPRINT_COLUMNS = ["Name", "Verb", "object id", "Timestamp", "Response"]
+# Max number of worker processes reading data files at once when several are loaded together
+LOAD_WORKERS = min(4, os.cpu_count() or 1)
+# Multiplied by a statement's occurrence number (within its file) and added to its fingerprint to give every occurrence
+# its own key. Any odd number spreads the keys out; this one is 2**64 divided by the golden ratio.
+OCCURRENCE_MULTIPLIER = 0x9E3779B97F4A7C15
 
-def set_data_vars(data_path, json_path):
+
+def set_data_vars(data_path, json_path, use_cache=True, incremental=False, responses=False):
     """
     Sets global data variables to be used in ``ElementCollection.py`` and ``Main.py``, including
 
-    * raw_data: the dataframe read from the raw data's csv
-    * class_list: list of unique emails from raw_data (we assume this is acceptable as a list of everyone in the class)
+    * raw_data: the dataframe read from the raw data's csv, in the compact form described in ``clean_chunk``
+    * identity: an IdentityIndex of the people behind the uuids in the data, with their emails where we found one (we
+      assume this is acceptable as a list of everyone in the class)
     * DayInfo: the JSON data imported into the program, if the user uses a JSON input
+    * incremental_state: the per-Day state kept between runs, if running in incremental mode (otherwise None)
+    * interaction_matrix: an InteractionMatrix of who interacted with which element in raw_data (None in incremental
+      mode, where raw_data only holds the new statements)
+    * data_fingerprint: a key identifying the loaded data, which ``ResultCache`` keys reports by (None if caching is
+      off, or in incremental mode where raw_data doesn't hold all of the data)
 
-    :param data_path: path to the raw_data csv
+    :param data_path: path to the raw_data csv, or several of them to be merged (see ``load_data``)
     :param json_path: path to the JSON file, or -1 if the user isn't using a JSON file to provide H5P IDs
+    :param use_cache: if True, reuse the cleaned data from ``DataCache`` when this exact csv was loaded before
+    :param incremental: if True, only statements newer than the last incremental run are read into raw_data, and are
+        folded into the saved ``IncrementalState``
+    :param responses: if True, raw_data keeps the ``RESPONSE_COLUMN`` the extra element metrics need (not in incremental
+        mode, which doesn't have the extra metrics)
     """
     global raw_data
-    global class_list
+    global identity
     global DayInfo
     global delta_max
-    global UUID_to_email
+    global incremental_state
+    global interaction_matrix
+    global data_fingerprint
+
+    with Profiler.stage("set_data_vars") as stage:
+        # import data in DayElement.json (Error handling done in Main.py)
+        with Profiler.stage("load_day_info"):
+            DayInfo = load_day_info(json_path)
+
+        # Drop data from non-student emails (using the filter emails list)
+        # Commented out Spring 2021 upon switch to UUIDs
+        # raw_data = raw_data[~raw_data["Email"].isin(DayInfo["Filter_Emails"])]
+        # class_list = class_list - set(DayInfo["Filter_Emails"])
+
+        delta_max = DayInfo["Time_Delta"]
+
+        if incremental:
+            incremental_state = IncrementalState.load(DayInfo)
+            raw_data, email_pairs, rows_dropped_timestamp, rows_dropped_name_nan = \
+                load_data(data_path, use_cache=False, newer_than=incremental_state["high_water_mark"])
+            # Emails are found in the whole file, so the identity covers old and new statements alike
+            identity = IdentityIndex(incremental_state["class_list"] | set(raw_data["Name"].unique()), email_pairs)
+            if not IncrementalState.reconcile(incremental_state, identity):
+                # New emails merged people that the state kept apart, so their durations have to be redone from scratch
+                incremental_state = IncrementalState.new_state(DayInfo)
+                raw_data, email_pairs, rows_dropped_timestamp, rows_dropped_name_nan = load_data(data_path, use_cache)
+                identity = IdentityIndex(set(raw_data["Name"].unique()), email_pairs)
+            Reporter.check_cancelled()
+            with Profiler.stage("incremental_fold", rows=len(raw_data)):
+                IncrementalState.fold(incremental_state, raw_data, DayInfo, identity)
+                IncrementalState.save(incremental_state)
+            interaction_matrix = None
+        else:
+            incremental_state = None
+            raw_data, email_pairs, rows_dropped_timestamp, rows_dropped_name_nan = \
+                load_data(data_path, use_cache, responses=responses)
+            Reporter.check_cancelled()
+            with Profiler.stage("identity_index", rows=len(raw_data)):
+                identity = IdentityIndex(set(raw_data["Name"].unique()), email_pairs)
+            with Profiler.stage("interaction_matrix", rows=len(raw_data)):
+                interaction_matrix = InteractionMatrix(raw_data, identity)
+            Reporter.check_cancelled()
+        data_fingerprint = fingerprint_data(data_path) if use_cache and not incremental else None
+        stage["rows"] = len(raw_data)
+        Profiler.note("raw_data_bytes_per_row", bytes_per_row(raw_data))
+
+    # Give notice popup about dropped rows
+    if rows_dropped_timestamp != 0 or rows_dropped_name_nan != 0:
+        Reporter.popup("Some data was dropped because of improper formatting:\nBad timestamp: "
+                       + str(rows_dropped_timestamp) + " entries\nNo UUID associated: " + str(rows_dropped_name_nan)
+                       + " entries", title="Info: Data Dropped")
+
+
+def window_data(start=None, end=None):
+    """
+    Limits raw_data to a date range. The data is sorted by timestamp, so the range is found with a binary search and
+    sliced out without copying anything (see ``TimeWindow.window_slice``).
+
+    :param start: the start of the range as a UTC Timestamp, or None
+    :param end: the (exclusive) end of the range as a UTC Timestamp, or None
+    :return: a tuple of (the statements of raw_data in the range, the InteractionMatrix over them, or None if it has to
+        be built from them)
+    """
+    if start is None and end is None:
+        return raw_data, interaction_matrix
+    with Profiler.stage("window_data", rows=len(raw_data)) as stage:
+        rows = TimeWindow.window_slice(timestamps_ns(raw_data["Timestamp"]), start, end)
+        stage["rows"] = rows.stop - rows.start
+    if rows.start == 0 and rows.stop == len(raw_data):
+        return raw_data, interaction_matrix
+    return raw_data.iloc[rows], None
+
+
+def load_data(data_path, use_cache=True, newer_than=None, workers=None, responses=False):
+    """
+    Reads and cleans the raw data csv (or a file of raw xAPI statements, see ``StatementReader``), without touching any
+    of the global data variables. Several files (e.g. exports of overlapping date ranges) can be given at once, in
+    which case they are read in parallel and merged by ``merge_files``.
+
+    :param data_path: path to the raw_data csv or statements file, a glob pattern matching several of them, or a list of
+        paths
+    :param use_cache: if True, reuse the cleaned data from ``DataCache`` when this exact csv was loaded before
+    :param newer_than: if given, only keep statements with a timestamp (in nanoseconds since the epoch) after this
+    :param workers: max number of worker processes reading files at once, if there are several (defaults to
+        ``LOAD_WORKERS``)
+    :param responses: if True, raw_data keeps the ``RESPONSE_COLUMN``
+    :return: a tuple of (raw_data, dataframe of (uuid, email) pairs found in the whole file, rows dropped for timestamp,
+        rows dropped for NaN name)
+    :raises FileNotFoundError: if a glob pattern doesn't match any files
+    """
+    data_paths = expand_data_paths(data_path)
+    if len(data_paths) == 1:
+        return load_file(data_paths[0], use_cache, newer_than, responses=responses)
+    return merge_files(data_paths, use_cache, newer_than, workers, responses)
+
+
+def fingerprint_data(data_path):
+    """
+    :param data_path: a path, a glob pattern, or a list of paths (see ``load_data``)
+    :return: a hex string key identifying the contents of all the files it stands for
+    """
+    keys = [DataCache.fingerprint(file_path) for file_path in expand_data_paths(data_path)]
+    return hashlib.blake2b("|".join(keys).encode(), digest_size=16).hexdigest()
+
+
+def expand_data_paths(data_path):
+    """
+    :param data_path: a path, a glob pattern, or a list of paths (and/or patterns)
+    :return: the sorted list of distinct paths they stand for
+    :raises FileNotFoundError: if a glob pattern doesn't match any files
+    """
+    data_paths = set()
+    for pattern in ([data_path] if isinstance(data_path, str) else data_path):
+        if glob.has_magic(pattern) and not path.exists(pattern):
+            matches = glob.glob(pattern)
+            if not matches:
+                raise FileNotFoundError(2, "No files match", pattern)
+            data_paths.update(matches)
+        else:
+            data_paths.add(pattern)
+    return sorted(data_paths)
+
+
+def load_file(data_path, use_cache=True, newer_than=None, fingerprint=False, responses=False):
+    """
+    Reads and cleans one raw data csv or statements file (see ``load_data``).
+
+    :param data_path: path to the raw_data csv or statements file
+    :param use_cache: if True, reuse the cleaned data from ``DataCache`` when this exact csv was loaded before
+    :param newer_than: if given, only keep statements with a timestamp (in nanoseconds since the epoch) after this
+    :param fingerprint: if True, raw_data gets an extra "Fingerprint" column (see ``clean_chunk``)
+    :param responses: if True, raw_data keeps the ``RESPONSE_COLUMN``
+    :return: a tuple of (raw_data, dataframe of (uuid, email) pairs found in the whole file, rows dropped for timestamp,
+        rows dropped for NaN name)
+    """
+    with Profiler.stage("cache_load"):
+        cache_key = None
+        if use_cache and DataCache.is_available():
+            cache_key = DataCache.fingerprint(data_path) + ("-fingerprint" if fingerprint else "") + \
+                ("-responses" if responses else "")
+        cached = DataCache.load(cache_key) if cache_key else None
+    if cached is not None:
+        return cached
+
+    # Stream the csv in chunks, only reading the columns we care about, and clean each chunk as it goes by so the whole
+    # uncleaned export never has to sit in memory at once
+    cleaned_chunks = []
+    email_chunks = []
+    rows_dropped_timestamp = 0
+    rows_dropped_name_nan = 0
+    rows_read = 0
+    if StatementReader.is_statement_file(data_path):
+        chunks = Profiler.iterate("read_statements", StatementReader.read_statements(data_path, CHUNK_SIZE))
+    else:
+        # Text columns are read as strings even in a chunk where they happen to be empty (which would otherwise be read
+        # as floats, and couldn't be put together with the other chunks)
+        chunks = Profiler.iterate("read_csv", pd.read_csv(data_path, usecols=DATA_COLUMNS, chunksize=CHUNK_SIZE,
+                                                          dtype={column: str for column in
+                                                                 CATEGORY_COLUMNS + [RESPONSE_COLUMN]}))
+    for chunk in chunks:
+        Reporter.check_cancelled()
+        rows_read += len(chunk)
+        Reporter.status("Read " + str(rows_read) + " rows of " + path.basename(data_path))
+        with Profiler.stage("find_emails", rows=len(chunk)):
+            email_chunks.append(find_emails(chunk))
+        chunk, dropped_timestamp, dropped_name_nan = clean_chunk(chunk, fingerprint, responses)
+        rows_dropped_timestamp += dropped_timestamp
+        rows_dropped_name_nan += dropped_name_nan
+        if newer_than is not None:
+            chunk = chunk[timestamps_ns(chunk["Timestamp"]) > newer_than]
+        if not chunk.empty or not cleaned_chunks:
+            cleaned_chunks.append(chunk)
+    if len(cleaned_chunks) > 1 and cleaned_chunks[0].empty:
+        cleaned_chunks.pop(0)
+    data = concat_chunks(cleaned_chunks)
+    email_pairs = pd.concat(email_chunks).drop_duplicates(ignore_index=True)
+
+    # Sort the timestamp column to ensure times are not out of order. The row labels aren't used anywhere, so they're
+    # replaced with a RangeIndex that takes up no memory.
+    with Profiler.stage("sort", rows=len(data)):
+        data = data.sort_values(by=['Timestamp'], ascending=False, ignore_index=True)
+
+    if cache_key:
+        with Profiler.stage("cache_save", rows=len(data)):
+            DataCache.save(cache_key, data_path, data, email_pairs, rows_dropped_timestamp, rows_dropped_name_nan)
+
+    return data, email_pairs, rows_dropped_timestamp, rows_dropped_name_nan
+
 
-    raw_data = pd.read_csv(data_path)
+def merge_files(data_paths, use_cache=True, newer_than=None, workers=None, responses=False):
+    """
+    Reads several raw data files in parallel and merges them into one raw_data, keeping each statement only once even
+    when the files overlap (e.g. a weekly export and the full-term export it is part of).
+
+    Statements are told apart by their "Fingerprint" (see ``clean_chunk``). A statement showing up n times in one file
+    is kept n times, so every occurrence gets its own key (the fingerprint plus its occurrence number), and a file's
+    rows are only kept if their key wasn't seen in an earlier file. Files are merged one at a time as they are read,
+    so only the keys seen so far and the new rows of each file are kept around, rather than every file in full.
+
+    :param data_paths: list of paths to raw_data csv or statements files
+    :param use_cache: if True, reuse the cleaned data from ``DataCache`` for files that were loaded before
+    :param newer_than: if given, only keep statements with a timestamp (in nanoseconds since the epoch) after this
+    :param workers: max number of worker processes reading files at once (defaults to ``LOAD_WORKERS``)
+    :param responses: if True, raw_data keeps the ``RESPONSE_COLUMN``
+    :return: a tuple of (raw_data, dataframe of (uuid, email) pairs found in any of the files, rows dropped for
+        timestamp, rows dropped for NaN name), the dropped rows being summed over the files
+    """
+    if workers is None:
+        workers = LOAD_WORKERS
+    workers = min(workers, len(data_paths))
+    # Spawned workers only get the arguments they're given, rather than a forked copy of the GUI process
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) \
+        if workers > 1 else None
+
+    parts = []
+    email_chunks = []
+    rows_dropped_timestamp = 0
+    rows_dropped_name_nan = 0
+    seen = np.empty(0, dtype="uint64")
+    try:
+        # Keep at most one file per worker (plus one) in flight, so files are never read much faster than they're merged
+        pending = collections.deque()
+        next_path = iter(data_paths)
+        for i in range(1, len(data_paths) + 1):
+            while len(pending) < (workers + 1 if executor else 1):
+                data_path = next(next_path, None)
+                if data_path is None:
+                    break
+                pending.append(executor.submit(load_file_worker, data_path, use_cache, newer_than, responses)
+                               if executor else (data_path, use_cache, newer_than, True, responses))
+            # Files are merged in the order they were given, however fast each one is read
+            task = pending.popleft()
+            if executor:
+                (data, email_pairs, dropped_timestamp, dropped_name_nan), stages = task.result()
+                Profiler.merge(stages)
+            else:
+                data, email_pairs, dropped_timestamp, dropped_name_nan = load_file(*task)
+            Reporter.check_cancelled()
+
+            with Profiler.stage("deduplicate", rows=len(data)):
+                keys = data["Fingerprint"].to_numpy()
+                occurrence = data.groupby("Fingerprint", sort=False).cumcount().to_numpy("uint64")
+                keys = keys + occurrence * np.uint64(OCCURRENCE_MULTIPLIER)
+                new_rows = ~np.isin(keys, seen)
+                seen = np.union1d(seen, keys[new_rows])
+                data = data.loc[new_rows, data.columns.drop("Fingerprint")]
+            if not data.empty or not parts:
+                parts.append(data)
+            email_chunks.append(email_pairs)
+            rows_dropped_timestamp += dropped_timestamp
+            rows_dropped_name_nan += dropped_name_nan
+            Reporter.progress("Reading files", i, len(data_paths))
+    except BaseException:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        raise
+    if executor:
+        executor.shutdown()
 
-    # Uncomment below to print the number of bytes the dataframe takes in memory
-    # print("raw data: " + str(raw_data.memory_usage(index=True, deep=True).sum()))
-    UUID_to_email = find_emails(raw_data)
+    if len(parts) > 1 and parts[0].empty:
+        parts.pop(0)
+    data = concat_chunks(parts)
+    email_pairs = pd.concat(email_chunks).drop_duplicates(ignore_index=True)
+    # Each file is already sorted, and a stable sort keeps the rows of each timestamp in the order the files were given
+    with Profiler.stage("sort", rows=len(data)):
+        data = data.sort_values(by=['Timestamp'], ascending=False, ignore_index=True, kind="stable")
+    return data, email_pairs, rows_dropped_timestamp, rows_dropped_name_nan
+
+
+def load_file_worker(data_path, use_cache, newer_than, responses):
+    """
+    Runs ``load_file`` (with fingerprints) in a worker process.
+
+    :return: a tuple of what ``load_file`` returns, and the ``stages`` of the worker's profile, since a worker process
+        can't add to the main process's profile itself
+    """
+    Reporter.set_reporter(Reporter.ConsoleReporter())
+    Profiler.start()
+    return load_file(data_path, use_cache, newer_than, True, responses), Profiler.profile.stages
 
-    # Only keep around columns we care about
-    raw_data = raw_data[["Name", "Verb", "object id", "Question/Slide", "Timestamp", "Duration", "Response"]]
 
-    # Convert the Timestamp column to datetime objects
-    raw_data["Timestamp"] = pd.to_datetime(raw_data["Timestamp"], errors='coerce')
+def load_day_info(json_path):
+    """
+    Reads in the DayElement.json file and validates it against DayElementSchema.json, and checks that the Days' windows
+    are valid dates or times.
+
+    :param json_path: path to the JSON file
+    :return: the JSON data as a dict
+    :raises ValidationError: if the JSON data doesn't match the schema, or a Day's window isn't valid
+    """
+    with open(json_path) as f:
+        day_info = json.load(f)
+    # Find path to DayElementSchema
+    bundle_dir = getattr(sys, '_MEIPASS', path.abspath(path.dirname(__file__)))
+    validation_path = path.abspath(path.join(bundle_dir, 'DayElementSchema.json'))
+    with open(validation_path) as v:
+        schema = json.load(v)
+        # Perform Validation
+        validate(instance=day_info, schema=schema)
+    for day_name, day in day_info["Days"].items():
+        try:
+            TimeWindow.parse_window(day.get("Start"), day.get("End"))
+        except ValueError as e:
+            raise ValidationError(day_name + " has an invalid Start or End: " + str(e))
+    return day_info
+
+
+def clean_chunk(chunk, fingerprint=False, responses=False):
+    """
+    Cleans up one chunk of the raw data csv: converts timestamps, drops bad rows and "consumed" statements, and parses
+    the H5P ID out of the "object id" URL. Emails must already have been found (see ``find_emails``), since the chunk
+    that comes back is in the compact form kept in raw_data:
+
+    * only the ``RAW_DATA_COLUMNS`` (and the ``RESPONSE_COLUMN`` if asked for)
+    * uuids, verbs, element names and responses as categoricals
+    * H5P IDs as int32
+    * timestamps as datetime64[ns], i.e. int64 nanoseconds since the epoch
+
+    :param chunk: a dataframe holding a chunk of the raw data csv
+    :param fingerprint: if True, a uint64 "Fingerprint" column is added, hashing each statement's
+        ``FINGERPRINT_COLUMNS`` so the same statement can be recognized in another file (see ``merge_files``)
+    :param responses: if True, the ``RESPONSE_COLUMN`` is kept
+    :return: a tuple of (the cleaned chunk, # rows dropped for a bad timestamp, # rows dropped for a missing UUID)
+    """
+    # Convert the Timestamp column to datetime objects. Any ISO 8601 timestamp is accepted, since raw statements don't
+    # all use the same format (or offset) the way the csv export does.
+    with Profiler.stage("to_datetime", rows=len(chunk)):
+        chunk["Timestamp"] = pd.to_datetime(chunk["Timestamp"], errors='coerce', format="ISO8601",
+                                            utc=True).dt.as_unit("ns")
     # Drop all rows where the datetime conversion failed or where email doesn't exist, b/c that means they're bad data
-    rows_count = len(raw_data.index)
-    raw_data = raw_data.dropna(subset=["Timestamp"])
-    rows_dropped_timestamp = rows_count - len(raw_data.index)
+    rows_count = len(chunk.index)
+    chunk = chunk.dropna(subset=["Timestamp"])
+    rows_dropped_timestamp = rows_count - len(chunk.index)
 
     # Drop all columns with an NaN email, b/c that's bad data
-    rows_count = len(raw_data.index)
-    raw_data = raw_data.dropna(subset=["Name"])
-    rows_dropped_name_nan = rows_count - len(raw_data.index)
+    rows_count = len(chunk.index)
+    chunk = chunk.dropna(subset=["Name"])
+    rows_dropped_name_nan = rows_count - len(chunk.index)
 
     # Drop all columns that don't have a valid email URL, b/c that means they're bad data
     # Commented out Spring 2021 when reverting to using UUIDs
-    # rows_count = len(raw_data.index)
-    # raw_data = raw_data[raw_data["Email"].str.slice(start=0, stop=7).str.fullmatch("mailto:", case=False)]
-    # rows_dropped_bad_email = rows_count - len(raw_data.index)
+    # rows_count = len(chunk.index)
+    # chunk = chunk[chunk["Email"].str.slice(start=0, stop=7).str.fullmatch("mailto:", case=False)]
+    # rows_dropped_bad_email = rows_count - len(chunk.index)
 
     # Reformat email column to remove the "mailto:"
-    # raw_data["Email"] = raw_data["Email"].str.slice(start=7)
-
-    # Give notice popup about dropped rows
-    if rows_dropped_timestamp != 0 or rows_dropped_name_nan != 0:
-        sg.Popup("Some data was dropped because of improper formatting:\nBad timestamp: " + str(rows_dropped_timestamp)
-                 + " entries\nNo UUID associated: " + str(rows_dropped_name_nan) + " entries",
-                 title="Info: Data Dropped")
+    # chunk["Email"] = chunk["Email"].str.slice(start=7)
 
     # Drop all "consumed" verbs b/c they seem to be pretty useless
-    raw_data = raw_data[raw_data["Verb"] != 'consumed']
+    chunk = chunk[chunk["Verb"] != 'consumed'].copy()
+
+    if fingerprint:
+        with Profiler.stage("fingerprint", rows=len(chunk)):
+            chunk["Fingerprint"] = pd.util.hash_pandas_object(chunk[FINGERPRINT_COLUMNS], index=False)
 
     # Parse the actual object ID from the "object id" column
-    url_list = raw_data["object id"].to_list()
-    id_list = [int(s[s.index("id=") + 3: len(s) if s.find("?", s.index("id=")) == -1 else s.find("?", s.index("id="))])
-               for s in url_list]
-    raw_data["object id"] = id_list
+    with Profiler.stage("parse_ids", rows=len(chunk)):
+        url_list = chunk["object id"].to_list()
+        id_list = [int(s[s.index("id=") + 3: len(s) if s.find("?", s.index("id=")) == -1 else
+                         s.find("?", s.index("id="))])
+                   for s in url_list]
+        chunk["object id"] = pd.Series(id_list, index=chunk.index, dtype="int32")
 
-    # Sort the timestamp column to ensure times are not out of order
-    raw_data = raw_data.sort_values(by=['Timestamp'], ascending=False)
+    response_columns = [RESPONSE_COLUMN] if responses else []
+    chunk = chunk[RAW_DATA_COLUMNS + response_columns + (["Fingerprint"] if fingerprint else [])].astype(
+        {column: "category" for column in CATEGORY_COLUMNS + response_columns})
 
-    class_list = set(raw_data["Name"])
+    return chunk, rows_dropped_timestamp, rows_dropped_name_nan
 
-    # import data in DayElement.json (Error handling done in Main.py)
-    with open(json_path) as f:
-        DayInfo = json.load(f)
-        # Find path to DayElementSchema
-        bundle_dir = getattr(sys, '_MEIPASS', path.abspath(path.dirname(__file__)))
-        validation_path = path.abspath(path.join(bundle_dir, 'DayElementSchema.json'))
-        with open(validation_path) as v:
-            schema = json.load(v)
-            # Perform Validation
-            validate(instance=DayInfo, schema=schema)
 
-        # Drop data from non-student emails (using the filter emails list)
-        # Commented out Spring 2021 upon switch to UUIDs
-        # raw_data = raw_data[~raw_data["Email"].isin(DayInfo["Filter_Emails"])]
-        # class_list = class_list - set(DayInfo["Filter_Emails"])
+def concat_chunks(chunks):
+    """
+    Puts the cleaned chunks back together into one dataframe. The categories of every categorical column are merged, so
+    the columns stay categorical even though each chunk found its own categories.
 
-        delta_max = DayInfo["Time_Delta"]
+    :param chunks: a non-empty list of cleaned chunks (see ``clean_chunk``), all with the same columns
+    :return: the combined dataframe, with a fresh RangeIndex
+    """
+    category_columns = [column for column in chunks[0].columns if chunks[0][column].dtype == "category"]
+    data = pd.concat([chunk.drop(columns=category_columns) for chunk in chunks], ignore_index=True)
+    for column in category_columns:
+        columns = [chunk[column] for chunk in chunks]
+        # A column that's empty all the way through a chunk has no categories to tell their type by (pandas guesses
+        # floats), so it gets the other chunks' (empty) categories instead, since union_categoricals needs one type
+        no_categories = next((values.cat.categories[:0] for values in columns if len(values.cat.categories)), None)
+        if no_categories is not None:
+            columns = [values if len(values.cat.categories) else values.cat.set_categories(no_categories)
+                       for values in columns]
+        data[column] = union_categoricals(columns)
+    return data[chunks[0].columns]
+
+
+def bytes_per_row(data):
+    """
+    :param data: a dataframe, such as raw_data
+    :return: the number of bytes the dataframe takes up in memory (index and category labels included) per row
+    """
+    return data.memory_usage(index=True, deep=True).sum() / max(len(data), 1)
 
 
 def find_emails(df):
+    """
+    Finds the emails students typed into H5P elements.
+
+    :param df: a dataframe holding a chunk of the raw data csv
+    :return: dataframe of the distinct ("Name", "Email") pairs found, in the order they show up in ``df``
+    """
     # Define an email regex and find responses that are emails
     email_regex = '([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)'
     email_rows = df.Response.str.extract(email_regex, expand=False)
 
-    # Transform this into a new df, then into a dictionary mapping name->email
-    email_df = pd.DataFrame({'Name': df.Name, 'Response': email_rows}).dropna().set_index("Name")
-    dictionary = email_df.T.to_dict('list')  # T = transposition, some wacky stuff from stack overflow
-    # Remove lists
-    for key in dictionary:
-        dictionary[key] = dictionary[key][0]
-
-    return dictionary
+    return pd.DataFrame({"Name": df.Name, "Email": email_rows}).dropna().drop_duplicates(ignore_index=True)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+
+class IdentityIndex:
+    """
+    Resolves the browser UUIDs in the data to people. UUIDs that share an email (typed into an H5P element) belong to
+    the same person, and one UUID may have entered several emails, so UUIDs and emails are merged together with
+    union-find.
+
+    Every person gets an integer code, and ``names`` maps codes to the name shown in reports: the first email found for
+    that person, or their UUID if they never entered one. People are numbered in order of their name, so reports list
+    them in a stable order.
+    """
+
+    def __init__(self, uuids, email_pairs):
+        """
+        :param uuids: every UUID in the data
+        :param email_pairs: dataframe of "Name" (UUID) and "Email" pairs, in the order they were found
+        """
+        uuids = sorted(set(uuids))
+        pairs = list(zip(email_pairs["Name"], email_pairs["Email"]))
+
+        # Union-find over UUIDs and emails. Emails are kept apart from UUIDs by storing them as ("email", ...) tuples.
+        parent = {}
+
+        def find(node):
+            root = node
+            while parent.setdefault(root, root) != root:
+                root = parent[root]
+            while parent[node] != root:  # Path compression
+                parent[node], node = root, parent[node]
+            return root
+
+        for uuid in uuids:
+            find(uuid)
+        for uuid, email in pairs:
+            uuid_root, email_root = find(uuid), find(("email", email))
+            if uuid_root != email_root:
+                parent[email_root] = uuid_root
+
+        # The first email found for each group of UUIDs becomes its name
+        first_email = {}
+        for uuid, email in pairs:
+            first_email.setdefault(find(uuid), email)
+
+        # Only people with a UUID in the data count. Their key is their (alphabetically) first UUID.
+        people = {}
+        for uuid in uuids:
+            people.setdefault(find(uuid), uuid)
+        roots = sorted(people, key=lambda root: (first_email.get(root, people[root]), people[root]))
+
+        self.names = np.array([first_email.get(root, people[root]) for root in roots], dtype=object)
+        self.keys = np.array([people[root] for root in roots], dtype=object)
+        root_code = {root: code for code, root in enumerate(roots)}
+        self._uuids = pd.Index(uuids, dtype=object)
+        self._uuid_codes = np.array([root_code[find(uuid)] for uuid in uuids], dtype="int64")
+
+    @property
+    def num_people(self):
+        """
+        :return: the number of people in the class
+        """
+        return len(self.names)
+
+    def codes(self, uuids):
+        """
+        Looks up the person code of every UUID in one go.
+
+        :param uuids: a Series or array of UUIDs
+        :return: int64 array of person codes (-1 for UUIDs the index doesn't know)
+        """
+        if isinstance(uuids, pd.Series) and isinstance(uuids.dtype, pd.CategoricalDtype):
+            # Only look up each category once, then spread the result over the rows by their category code
+            category_codes = np.append(self.codes(uuids.cat.categories), -1)
+            return category_codes[uuids.cat.codes.to_numpy()]
+
+        positions = self._uuids.get_indexer(pd.Index(uuids, dtype=object))
+        if len(self._uuid_codes) == 0:
+            return np.full(len(positions), -1, dtype="int64")
+        return np.where(positions >= 0, self._uuid_codes[positions], -1)
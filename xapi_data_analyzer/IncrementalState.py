@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from ElementCollection import ElementCollection, tag_days, durations_by_student, timestamps_ns, sum_engaged_gaps
+
+
+# Where the state from previous incremental runs is stored (one file per DayElement.json configuration)
+STATE_DIR = Path.home() / ".xapi-data-analyzer" / "incremental"
+
+
+def config_key(day_info):
+    """
+    Creates a key for the parts of DayElement.json that the saved state depends on. Changing the Days or the Time_Delta
+    means starting over with a fresh state.
+
+    :param day_info: the JSON data as a dict
+    :return: a hex string key
+    """
+    config = json.dumps({"Days": day_info["Days"], "Time_Delta": day_info["Time_Delta"]}, sort_keys=True)
+    return hashlib.blake2b(config.encode(), digest_size=16).hexdigest()
+
+
+def new_state(day_info):
+    """
+    Creates an empty state, as if no data had been seen yet. The state holds:
+
+    * high_water_mark: timestamp (in nanoseconds since the epoch) of the newest statement folded in so far, or None
+    * class_list: set of every uuid seen so far
+    * element_names: dict mapping H5P IDs to their element name (from the earliest statement that had one)
+    * interactions: Series mapping (H5P ID, uuid) to the newest timestamp that uuid interacted with that element
+    * day_students: dataframe indexed by (DayNumber, person key), holding each student's newest timestamp ("last"),
+      summed engaged nanoseconds ("total") and number of statements ("count") for that Day. A person's key is their
+      ``IdentityIndex.keys`` entry, so all of their uuids share one timeline.
+
+    :param day_info: the JSON data as a dict
+    :return: the state as a dict
+    """
+    return {
+        "config_key": config_key(day_info),
+        "high_water_mark": None,
+        "class_list": set(),
+        "element_names": {},
+        "interactions": pd.Series([], index=pd.MultiIndex.from_arrays([[], []], names=["object id", "Name"]),
+                                  name="Timestamp", dtype="int64"),
+        "day_students": pd.DataFrame({"last": [], "total": [], "count": []}, dtype="int64",
+                                     index=pd.MultiIndex.from_arrays([[], []], names=["DayNumber", "Name"]))
+    }
+
+
+def state_path(day_info):
+    """
+    :param day_info: the JSON data as a dict
+    :return: Path to the state file for this DayElement.json configuration
+    """
+    return STATE_DIR / (config_key(day_info) + ".pkl")
+
+
+def load(day_info):
+    """
+    Loads the state saved by the last incremental run with the same DayElement.json configuration.
+
+    :param day_info: the JSON data as a dict
+    :return: the saved state, or a fresh one if there isn't any
+    """
+    file = state_path(day_info)
+    if file.exists():
+        return pd.read_pickle(file)
+    return new_state(day_info)
+
+
+def save(state):
+    """
+    Saves the state for the next incremental run. The file is replaced in one step so a crash can't leave a half
+    written state behind.
+
+    :param state: the state to save
+    """
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    file = STATE_DIR / (state["config_key"] + ".pkl")
+    temp_file = file.with_suffix(".tmp")
+    pd.to_pickle(state, temp_file)
+    os.replace(temp_file, file)
+
+
+def clear():
+    """
+    Deletes every saved state, so the next incremental run starts over from the full data file.
+    """
+    if STATE_DIR.exists():
+        for file in STATE_DIR.iterdir():
+            file.unlink()
+
+
+def reconcile(state, identity):
+    """
+    Brings the person keys in the state up to date with a (possibly larger) IdentityIndex. New emails can add uuids to
+    a person, which may change their key, or can merge people the state kept apart. Durations can't be merged after the
+    fact, so the latter means the state has to be rebuilt.
+
+    :param state: the state to update in place
+    :param identity: an IdentityIndex covering every uuid in the state
+    :return: False if people in the state were merged (the state is left as it was), True otherwise
+    """
+    day_students = state["day_students"]
+    old_keys = day_students.index.get_level_values("Name")
+    new_keys = identity.keys[identity.codes(old_keys)]
+    new_index = pd.MultiIndex.from_arrays([day_students.index.get_level_values("DayNumber"), new_keys],
+                                          names=["DayNumber", "Name"])
+    if new_index.has_duplicates:
+        return False
+    day_students.index = new_index
+    return True
+
+
+def fold(state, data, day_info, identity):
+    """
+    Folds newly seen statements into the state. Every statement in ``data`` must be newer than the state's high water
+    mark (``GlobalData.load_data`` takes care of this with its ``newer_than`` argument).
+
+    :param state: the state to update in place (already reconciled with ``identity``)
+    :param data: the cleaned new statements, sorted by descending timestamp
+    :param day_info: the JSON data as a dict
+    :param identity: an IdentityIndex covering every uuid in the state and in ``data``
+    """
+    if data.empty:
+        return
+
+    timestamps = timestamps_ns(data["Timestamp"])
+    names = data["Name"].to_numpy(dtype=object)
+    object_ids = data["object id"].to_numpy(dtype="int64")
+    person_keys = identity.keys[identity.codes(names)]
+
+    state["high_water_mark"] = int(timestamps.max()) if state["high_water_mark"] is None \
+        else max(state["high_water_mark"], int(timestamps.max()))
+    state["class_list"].update(names)
+
+    # Names come from the earliest statement that has one, so elements that already have a name keep it
+    named = data.dropna(subset=["Question/Slide"])
+    for element_id, name in named.groupby("object id", sort=False)["Question/Slide"].last().items():
+        state["element_names"].setdefault(int(element_id), name)
+
+    # Keep the newest interaction of every user with every element
+    newest = pd.Series(timestamps, index=pd.MultiIndex.from_arrays([object_ids, names], names=["object id", "Name"]),
+                       name="Timestamp").groupby(level=[0, 1]).max()
+    state["interactions"] = pd.concat([state["interactions"], newest]).groupby(level=[0, 1]).max()
+
+    # Durations: the new statements of each (Day, person) are followed by one extra row holding the student's last
+    # stored timestamp for that Day, so the gap bridging the old and new statements is counted too
+    days = list(day_info["Days"].values())
+    rows, day_positions = tag_days(data["object id"], days)
+    day_numbers = np.array([day["DayNumber"] for day in days], dtype="int64")
+
+    old = state["day_students"]
+    old_day_numbers = old.index.get_level_values("DayNumber").to_numpy(dtype="int64")
+    old_names = old.index.get_level_values("Name").to_numpy(dtype=object)
+    keys = pd.DataFrame({"DayNumber": np.concatenate([day_numbers[day_positions], old_day_numbers]),
+                         "Name": np.concatenate([person_keys[rows], old_names])})
+    all_timestamps = np.concatenate([timestamps[rows], old["last"].to_numpy(dtype="int64")])
+
+    codes = keys.groupby(["DayNumber", "Name"], sort=False).ngroup().to_numpy()
+    group_index = pd.MultiIndex.from_frame(keys.drop_duplicates())
+    totals, counts = sum_engaged_gaps(codes, len(group_index), all_timestamps, day_info["Time_Delta"])
+
+    old = old.reindex(group_index)
+    had_state = old["count"].notna().to_numpy()
+    state["day_students"] = pd.DataFrame({
+        "last": pd.Series(all_timestamps).groupby(codes).max().to_numpy(),
+        "total": old["total"].fillna(0).to_numpy(dtype="int64") + totals,
+        "count": old["count"].fillna(0).to_numpy(dtype="int64") + counts - had_state
+    }, index=group_index)
+
+
+def analyze_days(state, day_dict_list, data, identity):
+    """
+    Builds the same per-Day results as ``ElementCollection.analyze_days``, but from the saved state rather than from the
+    full data.
+
+    :param state: the state, with all new statements already folded in
+    :param day_dict_list: a list of the day dictionary objects (from JSON file) that we're analyzing
+    :param data: the new statements of this run
+    :param identity: the IdentityIndex the state was folded with
+    :return: a list of (day dict, ElementCollection, student durations dict) tuples, one per Day that has data, in the
+        order of ``day_dict_list``
+    """
+    # Users are listed by when they first show up in the descending timestamp order, i.e. by their newest interaction
+    interactions = state["interactions"].reset_index()
+    interactions["Name"] = identity.codes(interactions["Name"])
+    interactions = interactions.groupby(["object id", "Name"])["Timestamp"].max()
+    interactions = interactions.sort_values(ascending=False, kind="stable").reset_index()
+    interactions["Name"] = identity.names[interactions["Name"].to_numpy()]
+    interacted_users = interactions.groupby("object id", sort=False)["Name"].agg(list).to_dict()
+
+    day_students = state["day_students"]
+    days_with_data = set(day_students.index.get_level_values("DayNumber"))
+
+    results = []
+    for day in day_dict_list:
+        if day["DayNumber"] not in days_with_data:
+            continue
+        element_collection = ElementCollection(day["Elements"], data, identity)
+        element_collection.set_precomputed_instance_vars(state["element_names"], interacted_users)
+
+        students = day_students.loc[day["DayNumber"]]
+        totals = np.zeros(identity.num_people, dtype="int64")
+        counts = np.zeros(identity.num_people, dtype="int64")
+        codes = identity.codes(students.index)
+        totals[codes] = students["total"].to_numpy(dtype="int64")
+        counts[codes] = students["count"].to_numpy(dtype="int64")
+        students_dict = durations_by_student(totals, counts, identity)
+
+        results.append((day, element_collection, students_dict))
+    return results
+
+
+def compare_results(incremental_results, full_results):
+    """
+    Compares per-Day results from an incremental run against a full recompute.
+
+    :param incremental_results: the list returned by ``analyze_days``
+    :param full_results: the list returned by ``ElementCollection.analyze_days`` over the full data
+    :return: a list of strings describing each difference found (empty if the results match)
+    """
+    incremental_days = {day["DayNumber"]: (ec, students) for day, ec, students in incremental_results}
+    full_days = {day["DayNumber"]: (ec, students) for day, ec, students in full_results}
+
+    differences = []
+    if incremental_days.keys() != full_days.keys():
+        differences.append("Days with data differ: " + str(sorted(incremental_days)) + " vs " + str(sorted(full_days)))
+
+    for day_num in sorted(incremental_days.keys() & full_days.keys()):
+        incremental_ec, incremental_students = incremental_days[day_num]
+        full_ec, full_students = full_days[day_num]
+        if not incremental_ec.get_dataframe().equals(full_ec.get_dataframe()):
+            differences.append("Day" + str(day_num) + ": element data differs")
+        if incremental_students != full_students:
+            differences.append("Day" + str(day_num) + ": student durations differ")
+    return differences
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+
+class InteractionMatrix:
+    """
+    A sparse student x element matrix of interactions, built once from the (timestamp-sorted) data. Students (uuids, or
+    people when given an IdentityIndex) and H5P IDs are encoded as integer codes, and there is one cell per (element,
+    student) pair that has at least one statement, holding the number of statements. Cells are stored element by element
+    (like a CSR matrix), and within an element students are kept in the order they first show up in the data.
+    """
+
+    def __init__(self, data, identity=None, rows=None):
+        """
+        :param data: the raw data dataframe, sorted by descending timestamp
+        :param identity: an IdentityIndex; if given, cells are per person (reported by name) rather than per uuid
+        :param rows: positions of the rows of ``data`` to use, in order (defaults to all of them)
+        """
+        names = data["Name"] if rows is None else data["Name"].take(rows)
+        object_ids = data["object id"] if rows is None else data["object id"].take(rows)
+        if identity is None:
+            student_codes, students = pd.factorize(names)
+            self.students = np.asarray(students, dtype=object)
+        else:
+            student_codes, self.students = identity.codes(names), identity.names
+        element_codes, element_ids = pd.factorize(object_ids)
+        num_students = len(self.students)
+        self.element_code = {int(element_id): code for code, element_id in enumerate(element_ids)}
+
+        # One cell per distinct (element, student) pair, remembering where the pair first shows up
+        pairs = element_codes.astype("int64") * num_students + student_codes
+        cells, first_rows, counts = np.unique(pairs, return_index=True, return_counts=True)
+        cell_elements = cells // max(num_students, 1)
+        order = np.lexsort((first_rows, cell_elements))
+
+        self.indices = (cells % max(num_students, 1))[order]
+        self.counts = counts[order]
+        self.indptr = np.searchsorted(cell_elements[order], np.arange(len(element_ids) + 1))
+
+    def _cells(self, element_id):
+        """
+        :param element_id: an H5P ID
+        :return: a slice over the cells of ``element_id`` (empty if nobody interacted with it)
+        """
+        code = self.element_code.get(int(element_id))
+        if code is None:
+            return slice(0, 0)
+        return slice(self.indptr[code], self.indptr[code + 1])
+
+    def users(self, element_id):
+        """
+        :param element_id: an H5P ID
+        :return: array of the students who interacted with the element, in order of first appearance in the data
+        """
+        return self.students[self.indices[self._cells(element_id)]]
+
+    def num_users(self, element_ids):
+        """
+        :param element_ids: a list of H5P IDs
+        :return: int array of the number of users who interacted with each element
+        """
+        codes = np.array([self.element_code.get(int(element_id), -1) for element_id in element_ids], dtype="int64")
+        # Unknown elements (code -1) land on the 0 appended at the end
+        sizes = np.append(np.diff(self.indptr), 0)
+        return sizes[codes]
+
+    def statement_counts(self, element_id):
+        """
+        :param element_id: an H5P ID
+        :return: Series mapping each student who interacted with the element to their number of statements on it
+        """
+        cells = self._cells(element_id)
+        return pd.Series(self.counts[cells], index=self.students[self.indices[cells]])
+
+    def _students_per_element_count(self, element_ids):
+        """
+        :param element_ids: a list of H5P IDs
+        :return: int array with, for every student code, how many of the (distinct) given elements they interacted with
+        """
+        cells = [self.indices[self._cells(element_id)] for element_id in set(element_ids)]
+        if not cells:
+            return np.zeros(len(self.students), dtype="int64")
+        return np.bincount(np.concatenate(cells), minlength=len(self.students))
+
+    def students_with_all(self, element_ids):
+        """
+        :param element_ids: a list of H5P IDs (e.g. all the elements of a Day)
+        :return: array of the students who interacted with every one of the elements
+        """
+        num_elements = len(set(element_ids))
+        if num_elements == 0:
+            return self.students[:0]
+        return self.students[self._students_per_element_count(element_ids) == num_elements]
+
+    def students_with_any(self, element_ids):
+        """
+        :param element_ids: a list of H5P IDs (e.g. all the elements of a Day)
+        :return: array of the students who interacted with at least one of the elements
+        """
+        return self.students[self._students_per_element_count(element_ids) > 0]
@@ -1,16 +1,27 @@
 import GlobalData
-from ElementCollection import ElementCollection
+import DataCache
+import IncrementalState
+import ResultCache
+import Reporter
+import Profiler
+import TimeWindow
+from ElementCollection import ElementCollection, analyze_days, sweep_days, weekly_days, weekly_durations
+from Reports import (ReportPool, ConsolidatedWriter, write_day_reports, write_sweep_report, write_weekly_report,
+                     generate_graphs)
+from IdentityIndex import IdentityIndex
 import pandas as pd
-import PySimpleGUI as sg
 from datetime import datetime
-import pytz
-import matplotlib.pyplot as plt
 from pathlib import Path
 import os
 import json
-import webbrowser
 import jsonschema
 import traceback
+import multiprocessing
+import queue
+import threading
+
+# PySimpleGUI, pytz and webbrowser are imported only where they're used, so headless runs (see Cli.py)
+# start up quickly and never touch the GUI toolkit
 
 
 def create_main_window():
@@ -19,11 +30,14 @@ def create_main_window():
 
     :return: a PySimpleGUI Window object for the main window
     """
+    import PySimpleGUI as sg
+
     layout = [
         [sg.Text("UW-Madison xAPI Data Analyzer", font="Any 15 bold")],
         [sg.Text("Please select the non-cleaned xAPI data .csv file from the DoIT Learning Locker "
-                 "(usually called something like dataMM-DD-YY.csv):")],
-        [sg.In(), sg.FileBrowse(key="FILEIN")],
+                 "(usually called something like dataMM-DD-YY.csv), or a .json/.ndjson file of raw xAPI statements. "
+                 "Several (possibly overlapping) exports can be selected at once:")],
+        [sg.In(), sg.FilesBrowse(key="FILEIN")],
         [sg.Text("Please select the DayElement.json file, which contains info on the timedelta and which H5P IDs "
                  "correspond to which days:")],
         [sg.In(), sg.FileBrowse(key="JSONIN")],
@@ -38,10 +52,30 @@ def create_main_window():
         [sg.Text("if you know the exact H5P elements you want data on, please enter a comma-separated list of "
                  "their ID numbers in the box below (leave blank if using above method).")],
         [sg.InputText(size=(20, 1), key="IDLIST")],
+        [sg.Text("Optionally, only analyze statements from a date range (YYYY-MM-DD, or YYYY-MM-DDTHH:MM for a time, "
+                 "in Central Time). Leave either box blank for no limit:")],
+        [sg.Text("From"), sg.InputText(size=(20, 1), key="START"), sg.Text("through"),
+         sg.InputText(size=(20, 1), key="END")],
         [sg.HorizontalSeparator(color="black")],
+        [sg.Checkbox("Incremental mode: only read statements newer than the last incremental run (Days only)",
+                     key="INCREMENTAL"),
+         sg.Checkbox("Verify against a full recompute", key="VERIFY")],
+        [sg.Checkbox("Save a detailed profile of the run (cProfile and tracemalloc, slower)", key="PROFILE"),
+         sg.Checkbox("Time_Delta sweep: total durations for every Time_Delta from 1 to 60 minutes", key="SWEEP")],
+        [sg.Checkbox("More element metrics: verb counts, first/last interaction, median time spent and distinct "
+                     "responses per element", key="METRICS")],
+        [sg.Checkbox("Consolidated output: all Days in one Parquet file per table and one PDF of graphs, instead of a "
+                     "folder per Day", key="CONSOLIDATED")],
+        [sg.Checkbox("Weekly engagement: every student's time spent in each week", key="WEEKLY")],
         [sg.Text("The data will be saved to the current directory under the folder 'xAPI-Data-Analyzer_$TIMESTAMP/'",
                  font="Any 10 bold")],
-        [sg.Button("Go", size=(4, 1), button_color=("white", "green"))],
+        [sg.Button("Go", size=(4, 1), button_color=("white", "green")),
+         sg.Button("Cancel", tooltip="Stop the running analysis (queued analyses still run)"),
+         sg.Button("Clear Cache", tooltip="Forget previously loaded data files, saved reports and incremental state "
+                                          "so they're made from scratch")],
+        [sg.ProgressBar(1, orientation="h", size=(40, 15), key="PROGRESSBAR")],
+        [sg.Text("", size=(60, 1), key="STATUS", justification="center")],
+        [sg.Text("", size=(60, 1), key="QUEUE", justification="center")],
         [sg.HorizontalSeparator(color="black")],
         [sg.Text("Need help or want to learn more? Check out our GitHub page for an in-depth explanation of the tool:")],
         [sg.Text("README", font="Any 12 underline bold", text_color="blue", enable_events=True, tooltip="Follow link")]
@@ -49,96 +83,283 @@ def create_main_window():
     return sg.Window("xAPI Data Analyzer", layout, element_justification="center")
 
 
-def use_id_list(id_list, timestamp):
+def use_id_list(id_list, timestamp, output_dir=".", sweep=False, metrics=False, weekly=False, start=None, end=None):
     """
     Controls dataframe creation and data-saving if the user chooses to enter a list of H5P IDs, as opposed to providing
     a JSON file that lists all IDs.
 
     :param id_list: the list of H5P IDs
     :param timestamp: timestamp string for file-naming purposes
+    :param output_dir: the directory to create the output folder in
+    :param sweep: if True, also save the Time_Delta sweep
+    :param metrics: if True, add the extra element metrics (see ``ElementMetrics``) to ElementCollection.csv
+    :param weekly: if True, also save every student's engaged time in each week
+    :param start: if given, only statements from this UTC Timestamp on are analyzed
+    :param end: if given, only statements before this UTC Timestamp are analyzed
     """
     # Create folder we want to save everything to
-    save_folder = Path("xAPI-Data-Analyzer_" + timestamp + "/")
+    save_folder = Path(output_dir) / ("xAPI-Data-Analyzer_" + timestamp)
     os.mkdir(save_folder)
 
-    # Create ElementCollection object + dataframe
-    element_collection = ElementCollection(id_list, GlobalData.raw_data, GlobalData.class_list, GlobalData.UUID_to_email)
-    elements_df = element_collection.get_dataframe()
+    data, interaction_matrix = GlobalData.window_data(start, end)
+    Reporter.check_cancelled()
+    # Reuse the report if this exact one was made from the same data before
+    result_key = cached = None
+    if GlobalData.data_fingerprint is not None:
+        result_key = ResultCache.key(GlobalData.data_fingerprint, id_list, GlobalData.delta_max, metrics, (start, end))
+        with Profiler.stage("result_cache_load"):
+            cached = ResultCache.load(result_key, id_list)
+
+    element_collection = None
+    if cached is not None:
+        elements_df, students_dict, cached_graphs = cached
+    else:
+        # Create ElementCollection object + dataframe
+        element_collection = ElementCollection(id_list, data, GlobalData.identity, interaction_matrix)
+        with Profiler.stage("get_dataframe", rows=len(id_list)):
+            elements_df = element_collection.get_dataframe(extended=metrics)
+        students_dict = element_collection.get_students_duration(GlobalData.delta_max)
+        cached_graphs = None
     elements_df.to_csv(save_folder / "ElementCollection.csv")
 
     # create student durations dataframe
-    df_students = pd.DataFrame.from_dict(element_collection.get_students_duration(GlobalData.delta_max), orient='index')
+    df_students = pd.DataFrame.from_dict(students_dict, orient='index')
     df_students.to_csv(save_folder / "StudentDurations.csv")
+    Reporter.check_cancelled()
+
+    if (sweep or weekly) and element_collection is None:
+        element_collection = ElementCollection(id_list, data, GlobalData.identity, interaction_matrix)
+    if sweep:
+        with Profiler.stage("time_delta_sweep", rows=len(element_collection.rows)):
+            sweep_df = element_collection.get_duration_sweep().to_frame()
+            write_sweep_report(sweep_df, save_folder, GlobalData.delta_max)
+    if weekly:
+        weekly_df = weekly_durations(data, element_collection.rows, GlobalData.identity, GlobalData.delta_max, start)
+        with Profiler.stage("write_weekly_report"):
+            write_weekly_report(weekly_df, save_folder)
 
     # Generate graphs
-    generate_graphs(elements_df, df_students, save_folder)
-
-    sg.Popup("All files successfully saved!", title="Success!")
-
-
-def use_json(timestamp, day_dict_list):
+    Reporter.check_cancelled()
+    if cached_graphs is not None:
+        with Profiler.stage("copy_cached_graphs"):
+            ResultCache.copy_graphs(cached_graphs, save_folder)
+    else:
+        with Profiler.stage("generate_graphs"):
+            graphs = generate_graphs(elements_df, df_students, save_folder, GlobalData.identity.num_people)
+        if result_key is not None and cached is None:
+            with Profiler.stage("result_cache_save"):
+                ResultCache.save(result_key, id_list, elements_df, students_dict, graphs)
+
+    cache_summary = result_cache_summary(int(cached is not None), int(cached is None)) if result_key else ""
+    Profiler.write(save_folder)
+    Reporter.popup("All files successfully saved!" + cache_summary, title="Success!")
+
+
+def use_json(timestamp, day_dict_list, verify_data_path=None, output_dir=".", workers=None, sweep=False,
+             metrics=False, consolidated=False, weekly=False, start=None, end=None):
     """
     Controls dataframe creation if the user provides a JSON file. Creates a dataframe and graphs for every day that has
-    data, and outputs it into a day-specific folder within the base folder.
+    data, and outputs it into a day-specific folder within the base folder (or, if ``consolidated``, into the few files
+    of a ``Reports.ConsolidatedWriter``).
 
     :param timestamp: timestamp string for file-naming purposes
     :param day_dict_list: a list of the day dictionary objects (from JSON file) that we're analyzing
+    :param verify_data_path: in incremental mode, path to the full data csv (or a list of them) to check the results
+        against (optional)
+    :param output_dir: the directory to create the output folder in
+    :param workers: number of worker processes writing the per-Day files and graphs (defaults to
+        ``Reports.DEFAULT_WORKERS``, 0 writes them in this process)
+    :param sweep: if True, also save the Time_Delta sweep of every Day (needs the full data, so not in incremental mode)
+    :param metrics: if True, add the extra element metrics (see ``ElementMetrics``) to every Day csv (needs the full
+        data, so not in incremental mode)
+    :param consolidated: if True, write every Day's tables into one Parquet file each and all graphs into one PDF,
+        rather than a folder per Day (needs pyarrow)
+    :param weekly: if True, also save every student's engaged time in each week (needs the full data, so not in
+        incremental mode)
+    :param start: if given, only statements from this UTC Timestamp on are analyzed (on top of each Day's own window
+        from the JSON file, if it has one)
+    :param end: if given, only statements before this UTC Timestamp are analyzed
     """
-    base_folder = Path("xAPI-Data-Analyzer_" + timestamp + "/")
+    if metrics and GlobalData.incremental_state is not None:
+        Reporter.popup("INFO: The extra element metrics need every statement, so they aren't added in incremental "
+                       "mode.", title="Info")
+        metrics = False
+    if GlobalData.incremental_state is not None and (start is not None or end is not None or any(
+            TimeWindow.bounds(day) != (None, None) for day in day_dict_list)):
+        Reporter.popup("INFO: Date ranges and Day windows need every statement, so they're ignored in incremental "
+                       "mode.", title="Info")
+        start = end = None
+    data, interaction_matrix = GlobalData.window_data(start, end)
+    if data.empty and (start is not None or end is not None):
+        Reporter.popup("INFO: There are no statements in the date range, so there is nothing to analyze.",
+                       title="Info")
+        return
+
+    base_folder = Path(output_dir) / ("xAPI-Data-Analyzer_" + timestamp)
     os.mkdir(base_folder)
 
-    uuid_and_email_class_list = []
-    for uuid in GlobalData.class_list:
-        if uuid in GlobalData.UUID_to_email:
-            uuid_and_email_class_list.append(GlobalData.UUID_to_email[uuid])
-        else:
-            uuid_and_email_class_list.append(uuid)
-
-    students_master = pd.DataFrame(index=uuid_and_email_class_list)
-    units = []
+    # Reuse the reports of the Days that were made from the same data before
+    result_keys = {}
+    cached_results = {}
+    if GlobalData.data_fingerprint is not None:
+        with Profiler.stage("result_cache_load"):
+            for day in day_dict_list:
+                result_keys[day["DayNumber"]] = ResultCache.key(GlobalData.data_fingerprint, day["Elements"],
+                                                                GlobalData.delta_max, metrics,
+                                                                TimeWindow.bounds(day, start, end))
+                cached = ResultCache.load(result_keys[day["DayNumber"]], day["Elements"])
+                if cached is not None:
+                    cached_results[day["DayNumber"]] = cached
+
+    # Analyze every other Day in one pass over the data (Days without any data are left out)
+    if GlobalData.incremental_state is not None:
+        with Profiler.stage("analyze_days", rows=len(GlobalData.raw_data)):
+            day_results = IncrementalState.analyze_days(GlobalData.incremental_state, day_dict_list,
+                                                        GlobalData.raw_data, GlobalData.identity)
+        if verify_data_path is not None:
+            with Profiler.stage("verify_incremental"):
+                verify_incremental(verify_data_path, day_dict_list, day_results, base_folder)
+    else:
+        with Profiler.stage("analyze_days", rows=len(data)):
+            analyzed = {day["DayNumber"]: (day, element_collection, students_dict)
+                        for day, element_collection, students_dict in analyze_days(
+                            [day for day in day_dict_list if day["DayNumber"] not in cached_results],
+                            data, GlobalData.identity, GlobalData.delta_max, interaction_matrix)}
+        # Cached Days have no ElementCollection, since their reports are already made
+        day_results = [(day, None, cached_results[day["DayNumber"]][1]) if day["DayNumber"] in cached_results
+                       else analyzed[day["DayNumber"]] for day in day_dict_list
+                       if day["DayNumber"] in cached_results or day["DayNumber"] in analyzed]
+
+    consolidated_writer = None
+    if consolidated and not ConsolidatedWriter.is_available():
+        Reporter.popup("INFO: Consolidated output needs pyarrow, so a folder per Day is written instead.", title="Info")
+    elif consolidated:
+        consolidated_writer = ConsolidatedWriter(base_folder)
+
+    # Per-Day files and graphs are handed off to worker processes while the next Day is being put together (consolidated
+    # output all goes into the same few files, so it's written here)
+    report_pool = ReportPool(0 if consolidated_writer is not None else workers)
+    submitted_days = []
+    new_reports = []  # (day dict, dataframe, student durations) of the Days to add to the ResultCache
+    try:
+        for i, (day, element_collection, students_dict) in enumerate(day_results, 1):
+            Reporter.check_cancelled()
+            Reporter.progress("Progress", i, len(day_results))
+            # Get info from JSON file
+            day_num = day['DayNumber']
+
+            # Create dataframe
+            cached_graphs = None
+            if element_collection is None:
+                day_df, _, cached_graphs = cached_results[day_num]
+            else:
+                with Profiler.stage("get_dataframe", rows=len(element_collection.rows), day=day_num):
+                    day_df = element_collection.get_dataframe(extended=metrics)
+                if day_num in result_keys:
+                    new_reports.append((day, day_df, students_dict))
+            # Uncomment below to print the number of bytes the dataframe takes in memory
+            # print("Day " + str(day_num) + ": " + str(day_df.memory_usage(index=True, deep=True).sum()))
 
-    for i, day in enumerate(day_dict_list, 1):
-        sg.OneLineProgressMeter("Progress", i, len(day_dict_list), orientation="h")
-        # Get info from JSON file
-        day_num = day['DayNumber']
-        day_ids = day['Elements']
-        unit_name = "Unit" + str(day['Unit'])
+            if consolidated_writer is not None:
+                consolidated_writer.add_day(day_num, day_df, students_dict, GlobalData.identity.num_people)
+                continue
 
-        # Check that data for the given Day exists
-        element_collection = ElementCollection(day_ids, GlobalData.raw_data, GlobalData.class_list, GlobalData.UUID_to_email)
-        if not element_collection.data.empty:
             # Create where we want to store the csvs and graphs
             day_folder = base_folder / ("Day" + str(day_num))
             os.mkdir(day_folder)
 
-            # Create ElementCollection object and dataframe
-            day_df = element_collection.get_dataframe()
-            # Uncomment below to print the number of bytes the dataframe takes in memory
-            # print("Day " + str(day_num) + ": " + str(day_df.memory_usage(index=True, deep=True).sum()))
-            day_df.to_csv(day_folder / ("Day" + str(day_num) + ".csv"))
+            # Save the Day csv, student durations and graphs (copying the graphs of cached Days)
+            report_pool.submit(write_day_reports, day_folder, day_num, day_df, students_dict,
+                               GlobalData.identity.num_people, cached_graphs)
+            submitted_days.append(day_num)
+        Reporter.check_cancelled()
+    except Reporter.Cancelled:
+        report_pool.cancel()
+        if consolidated_writer is not None:
+            consolidated_writer.close()
+        raise
+
+    totals_df = total_durations(day_results, GlobalData.identity)
+    if consolidated_writer is not None:
+        consolidated_writer.write_totals(totals_df)
+        with Profiler.stage("close_consolidated"):
+            consolidated_writer.close()
+    else:
+        totals_df.to_csv(base_folder / "TotalDurations.csv")
+
+    if sweep and GlobalData.incremental_state is not None:
+        Reporter.popup("INFO: The Time_Delta sweep needs every statement, so it isn't made in incremental mode.",
+                       title="Info")
+    elif sweep:
+        sweep_df = sweep_days(day_dict_list, data, GlobalData.identity)
+        with Profiler.stage("write_sweep_report"):
+            write_sweep_report(sweep_df, base_folder, GlobalData.delta_max)
+
+    if weekly and GlobalData.incremental_state is not None:
+        Reporter.popup("INFO: The weekly engagement report needs every statement, so it isn't made in incremental "
+                       "mode.", title="Info")
+    elif weekly:
+        weekly_df = weekly_days(day_dict_list, data, GlobalData.identity, GlobalData.delta_max, start)
+        with Profiler.stage("write_weekly_report"):
+            write_weekly_report(weekly_df, base_folder)
+
+    failed_reports = report_pool.close()
+    reports = dict(zip(submitted_days, report_pool.results))
+    for day_num, report in reports.items():
+        if report is not None:
+            Profiler.merge(report[0], day=day_num)
+
+    # Consolidated runs don't draw pngs, so their Days are cached without graphs
+    with Profiler.stage("result_cache_save"):
+        for day, day_df, students_dict in new_reports:
+            report = reports.get(day["DayNumber"])
+            if consolidated_writer is None and report is None:
+                continue
+            ResultCache.save(result_keys[day["DayNumber"]], day["Elements"], day_df, students_dict,
+                             None if consolidated_writer is not None else report[1])
+    cache_summary = result_cache_summary(len(cached_results), len(new_reports)) if result_keys else ""
+    Profiler.write(base_folder)
 
-            # create student durations dataframe
-            students_dict = element_collection.get_students_duration(GlobalData.delta_max)
-            df_students = pd.DataFrame.from_dict(students_dict, orient='index')
-            if not df_students.empty:
-                df_students.to_csv(day_folder / ("StudentDurations_Day" + str(day_num) + ".csv"))
-            else:
-                with open(day_folder / ("StudentDurations_Day" + str(day_num) + ".txt"), "w") as text_file:
-                    text_file.write("No student durations data to report for Day " + str(day_num) +
-                                    ". Because of this, the student durations CSV and histogram were not generated.")
-
-            # Update aggregated students df
-            students_master["Day" + str(day_num)] = pd.Series(students_dict)
-            if unit_name in students_master.columns:
-                students_master[unit_name] = students_master[unit_name].add(pd.Series(students_dict), fill_value=0)
-            else:
-                students_master[unit_name] = pd.Series(students_dict)
-                units.append(unit_name)
+    if failed_reports:
+        Reporter.popup("ERROR: " + str(failed_reports) + " Day report(s) could not be saved. Details were added to the "
+                       "error log file 'xAPI-Data-Analyzer-ERROR-LOG.txt' in the current directory." + cache_summary,
+                       title="Error")
+    else:
+        Reporter.popup("All files successfully saved!" + cache_summary, title="Success!")
 
-            # Generate and save graphs
-            generate_graphs(day_df, df_students, day_folder)
 
-    # Finish processing students_master
+def result_cache_summary(hits, misses):
+    """
+    Records how many reports came out of the ``ResultCache`` in the run's profile.
+
+    :param hits: number of reports that were cached
+    :param misses: number of reports that had to be made (and were added to the cache)
+    :return: a line about it to add to the message at the end of the run
+    """
+    Profiler.note("result_cache", {"hits": hits, "misses": misses})
+    return "\nResult cache: " + str(hits) + " hit(s), " + str(misses) + " miss(es)"
+
+
+def total_durations(day_results, identity):
+    """
+    Puts every student's durations together into one dataframe, with a column per Day, then a column per Unit and a
+    Total column.
+
+    :param day_results: the per-Day (day dict, ElementCollection, student durations dict) tuples of ``analyze_days``
+    :param identity: the IdentityIndex the students come from
+    :return: the dataframe, with one row per person (under their email if we found one)
+    """
+    students_master = pd.DataFrame(index=list(identity.names))
+    units = []
+    for day, _, students_dict in day_results:
+        unit_name = "Unit" + str(day['Unit'])
+        students_master["Day" + str(day['DayNumber'])] = pd.Series(students_dict)
+        if unit_name in students_master.columns:
+            students_master[unit_name] = students_master[unit_name].add(pd.Series(students_dict), fill_value=0)
+        else:
+            students_master[unit_name] = pd.Series(students_dict)
+            units.append(unit_name)
+
     # Rearrange columns
     cols = list(students_master.columns)
     for unit in units:
@@ -147,48 +368,33 @@ def use_json(timestamp, day_dict_list):
 
     # Compute a totals column
     students_master['Total'] = students_master[units].sum(axis=1)
-    students_master.to_csv(base_folder / "TotalDurations.csv")
-
-    sg.Popup("All files successfully saved!", title="Success!")
+    return students_master
 
 
-def generate_graphs(element_df, duration_df, folder):
+def verify_incremental(data_path, day_dict_list, day_results, folder):
     """
-    Creates graphs of the following, and saves them as a png in ``folder``:
+    Checks the results of an incremental run against a full recompute from ``data_path``, and saves a report of any
+    differences as ``IncrementalVerification.txt`` in ``folder``.
 
-    * % of students who interacted with each given element
-    * # of students who interacted with each given element
-    * Histogram of the durations that students spent on all elements in ``element_df``
-
-    :param element_df: dataframe for an ElementCollection object
-    :param duration_df: dataframe containing students' durations for the same ElementCollection object
-    :param folder: Path object of the folder to save the graphs in
+    :param data_path: path to the full raw data csv, or a list of them (see ``GlobalData.load_data``)
+    :param day_dict_list: a list of the day dictionary objects (from JSON file) that we're analyzing
+    :param day_results: the per-Day results of the incremental run
+    :param folder: Path object of the folder to save the report in
     """
-    # Generate student % interacted graph, save to png
-    element_df.plot(x="object id", y="% of users who interacted", kind="bar")
-    plt.xlabel("H5P ID")
-    plt.ylabel("Percent")
-    plt.ylim(0, 100)
-    plt.title("Students % Interacted")
-    plt.savefig(folder / "student_percent_interacted.png")
-    plt.close()
-
-    # Generate student count interacted graph, save to png
-    element_df.plot(x="object id", y="Number of users who interacted", kind="bar")
-    plt.xlabel("H5P ID")
-    plt.ylim(0, len(GlobalData.class_list))
-    plt.title("Student Interacted Count")
-    plt.savefig(folder / "student_count_interacted.png")
-    plt.close()
-
-    # Generate student duration histogram, save to png
-    if not duration_df.empty:  # Make sure student_durations isn't empty, bc that makes the histogram a n g e r y
-        duration_df.hist()
-        plt.xlabel("Duration (min)")
-        plt.ylabel("Number of Students")
-        plt.title("Student Durations")
-        plt.savefig(folder / "student_durations.png")
-        plt.close()
+    raw_data, email_pairs, _, _ = GlobalData.load_data(data_path)
+    full_results = analyze_days(day_dict_list, raw_data, IdentityIndex(set(raw_data["Name"].unique()), email_pairs),
+                                GlobalData.delta_max)
+    differences = IncrementalState.compare_results(day_results, full_results)
+
+    with open(folder / "IncrementalVerification.txt", "w") as text_file:
+        if differences:
+            text_file.write("The incremental results do NOT match a full recompute:\n" + "\n".join(differences) + "\n")
+        else:
+            text_file.write("The incremental results match a full recompute.\n")
+
+    if differences:
+        Reporter.popup("WARNING: The incremental results do not match a full recompute. Consider clearing the cache "
+                       "and running again. See IncrementalVerification.txt for details.", title="Verification Failed")
 
 
 def generate_timestamp():
@@ -197,6 +403,8 @@ def generate_timestamp():
 
     :return: a nicely-formatted string of the timestamp
     """
+    import pytz
+
     # Generate a CST timestamp
     timestamp = str(datetime.now(pytz.timezone("America/Chicago")))
     # Make the string a little prettier
@@ -206,10 +414,183 @@ def generate_timestamp():
     return timestamp
 
 
+def select_days(day_num_list):
+    """
+    Picks the Days to analyze out of the JSON file, based on the user's input.
+
+    :param day_num_list: "all", or a comma-separated string of Day numbers
+    :return: a list of the day dictionary objects (from JSON file) to analyze
+    :raises ValueError: if the items in ``day_num_list`` aren't valid integers
+    """
+    if str(day_num_list).lower().strip() == "all":  # Send in the full list of days from the JSON
+        return list(GlobalData.DayInfo['Days'].values())
+
+    # Parse the list of only the days the user wants and send that in instead
+    day_num_list = [int(item.strip()) for item in day_num_list.split(",")]
+
+    day_dict_list = []
+    for day in GlobalData.DayInfo["Days"].values():
+        if day["DayNumber"] in day_num_list:
+            day_dict_list.append(day)
+            day_num_list.remove(day["DayNumber"])
+
+    # If there's ints that the user entered that aren't days in JSON, let them know
+    if day_num_list:
+        Reporter.popup("INFO: The following day numbers entered were not found in the JSON file. These values will be "
+                       "ignored.\n" + str(day_num_list), title="Info")
+
+    return day_dict_list
+
+
+class AnalysisWorker:
+    """
+    Runs analyses on a background thread so the window stays responsive. Analyses queue up and run one after another,
+    and the data is only loaded again when an analysis needs a different (or changed) data or JSON file, so several Day
+    lists can be analyzed over one loaded export. Popups and progress are posted back to the window as events (see
+    ``Reporter.WindowReporter``), and ``cancel`` stops the running analysis at the next stage boundary.
+    """
+
+    DONE_EVENT = "-ANALYSIS-DONE-"
+
+    def __init__(self, window):
+        """
+        :param window: the main PySimpleGUI Window, which gets the worker's events
+        """
+        self.window = window
+        self.jobs = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.reporter = Reporter.WindowReporter(window, self.cancel_event)
+        self.loaded_source = None  # What the data in GlobalData was loaded from, if it can be reused
+        self.running = False
+        self.thread = threading.Thread(target=self.work, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, values):
+        """
+        Queues an analysis.
+
+        :param values: the window's values when "Go" was pressed
+        """
+        self.jobs.put(dict(values))
+
+    def cancel(self):
+        """
+        Asks the running analysis (if any) to stop. Queued analyses still run.
+        """
+        self.cancel_event.set()
+
+    def busy(self):
+        """
+        :return: the number of analyses running or waiting to run
+        """
+        return self.jobs.qsize() + self.running
+
+    def work(self):
+        """
+        Runs queued analyses, forever.
+        """
+        while True:
+            values = self.jobs.get()
+            self.running = True
+            self.cancel_event.clear()
+            try:
+                self.run(values)
+            except Reporter.Cancelled:
+                Reporter.popup("The analysis was cancelled. Anything already saved was left in its output folder.",
+                               title="Cancelled")
+            except Exception:
+                # Same as a crash, except that the window stays open for the next analysis
+                self.loaded_source = None
+                with open("xAPI-Data-Analyzer-ERROR-LOG.txt", "a") as error_file:
+                    traceback.print_exc(file=error_file)
+                Reporter.popup("An unexpected error occurred during the analysis. An error log text file was created "
+                               "in the current directory called 'xAPI-Data-Analyzer-ERROR-LOG.txt'. Please consider "
+                               "filing a bug report on our GitHub page with this file.", title="Error")
+            finally:
+                self.running = False
+                self.window.write_event_value(self.DONE_EVENT, self.busy())
+
+    def run(self, values):
+        """
+        Loads the data (unless it's already loaded) and runs one analysis.
+
+        :param values: the window's values when "Go" was pressed
+        """
+        Profiler.start(Profiler.CAPTURE_MODES if values["PROFILE"] else ())
+        try:
+            data_paths = GlobalData.expand_data_paths(values["FILEIN"].split(";"))
+            source = tuple((file_path, os.stat(file_path).st_mtime_ns) for file_path in data_paths + [values["JSONIN"]])
+            # Incremental runs only load the new statements, so their data can never be reused. Data loaded without the
+            # responses can't be reused for the extra metrics either.
+            if values["INCREMENTAL"] or source != self.loaded_source or \
+                    (values["METRICS"] and GlobalData.RESPONSE_COLUMN not in GlobalData.raw_data):
+                self.loaded_source = None
+                Reporter.status("Loading " + ", ".join(os.path.basename(file_path) for file_path in data_paths) + "...")
+                GlobalData.set_data_vars(data_paths, values["JSONIN"], incremental=values["INCREMENTAL"],
+                                         responses=values["METRICS"])
+                self.loaded_source = None if values["INCREMENTAL"] else source
+        except KeyError as e:
+            Reporter.popup("ERROR: The following H5P element was not found: " + str(e.args[0]), title="Error")
+            return
+        except FileNotFoundError:
+            Reporter.popup("ERROR: A provided file was not found! Please double-check the path to the data and JSON "
+                           "files and try again.", title="Error")
+            return
+        except json.JSONDecodeError:
+            Reporter.popup("ERROR: The provided JSON file could not be read. Please ensure its formatting is correct.",
+                           title="Error")
+            return
+        except jsonschema.exceptions.ValidationError as e:
+            message = str(e.message).replace("^Day_\\\\d{1,2}$", "Day_XX")
+            Reporter.popup("ERROR: The DayElement.json file is invalid, please check the Schema to ensure validity. \n"
+                           + message, title="Error")
+            return
+
+        # Generate a timestamp for naming the files (queued analyses can finish within the same second)
+        base_timestamp = timestamp = generate_timestamp()
+        copy = 1
+        while os.path.exists("xAPI-Data-Analyzer_" + timestamp):
+            copy += 1
+            timestamp = base_timestamp + "_" + str(copy)
+        verify_data_path = values["FILEIN"].split(";") if values["VERIFY"] else None
+        start, end = TimeWindow.parse_window(values["START"], values["END"])  # Checked before the analysis was queued
+
+        # Check the "Days" list first
+        if values["DAYLIST"]:
+            try:
+                day_dict_list = select_days(values["DAYLIST"])
+            except ValueError:
+                Reporter.popup("ERROR: The items entered in the Days list were not valid integers! Please try again.",
+                               title="Error")
+                return
+            use_json(timestamp, day_dict_list, verify_data_path, sweep=values["SWEEP"], metrics=values["METRICS"],
+                     consolidated=values["CONSOLIDATED"], weekly=values["WEEKLY"], start=start, end=end)
+        else:  # Ok, then the user entered IDs (checked before the analysis was queued)
+            use_id_list(parse_id_list(values["IDLIST"]), timestamp, sweep=values["SWEEP"], metrics=values["METRICS"],
+                        weekly=values["WEEKLY"], start=start, end=end)
+
+
+def parse_id_list(id_list):
+    """
+    :param id_list: a comma-separated string of H5P IDs
+    :return: a list of the H5P IDs as ints
+    :raises ValueError: if the items in ``id_list`` aren't valid integers
+    """
+    return [int(item.strip()) for item in id_list.split(",")]
+
+
 def main():
+    import PySimpleGUI as sg
+    import webbrowser
+
     sg.theme("SystemDefault")
 
     main_window = create_main_window()
+    worker = AnalysisWorker(main_window)
+    Reporter.set_reporter(worker.reporter)
+    worker.start()
     while True:
         event, values = main_window.read()
 
@@ -219,83 +600,95 @@ def main():
         if event == "README":
             webbrowser.open("https://github.com/HBlanco36/xapi-data-analyzer")
 
-        if event == "Go":
-            # Load in the data and JSON files
-            try:
-                GlobalData.set_data_vars(values["FILEIN"], values["JSONIN"])
-            except KeyError as e:
-                sg.Popup("ERROR: The following H5P element was not found: " + str(e.args[0]), title="Error")
+        if event == "Clear Cache":
+            if worker.busy():
+                sg.Popup("The cache can't be cleared while an analysis is running or queued.", title="Error")
                 continue
-            except FileNotFoundError:
-                sg.Popup("ERROR: A provided file was not found! Please double-check the path to the data and JSON files"
-                         " and try again.", title="Error")
-                continue
-            except json.JSONDecodeError:
-                sg.Popup("ERROR: The provided JSON file could not be read. Please ensure its formatting is correct.",
-                         title="Error")
-                continue
-            except jsonschema.exceptions.ValidationError as e:
-                message = str(e.message).replace("^Day_\\\\d{1,2}$", "Day_XX")
-                sg.Popup("ERROR: The DayElement.json file is invalid, please check the Schema to ensure validity. \n"
-                         + message, title="Error")
+            DataCache.clear()
+            ResultCache.clear()
+            IncrementalState.clear()
+            worker.loaded_source = None
+            sg.Popup("The cache of previously loaded data files, saved reports and incremental state was cleared.",
+                     title="Cache Cleared")
+
+        if event == "Cancel":
+            worker.cancel()
+            main_window["STATUS"].update("Cancelling...")
+
+        # Events posted by the worker
+        if event == Reporter.WindowReporter.POPUP_EVENT:
+            message, title = values[event]
+            sg.Popup(message, title=title)
+
+        if event == Reporter.WindowReporter.PROGRESS_EVENT:
+            title, current, total = values[event]
+            main_window["PROGRESSBAR"].update(current, max=total)
+            main_window["STATUS"].update(title + ": " + str(current) + "/" + str(total))
+
+        if event == Reporter.WindowReporter.STATUS_EVENT:
+            main_window["STATUS"].update(values[event])
+
+        if event == AnalysisWorker.DONE_EVENT:
+            main_window["PROGRESSBAR"].update(0)
+            main_window["STATUS"].update("Done" if not values[event] else "")
+            main_window["QUEUE"].update(queue_text(values[event]))
+
+        if event == "Go":
+            if values["INCREMENTAL"] and not values["DAYLIST"]:
+                sg.Popup("ERROR: Incremental mode only works with a list of Days. Please enter Days or turn off "
+                         "incremental mode.", title="Error")
                 continue
 
-            # Generate a timestamp for naming the files
-            timestamp = generate_timestamp()
-
-            # Parse the ID list and Days list
-            id_list = values["IDLIST"]
-            day_num_list = values["DAYLIST"]
-
-            # Check the "Days" list first
-            if day_num_list:
-                if str(day_num_list).lower().strip() == "all":  # Send in the full list of days from the JSON
-                    use_json(timestamp, GlobalData.DayInfo['Days'].values())
-                else:  # Parse the list of only the days the user wants and send that in instead
-                    try:
-                        day_num_list = [int(item.strip()) for item in day_num_list.split(",")]
-                    except ValueError:
-                        sg.Popup(
-                            "ERROR: The items entered in the Days list were not valid integers! Please try again.",
-                            title="Error")
-                        continue
-
-                    day_dict_list = []
-                    for day in GlobalData.DayInfo["Days"].values():
-                        if day["DayNumber"] in day_num_list:
-                            day_dict_list.append(day)
-                            day_num_list.remove(day["DayNumber"])
-
-                    # If there's ints that the user entered that aren't days in JSON, let them know
-                    if day_num_list:
-                        sg.Popup("INFO: The following day numbers entered were not found in the JSON file. These "
-                                 "values will be ignored.\n" + str(day_num_list), title="Info")
-
-                    use_json(timestamp, day_dict_list)
-
-            elif id_list:  # Ok, then check if the user entered IDs, and use those if so
+            if not values["DAYLIST"]:
+                if not values["IDLIST"]:  # The user must've not entered anything in either input
+                    sg.Popup("Error: no method selected! Please read the instructions and enter appropriate values "
+                             "into one of the text boxes above", title="Error")
+                    continue
                 try:
-                    id_list = [int(item.strip()) for item in id_list.split(",")]
+                    parse_id_list(values["IDLIST"])
                 except ValueError:
                     sg.Popup("ERROR: The items entered in the H5P ID list were not valid integers! Please try again.",
                              title="Error")
                     continue
-                use_id_list(id_list, timestamp)
 
-            else:  # The user must've not entered anything in either input
-                sg.Popup("Error: no method selected! Please read the instructions and enter appropriate values into "
-                         "one of the text boxes above", title="Error")
+            try:
+                TimeWindow.parse_window(values["START"], values["END"])
+            except ValueError:
+                sg.Popup("ERROR: The date range is not valid! Please enter dates like 2021-03-01 (or 2021-03-01T08:00 "
+                         "for a time), with the start before the end.", title="Error")
+                continue
+
+            worker.submit(values)
+            main_window["QUEUE"].update(queue_text(worker.busy()))
 
     main_window.close()
 
 
+def queue_text(busy):
+    """
+    :param busy: the number of analyses running or waiting to run
+    :return: a line describing them for the main window
+    """
+    if not busy:
+        return ""
+    return "1 analysis running" + ("" if busy == 1 else ", " + str(busy - 1) + " queued")
+
+
 # Kinda bad practice to have such a broad exception clause but it works well in our use case so the program exits
 # gracefully and we can easily debug
-try:
-    main()
-except Exception:
-    sg.Popup("An unexpected error occurred that caused the program to crash. An error log text file was created in "
-             "the current directory called 'xAPI-Data-Analyzer-ERROR-LOG.txt'. Please consider filing a bug report on "
-             "our GitHub page with this file.", title="Fatal Error")
-    with open("xAPI-Data-Analyzer-ERROR-LOG.txt", "a") as error_file:
-        traceback.print_exc(file=error_file)
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    try:
+        main()
+    except Exception:
+        # The main window the worker reported to is closed by now, so the error gets a popup of its own (or goes to the
+        # terminal, if it was PySimpleGUI that couldn't be loaded)
+        try:
+            Reporter.set_reporter(Reporter.GuiReporter())
+        except ImportError:
+            Reporter.set_reporter(Reporter.ConsoleReporter())
+        Reporter.popup("An unexpected error occurred that caused the program to crash. An error log text file was "
+                       "created in the current directory called 'xAPI-Data-Analyzer-ERROR-LOG.txt'. Please consider "
+                       "filing a bug report on our GitHub page with this file.", title="Fatal Error")
+        with open("xAPI-Data-Analyzer-ERROR-LOG.txt", "a") as error_file:
+            traceback.print_exc(file=error_file)
@@ -0,0 +1,263 @@
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# resource only exists on Unix-like systems, so the process's max RSS is simply left out elsewhere
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# The files the profile is saved as in the output folder
+PROFILE_FILE = "RunProfile.json"
+CPROFILE_FILE = "RunProfile.prof"
+CPROFILE_SUMMARY_FILE = "RunProfile.txt"
+# The detailed capture modes that can be switched on, on top of the always-on stage timings
+CAPTURE_MODES = ["cprofile", "tracemalloc"]
+
+
+class RunProfile:
+    """
+    Records the wall time, row counts and memory of each stage of a run. Stages are timed with ``stage()`` and may be
+    nested (e.g. "read_csv" runs inside "set_data_vars"), and a stage that runs several times (e.g. once per chunk) adds
+    up into one record. Stages that belong to a single Day are recorded separately, per Day.
+
+    Peak memory (how far allocated memory rose above where it was when the stage started) is only measured in the
+    tracemalloc capture mode, so when no capture mode is on each stage costs no more than a couple of clock reads.
+    """
+
+    def __init__(self, capture=()):
+        """
+        :param capture: the detailed capture modes to switch on, out of ``CAPTURE_MODES``
+        """
+        self.started = datetime.now()
+        self.start_time = time.perf_counter()
+        self.stages = {}
+        self.days = {}
+        self.notes = {}
+        self.capture = list(capture)
+        self._peaks = []  # Highest traced memory seen so far by each open stage, innermost last
+
+        self.cprofile = None
+        if "cprofile" in self.capture:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        if "tracemalloc" in self.capture and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, rows=None, day=None):
+        """
+        Times the code run inside the ``with`` block as the stage ``name``. The block can add rows it only finds out
+        about later with ``record["rows"] = ...`` on the dict it gets.
+
+        :param name: the name of the stage
+        :param rows: number of rows the stage works on, if known up front
+        :param day: the Day number, if the stage is for one Day
+        """
+        started = self._begin()
+        record = {"rows": rows}
+        try:
+            yield record
+        finally:
+            self._end(name, started, record["rows"], day)
+
+    def iterate(self, name, iterable):
+        """
+        Times how long it takes to get each item out of ``iterable`` (e.g. the chunks of a csv being read), as the stage
+        ``name``, counting the rows of each item.
+
+        :param name: the name of the stage
+        :param iterable: an iterable of objects with a length, such as dataframes
+        """
+        iterator = iter(iterable)
+        while True:
+            started = self._begin()
+            item = next(iterator, None)
+            if item is None:
+                self._end(name, started, record=False)
+                return
+            self._end(name, started, len(item))
+            yield item
+
+    def _begin(self):
+        """
+        :return: what ``_end`` needs to know about when a stage was started
+        """
+        traced_at_start = None
+        if "tracemalloc" in self.capture and tracemalloc.is_tracing():
+            self._peaks.append(0)
+            tracemalloc.reset_peak()
+            traced_at_start = tracemalloc.get_traced_memory()[0]
+        return time.perf_counter(), traced_at_start
+
+    def _end(self, name, started, rows=None, day=None, record=True):
+        """
+        Finishes a stage started with ``_begin``.
+
+        :param record: if False, the stage is closed without adding it to the profile
+        """
+        start, traced_at_start = started
+        seconds = time.perf_counter() - start
+        peak = None
+        if traced_at_start is not None:
+            traced_peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop())
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], traced_peak)
+            peak = traced_peak - traced_at_start
+        if record:
+            self.add(name, seconds, rows, peak, day)
+
+    def add(self, name, seconds, rows=None, peak_bytes=None, day=None):
+        """
+        Adds one run of a stage to its record.
+
+        :param name: the name of the stage
+        :param seconds: wall time of the run
+        :param rows: number of rows the run worked on (optional)
+        :param peak_bytes: peak traced memory during the run, above what was already allocated when it started
+            (optional)
+        :param day: the Day number, if the stage is for one Day
+        """
+        self._combine(self._record(name, day), {"seconds": seconds, "calls": 1, "rows": rows,
+                                                "peak_bytes": peak_bytes, "max_rss_bytes": max_rss_bytes()})
+
+    def note(self, name, value):
+        """
+        Saves a figure about the run that isn't a stage timing (e.g. how many bytes each row of raw_data takes up).
+
+        :param name: the name of the figure
+        :param value: its value (anything JSON can store)
+        """
+        self.notes[name] = value
+
+    def merge(self, stages, day=None):
+        """
+        Adds the stage records of another profile (e.g. one kept by a worker process) into this one.
+
+        :param stages: the ``stages`` dict of another RunProfile
+        :param day: the Day number to file them under, if they are for one Day
+        """
+        for name, other in stages.items():
+            self._combine(self._record(name, day), other)
+
+    def _record(self, name, day):
+        """
+        :return: the record of stage ``name`` (for Day ``day``, if given), created empty if it isn't there yet
+        """
+        stages = self.stages if day is None else self.days.setdefault(str(day), {})
+        return stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rows": None, "peak_bytes": None,
+                                        "max_rss_bytes": None})
+
+    @staticmethod
+    def _combine(record, other):
+        """
+        Adds the runs in ``other`` to ``record``: times, calls and rows add up, and memory keeps the highest value.
+        """
+        record["seconds"] += other["seconds"]
+        record["calls"] += other["calls"]
+        if other["rows"] is not None:
+            record["rows"] = (record["rows"] or 0) + int(other["rows"])
+        for key in ["peak_bytes", "max_rss_bytes"]:
+            if other.get(key) is not None:
+                record[key] = max(record[key] or 0, other[key])
+
+    def write(self, folder):
+        """
+        Stops any detailed captures and saves the profile in ``folder`` as ``RunProfile.json``, along with the cProfile
+        stats (``RunProfile.prof``, plus a readable summary in ``RunProfile.txt``) if cProfile was on.
+
+        :param folder: Path object of the output folder
+        """
+        profile = {"started": self.started.isoformat(timespec="seconds"),
+                   "total_seconds": time.perf_counter() - self.start_time,
+                   "capture": self.capture,
+                   "max_rss_bytes": max_rss_bytes(),
+                   "notes": self.notes,
+                   "stages": self.stages,
+                   "days": self.days}
+
+        if self.cprofile is not None:
+            import pstats
+            self.cprofile.disable()
+            self.cprofile.dump_stats(folder / CPROFILE_FILE)
+            with open(folder / CPROFILE_SUMMARY_FILE, "w") as text_file:
+                pstats.Stats(self.cprofile, stream=text_file).sort_stats("cumulative").print_stats(50)
+            self.cprofile = None
+
+        if "tracemalloc" in self.capture and tracemalloc.is_tracing():
+            top_allocations = tracemalloc.take_snapshot().statistics("lineno")[:25]
+            profile["top_allocations"] = [{"where": str(statistic.traceback), "bytes": statistic.size,
+                                           "blocks": statistic.count} for statistic in top_allocations]
+            tracemalloc.stop()
+
+        with open(folder / PROFILE_FILE, "w") as f:
+            json.dump(profile, f, indent=2)
+
+
+def max_rss_bytes():
+    """
+    :return: the highest resident memory of this process so far, in bytes (None if it can't be found on this system)
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+profile = RunProfile()
+
+
+def start(capture=()):
+    """
+    Starts profiling a new run, throwing away anything recorded since the last one.
+
+    :param capture: the detailed capture modes to switch on, out of ``CAPTURE_MODES``
+    """
+    global profile
+    if profile.cprofile is not None:  # The last run never got to write its profile
+        profile.cprofile.disable()
+    if "tracemalloc" in profile.capture and "tracemalloc" not in capture and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    profile = RunProfile(capture)
+
+
+def stage(name, rows=None, day=None):
+    """
+    Times a stage of the current run (see ``RunProfile.stage``).
+    """
+    return profile.stage(name, rows, day)
+
+
+def iterate(name, iterable):
+    """
+    Times getting each item out of ``iterable`` in the current run (see ``RunProfile.iterate``).
+    """
+    return profile.iterate(name, iterable)
+
+
+def note(name, value):
+    """
+    Saves a figure about the current run (see ``RunProfile.note``).
+    """
+    profile.note(name, value)
+
+
+def merge(stages, day=None):
+    """
+    Adds stage records from another profile into the current run (see ``RunProfile.merge``).
+    """
+    profile.merge(stages, day)
+
+
+def write(folder):
+    """
+    Saves the current run's profile in ``folder`` (see ``RunProfile.write``).
+    """
+    profile.write(folder)
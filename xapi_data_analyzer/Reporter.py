@@ -0,0 +1,137 @@
+import sys
+
+
+class Cancelled(Exception):
+    """
+    Raised by ``check_cancelled`` once the user has asked for the run to stop.
+    """
+
+
+class ConsoleReporter:
+    """
+    Reports to the terminal, for headless/scripted runs.
+    """
+
+    def popup(self, message, title=""):
+        stream = sys.stderr if title.startswith(("Error", "Fatal", "Verification")) else sys.stdout
+        print((title + ": " if title else "") + message, file=stream)
+
+    def progress(self, title, current, total):
+        print(title + ": " + str(current) + "/" + str(total))
+
+    def status(self, message):
+        print(message)
+
+    def cancelled(self):
+        return False
+
+
+class GuiReporter:
+    """
+    Reports with PySimpleGUI popups and progress meters, for when there is no main window to report through (e.g. after
+    the GUI has crashed).
+    """
+
+    def __init__(self):
+        import PySimpleGUI as sg
+        self.sg = sg
+
+    def popup(self, message, title=""):
+        self.sg.Popup(message, title=title)
+
+    def progress(self, title, current, total):
+        self.sg.OneLineProgressMeter(title, current, total, orientation="h")
+
+    def status(self, message):
+        pass
+
+    def cancelled(self):
+        return False
+
+
+class WindowReporter:
+    """
+    Reports from a worker thread by posting events to a PySimpleGUI window, which is the only thread-safe way to reach
+    it. The window's event loop gets ``(message, title)`` with POPUP_EVENT, ``(title, current, total)`` with
+    PROGRESS_EVENT and the message with STATUS_EVENT.
+    """
+
+    POPUP_EVENT = "-POPUP-"
+    PROGRESS_EVENT = "-PROGRESS-"
+    STATUS_EVENT = "-STATUS-"
+
+    def __init__(self, window, cancel_event):
+        """
+        :param window: the PySimpleGUI Window to post events to
+        :param cancel_event: a threading.Event that is set when the user asks for the run to stop
+        """
+        self.window = window
+        self.cancel_event = cancel_event
+
+    def popup(self, message, title=""):
+        self.window.write_event_value(self.POPUP_EVENT, (message, title))
+
+    def progress(self, title, current, total):
+        self.window.write_event_value(self.PROGRESS_EVENT, (title, current, total))
+
+    def status(self, message):
+        self.window.write_event_value(self.STATUS_EVENT, message)
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+reporter = ConsoleReporter()
+
+
+def set_reporter(new_reporter):
+    """
+    Installs the reporter that all popups and progress updates go to. A ``ConsoleReporter`` is used until something else
+    is installed, so headless runs never import anything GUI-related.
+
+    :param new_reporter: an object with ``popup(message, title)``, ``progress(title, current, total)``,
+        ``status(message)`` and ``cancelled()`` methods
+    """
+    global reporter
+    reporter = new_reporter
+
+
+def popup(message, title=""):
+    """
+    Shows a message to the user.
+
+    :param message: the message text
+    :param title: the title of the message (e.g. "Error")
+    """
+    reporter.popup(message, title)
+
+
+def progress(title, current, total):
+    """
+    Reports progress through a number of steps.
+
+    :param title: what is being worked on
+    :param current: the step that was just reached (starting at 1)
+    :param total: the total number of steps
+    """
+    reporter.progress(title, current, total)
+
+
+def status(message):
+    """
+    Reports what is being worked on, for updates that don't have a number of steps (e.g. rows read so far).
+
+    :param message: the message text
+    """
+    reporter.status(message)
+
+
+def check_cancelled():
+    """
+    Stops the run if the user asked for it to be cancelled. Called between stages, where stopping leaves nothing
+    half-done.
+
+    :raises Cancelled: if the run was cancelled
+    """
+    if reporter.cancelled():
+        raise Cancelled()
@@ -0,0 +1,355 @@
+import multiprocessing
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+import Profiler
+import Reporter
+import ResultCache
+
+# pyarrow is optional: without it, only the usual folder per Day can be written
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# Default number of worker processes rendering reports (0 renders everything in the main process instead)
+DEFAULT_WORKERS = min(4, max(1, (os.cpu_count() or 1) - 1))
+ERROR_LOG = "xAPI-Data-Analyzer-ERROR-LOG.txt"
+# The files a consolidated run writes instead of a folder per Day, and how many bytes of each are buffered in memory
+# before they're written out (so slow network shares see a few large writes rather than many small ones)
+ELEMENTS_FILE = "Elements.parquet"
+DURATIONS_FILE = "StudentDurations.parquet"
+TOTALS_FILE = "TotalDurations.parquet"
+GRAPHS_FILE = "Graphs.pdf"
+WRITE_BUFFER_BYTES = 8 * 1024 ** 2
+
+
+class ReportPool:
+    """
+    Hands finished reports off to a pool of worker processes, so the next Day can be analyzed while the last one is
+    still being written and rendered. Any errors in the workers are collected and written to the error log when the pool
+    is closed, rather than stopping the analysis. What each report returns is kept in ``results``, in the order the
+    reports were submitted (None for reports that failed).
+    """
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = DEFAULT_WORKERS
+        # Workers are started fresh rather than forked, so they don't inherit the GUI's window and threads (or a
+        # forked copy of every Day's data) from the main process
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) \
+            if workers > 0 else None
+        self.futures = []
+        self.errors = []
+        self.results = []
+
+    def submit(self, function, *args):
+        """
+        Runs ``function(*args)`` on a worker (or right away, if the pool has no workers).
+
+        :param function: a module-level function, so it can be sent to a worker process
+        :param args: the arguments to call it with
+        """
+        if self.executor is None:
+            try:
+                self.results.append(function(*args))
+            except Exception as e:
+                self.results.append(None)
+                self.errors.append(e)
+        else:
+            self.futures.append(self.executor.submit(function, *args))
+
+    def close(self):
+        """
+        Waits for every submitted report to finish and shuts down the workers. Errors are appended to the error log.
+
+        :return: the number of reports that failed
+        """
+        if self.executor is not None:
+            for i, future in enumerate(self.futures, 1):
+                if future.exception() is not None:
+                    self.results.append(None)
+                    self.errors.append(future.exception())
+                else:
+                    self.results.append(future.result())
+                Reporter.progress("Saving reports", i, len(self.futures))
+            self.executor.shutdown()
+
+        if self.errors:
+            with open(ERROR_LOG, "a") as error_file:
+                for error in self.errors:
+                    traceback.print_exception(type(error), error, error.__traceback__, file=error_file)
+        return len(self.errors)
+
+    def cancel(self):
+        """
+        Shuts down the workers, dropping the reports that haven't been started yet and waiting for the ones that have.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+
+class ConsolidatedWriter:
+    """
+    Writes the reports of every Day into a handful of files rather than a folder per Day: the element tables and the
+    student durations each go into one Parquet file with a "Day" column, and the graphs into one multi-page PDF.
+
+    Each Day is written as its own row group as soon as it's added, so a single Day can be read back without loading
+    the rest, e.g. ``pd.read_parquet("Elements.parquet", filters=[("Day", "==", 3)])``. Everything goes through large
+    write buffers, and the files are only complete once ``close`` is called.
+    """
+
+    def __init__(self, folder):
+        """
+        :param folder: Path object of the (already created) folder to write the files in
+        """
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        self.folder = folder
+        self.streams = []
+        self.element_writer = None  # Opened once the first Day's table shows what the columns are
+        self.durations_writer = pq.ParquetWriter(self.open_stream(DURATIONS_FILE), pa.schema(
+            [("Day", pa.int64()), ("Student", pa.string()), ("Duration (min)", pa.float64())]))
+        self.graphs_file = open(folder / GRAPHS_FILE, "wb", buffering=WRITE_BUFFER_BYTES)
+        self.graphs = PdfPages(self.graphs_file)
+
+    def open_stream(self, file_name):
+        """
+        :param file_name: name of a file in the folder
+        :return: a buffered output stream writing to it, which is closed along with the writer
+        """
+        stream = pa.output_stream(str(self.folder / file_name), buffer_size=WRITE_BUFFER_BYTES)
+        self.streams.append(stream)
+        return stream
+
+    @staticmethod
+    def is_available():
+        """
+        :return: True if the libraries needed for writing the consolidated files are installed
+        """
+        return pa is not None
+
+    def add_day(self, day_num, day_df, students_dict, class_size):
+        """
+        Adds one Day's element table, student durations and graphs.
+
+        :param day_num: the Day number
+        :param day_df: dataframe for the Day's ElementCollection object
+        :param students_dict: dict mapping students to their duration for the Day
+        :param class_size: number of students in the class
+        """
+        with Profiler.stage("write_tables", rows=len(day_df) + len(students_dict), day=day_num):
+            elements = pa.Table.from_pandas(day_df.assign(Day=day_num)[["Day"] + list(day_df.columns)],
+                                            preserve_index=False)
+            if self.element_writer is None:
+                # A column that's empty on the first Day gets the type it has on the other Days
+                fields = []
+                for field in elements.schema:
+                    if field.type == pa.null():
+                        field = field.with_type(pa.string())
+                    elif field.type == pa.list_(pa.null()):
+                        field = field.with_type(pa.list_(pa.string()))
+                    fields.append(field)
+                self.element_writer = pq.ParquetWriter(self.open_stream(ELEMENTS_FILE),
+                                                       pa.schema(fields, metadata=elements.schema.metadata))
+            self.element_writer.write_table(elements.cast(self.element_writer.schema))
+            self.durations_writer.write_table(pa.table({"Day": pa.array([day_num] * len(students_dict), pa.int64()),
+                                                        "Student": pa.array(list(students_dict), pa.string()),
+                                                        "Duration (min)": pa.array(list(students_dict.values()),
+                                                                                   pa.float64())},
+                                                       schema=self.durations_writer.schema))
+
+        with Profiler.stage("generate_graphs", day=day_num):
+            duration_df = pd.DataFrame.from_dict(students_dict, orient='index')
+            for _, fig in day_figures(day_df, duration_df, class_size, "Day " + str(day_num) + ": "):
+                self.graphs.savefig(fig)
+
+    def write_totals(self, totals_df):
+        """
+        :param totals_df: the dataframe of ``Main.total_durations``, indexed by student
+        """
+        with Profiler.stage("write_tables", rows=len(totals_df)):
+            pq.write_table(pa.Table.from_pandas(totals_df.rename_axis("Student").reset_index(), preserve_index=False),
+                           self.open_stream(TOTALS_FILE))
+
+    def close(self):
+        """
+        Finishes writing every file.
+        """
+        if self.element_writer is not None:
+            self.element_writer.close()
+        self.durations_writer.close()
+        for stream in self.streams:
+            stream.close()
+        self.graphs.close()
+        self.graphs_file.close()
+
+
+def write_day_reports(day_folder, day_num, day_df, students_dict, class_size, cached_graphs=None):
+    """
+    Writes all the files for one Day: the Day csv, the student durations csv (or a note if there aren't any) and the
+    graphs.
+
+    :param day_folder: Path object of the (already created) folder for this Day
+    :param day_num: the Day number
+    :param day_df: dataframe for the Day's ElementCollection object
+    :param students_dict: dict mapping students to their duration for the Day
+    :param class_size: number of students in the class
+    :param cached_graphs: list of the paths of this Day's graphs in the ``ResultCache``, to be copied rather than drawn
+        again (optional)
+    :return: a tuple of (the ``stages`` of a RunProfile timing the csvs and graphs, since a worker process can't add to
+        the main process's profile itself, and a list of the paths of the graphs)
+    """
+    run_profile = Profiler.RunProfile()
+    with run_profile.stage("write_csvs", rows=len(day_df) + len(students_dict)):
+        day_df.to_csv(day_folder / ("Day" + str(day_num) + ".csv"))
+
+        # create student durations dataframe
+        df_students = pd.DataFrame.from_dict(students_dict, orient='index')
+        if not df_students.empty:
+            df_students.to_csv(day_folder / ("StudentDurations_Day" + str(day_num) + ".csv"))
+        else:
+            with open(day_folder / ("StudentDurations_Day" + str(day_num) + ".txt"), "w") as text_file:
+                text_file.write("No student durations data to report for Day " + str(day_num) +
+                                ". Because of this, the student durations CSV and histogram were not generated.")
+
+    # Generate and save graphs
+    if cached_graphs is not None:
+        with run_profile.stage("copy_cached_graphs"):
+            ResultCache.copy_graphs(cached_graphs, day_folder)
+        return run_profile.stages, [day_folder / Path(graph).name for graph in cached_graphs]
+    with run_profile.stage("generate_graphs"):
+        graphs = generate_graphs(day_df, df_students, day_folder, class_size)
+    return run_profile.stages, graphs
+
+
+def generate_graphs(element_df, duration_df, folder, class_size):
+    """
+    Saves the graphs of ``day_figures`` as pngs in ``folder``.
+
+    :param element_df: dataframe for an ElementCollection object
+    :param duration_df: dataframe containing students' durations for the same ElementCollection object
+    :param folder: Path object of the folder to save the graphs in
+    :param class_size: number of students in the class
+    :return: a list of the paths of the graphs
+    """
+    graphs = []
+    for name, fig in day_figures(element_df, duration_df, class_size):
+        graphs.append(folder / (name + ".png"))
+        fig.savefig(graphs[-1])
+    return graphs
+
+
+def day_figures(element_df, duration_df, class_size, title_prefix=""):
+    """
+    Creates graphs of the following:
+
+    * % of students who interacted with each given element
+    * # of students who interacted with each given element
+    * Histogram of the durations that students spent on all elements in ``element_df``
+
+    Each graph gets its own Figure on the non-interactive Agg canvas rather than going through pyplot's global state,
+    so this is safe to run in several worker processes at once.
+
+    :param element_df: dataframe for an ElementCollection object
+    :param duration_df: dataframe containing students' durations for the same ElementCollection object
+    :param class_size: number of students in the class
+    :param title_prefix: put in front of every graph's title (e.g. the Day, when all Days share one document)
+    :return: a list of (file name without extension, Figure) tuples
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figures = []
+    # Generate student % interacted graph
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    element_df.plot(x="object id", y="% of users who interacted", kind="bar", ax=ax)
+    ax.set_xlabel("H5P ID")
+    ax.set_ylabel("Percent")
+    ax.set_ylim(0, 100)
+    ax.set_title(title_prefix + "Students % Interacted")
+    figures.append(("student_percent_interacted", fig))
+
+    # Generate student count interacted graph
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    element_df.plot(x="object id", y="Number of users who interacted", kind="bar", ax=ax)
+    ax.set_xlabel("H5P ID")
+    ax.set_ylim(0, class_size)
+    ax.set_title(title_prefix + "Student Interacted Count")
+    figures.append(("student_count_interacted", fig))
+
+    # Generate student duration histogram
+    if not duration_df.empty:  # Make sure student_durations isn't empty, bc that makes the histogram a n g e r y
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        duration_df.hist(ax=ax)
+        ax.set_xlabel("Duration (min)")
+        ax.set_ylabel("Number of Students")
+        ax.set_title(title_prefix + "Student Durations")
+        figures.append(("student_durations", fig))
+    return figures
+
+
+def write_sweep_report(sweep_df, folder, delta_max):
+    """
+    Saves the Time_Delta sweep as ``TimeDeltaSweep.csv`` and plots it as ``time_delta_sweep.png`` in ``folder``, one
+    line per column of ``sweep_df``.
+
+    :param sweep_df: dataframe of total durations in minutes, indexed by Time_Delta (see ``sweep_days``)
+    :param folder: Path object of the folder to save the files in
+    :param delta_max: the Time_Delta from the JSON file, which gets marked on the plot
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    sweep_df.to_csv(folder / "TimeDeltaSweep.csv")
+    if sweep_df.columns.empty:  # No Day has any statements, so nothing to plot
+        return
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    sweep_df.plot(ax=ax, legend=False)
+    ax.axvline(delta_max, color="gray", linestyle="--", label="Time_Delta = " + str(delta_max))
+    ax.set_xlabel("Time_Delta (min)")
+    ax.set_ylabel("Total Duration (min)")
+    ax.set_title("Total Duration vs. Time_Delta")
+    ax.legend(fontsize="x-small", ncol=max(1, len(sweep_df.columns) // 15), loc="lower right")
+    fig.savefig(folder / "time_delta_sweep.png")
+
+
+def write_weekly_report(weekly_df, folder):
+    """
+    Saves every student's weekly engaged time as ``WeeklyEngagement.csv``, and plots the number of engaged students and
+    their total time in each week as ``weekly_engagement.png``, in ``folder``.
+
+    :param weekly_df: dataframe of durations in minutes, with one row per student and one column per week (see
+        ``ElementCollection.weekly_durations``)
+    :param folder: Path object of the folder to save the files in
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    weekly_df.to_csv(folder / "WeeklyEngagement.csv")
+    if weekly_df.columns.empty:  # No statements at all, so nothing to plot
+        return
+
+    fig = Figure(figsize=(10, 8))
+    FigureCanvasAgg(fig)
+    students_ax, duration_ax = fig.subplots(2, 1, sharex=True)
+    weekly_df.notna().sum().plot.bar(ax=students_ax, color="blue")
+    students_ax.set_ylabel("Number of Engaged Students")
+    students_ax.set_title("Weekly Engagement")
+    weekly_df.sum().plot.bar(ax=duration_ax, color="blue")
+    duration_ax.set_ylabel("Total Duration (min)")
+    fig.tight_layout()
+    fig.savefig(folder / "weekly_engagement.png")
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+
+
+# Where cached results are stored, and the max number of bytes the cache may take up before old entries are evicted
+RESULT_CACHE_DIR = Path.home() / ".xapi-data-analyzer" / "results"
+MAX_RESULT_CACHE_BYTES = 512 * 1024 ** 2
+# Bump this whenever what goes into a report changes so old results are no longer used
+RESULT_CACHE_VERSION = 1
+# The file in each entry's folder holding the element dataframe and student durations (the graphs sit next to it)
+RESULT_FILE = "result.pkl"
+
+
+def key(data_fingerprint, id_list, delta_max, extended=False, window=(None, None)):
+    """
+    Creates a key identifying one report: the same H5P IDs (in any order) analyzed with the same Time_Delta over the
+    same data and date range always give the same report.
+
+    :param data_fingerprint: key of the loaded data (see ``GlobalData.fingerprint_data``)
+    :param id_list: the list of H5P IDs
+    :param delta_max: the Time_Delta in minutes
+    :param extended: True if the report has the extra element metrics
+    :param window: the (start, end) UTC Timestamps of the statements analyzed, either of which may be None (see
+        ``TimeWindow.bounds``)
+    :return: a hex string key for the report
+    """
+    parts = [str(RESULT_CACHE_VERSION), data_fingerprint, ",".join(str(element_id) for element_id in sorted(id_list)),
+             str(delta_max), str(extended)] + ["" if time is None else str(time.value) for time in window]
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def load(result_key, id_list):
+    """
+    Loads a report from the cache, if it's there.
+
+    :param result_key: the report's key from ``key``
+    :param id_list: the list of H5P IDs, in the order the element dataframe should be in
+    :return: a tuple of (element dataframe, dict mapping students to their duration, list of the paths of the cached
+        graphs), or None if the report isn't cached (or its entry couldn't be read, in which case it's deleted). The
+        graphs are None if they weren't rendered, or were rendered with the elements in a different order.
+    """
+    entry = RESULT_CACHE_DIR / result_key
+    try:
+        with open(entry / RESULT_FILE, "rb") as f:
+            result = pickle.load(f)
+        # Mark the entry as recently used so it's the last to be evicted
+        os.utime(entry)
+    except OSError:
+        return None
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+        # A corrupt entry (or one pickled by an incompatible pandas) is deleted, since the report could never be saved
+        # again while it's there
+        shutil.rmtree(entry, ignore_errors=True)
+        return None
+
+    day_df = result["day_df"]
+    graphs = None if result["graph_names"] is None else [entry / name for name in result["graph_names"]]
+    if list(result["id_list"]) != list(id_list):
+        # Same elements, different order: the table is put in the new order, but the bar graphs have to be redrawn
+        rows = {element_id: position for position, element_id in enumerate(day_df["object id"])}
+        day_df = day_df.iloc[[rows[element_id] for element_id in id_list]]
+        day_df.index = list(id_list)
+        graphs = None
+    return day_df, result["students_dict"], graphs
+
+
+def save(result_key, id_list, day_df, students_dict, graphs=None):
+    """
+    Saves a report to the cache, then evicts the least recently used entries if the cache has grown past
+    ``MAX_RESULT_CACHE_BYTES``. Failing to write the cache never stops the analysis.
+
+    :param result_key: the report's key from ``key``
+    :param id_list: the list of H5P IDs, in the order of the element dataframe
+    :param day_df: the element dataframe
+    :param students_dict: dict mapping students to their duration
+    :param graphs: list of the paths of the rendered graphs (None if they weren't rendered)
+    """
+    entry = RESULT_CACHE_DIR / result_key
+    try:
+        RESULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # The entry is put together in a temporary folder, so it never shows up half-written
+        staging = Path(tempfile.mkdtemp(dir=RESULT_CACHE_DIR, prefix=".tmp-"))
+        try:
+            for graph in graphs or []:
+                shutil.copyfile(graph, staging / Path(graph).name)
+            with open(staging / RESULT_FILE, "wb") as f:
+                pickle.dump({"id_list": list(id_list), "day_df": day_df, "students_dict": students_dict,
+                             "graph_names": None if graphs is None else [Path(graph).name for graph in graphs]}, f)
+            os.rename(staging, entry)
+        except OSError:
+            # e.g. another run saved the same report first
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        evict()
+    except (OSError, pickle.PicklingError):
+        pass
+
+
+def copy_graphs(graphs, folder):
+    """
+    :param graphs: list of the paths of cached graphs (from ``load``)
+    :param folder: Path object of the folder to copy them into
+    """
+    for graph in graphs:
+        shutil.copyfile(graph, folder / Path(graph).name)
+
+
+def evict(max_bytes=None):
+    """
+    Deletes the least recently used cache entries until the cache takes up at most ``max_bytes``.
+
+    :param max_bytes: the max size of the cache in bytes, defaults to ``MAX_RESULT_CACHE_BYTES``
+    """
+    if max_bytes is None:
+        max_bytes = MAX_RESULT_CACHE_BYTES
+    if not RESULT_CACHE_DIR.exists():
+        return
+
+    entries = []
+    for entry in RESULT_CACHE_DIR.iterdir():
+        if entry.name.startswith(".tmp-"):
+            continue
+        try:
+            entries.append((entry.stat().st_mtime, sum(file.stat().st_size for file in entry.iterdir()), entry))
+        except OSError:  # Evicted by another run in the meantime
+            continue
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total_bytes -= size
+
+
+def clear():
+    """
+    Invalidates the whole cache by deleting every cached report.
+    """
+    evict(max_bytes=0)
@@ -0,0 +1,341 @@
+import argparse
+import collections
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import jsonschema
+import GlobalData
+import Reporter
+import Profiler
+import StatementReader
+import TimeWindow
+from ElementCollection import ElementCollection, analyze_days
+from Main import select_days, total_durations
+
+
+# Most results (and ElementCollections) kept in memory at once; the least recently used ones are dropped first
+MAX_CACHED_RESULTS = 256
+MAX_CACHED_COLLECTIONS = 64
+# Largest delta_max (in minutes) a query can ask for. A week is already far longer than anyone stays engaged without a
+# statement, and much larger values would overflow the nanosecond gap sums.
+MAX_DELTA_MAX = 7 * 24 * 60
+
+
+class QueryService:
+    """
+    Keeps one export loaded in memory and answers questions about it, so a dashboard can ask for numbers on demand
+    without the data being read again every time. Answers are memoized until a newer export is loaded.
+
+    The export can be a csv (or statements) file or a folder of them, in which case the newest one in the folder is
+    used. ``watch`` checks for a newer export every few seconds and loads it in place of the old one. Queries and
+    reloads take turns (the data lives in ``GlobalData``), so queries wait while a newer export is being loaded.
+    """
+
+    def __init__(self, data_path, json_path, use_cache=True, responses=False):
+        """
+        :param data_path: path to the raw data csv (or statements file), or to a folder of them
+        :param json_path: path to the DayElement.json file
+        :param use_cache: if True, reuse the cleaned data from ``DataCache`` when an export was loaded before
+        :param responses: if True, the responses are kept in memory too, so the extra element metrics can be asked for
+        """
+        self.data_path = data_path
+        self.json_path = json_path
+        self.use_cache = use_cache
+        self.responses = responses
+        self.lock = threading.Lock()
+        self.source = None  # (csv path, its mtime and size, and the JSON file's mtime) of the loaded export
+        self.loaded_at = None
+        self.results = collections.OrderedDict()
+        self.collections = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.reload(self.find_source())
+
+    def find_source(self):
+        """
+        :return: a tuple identifying the newest export, which changes whenever a newer export shows up or it is
+            rewritten
+        :raises FileNotFoundError: if there is no export (or JSON file) to load
+        """
+        csv_path = self.data_path
+        if os.path.isdir(self.data_path):
+            csv_paths = [file_path for extension in (".csv",) + StatementReader.STATEMENT_EXTENSIONS
+                         for file_path in glob.glob(os.path.join(self.data_path, "*" + extension))]
+            if not csv_paths:
+                raise FileNotFoundError(2, "No csv or statements files found", self.data_path)
+            csv_path = max(csv_paths, key=os.path.getmtime)
+        csv_stat = os.stat(csv_path)
+        return csv_path, csv_stat.st_mtime_ns, csv_stat.st_size, os.stat(self.json_path).st_mtime_ns
+
+    def reload(self, source):
+        """
+        Loads the export ``source`` points to, and forgets every memoized result.
+
+        :param source: a tuple from ``find_source``
+        """
+        with self.lock:
+            Profiler.start()
+            GlobalData.set_data_vars(source[0], self.json_path, use_cache=self.use_cache, responses=self.responses)
+            self.source = source
+            self.loaded_at = datetime.now()
+            self.results.clear()
+            self.collections.clear()
+
+    def watch(self, interval):
+        """
+        Checks for a newer export every ``interval`` seconds, forever, and loads it once it has stopped changing (so an
+        export still being copied in isn't loaded half-written). If loading fails, the old data keeps being served.
+
+        :param interval: seconds between checks
+        """
+        pending = None
+        while True:
+            time.sleep(interval)
+            try:
+                source = self.find_source()
+                if source == self.source:
+                    pending = None
+                elif source != pending:
+                    pending = source
+                else:
+                    Reporter.popup("Loading newer export " + source[0], title="Reload")
+                    self.reload(source)
+                    pending = None
+            except Exception:
+                Reporter.popup("Could not load the newer export, still serving the old one:\n"
+                               + traceback.format_exc(), title="Error")
+
+    def query(self, endpoint, params):
+        """
+        Answers one question about the loaded data.
+
+        :param endpoint: "status", "days", "elements", "durations" or "totals"
+        :param params: dict of the query's parameters (see ``README.md``), as strings
+        :return: the answer, as something ``json.dumps`` can write
+        :raises LookupError: if there's no such endpoint or Day
+        :raises ValueError: if a parameter isn't valid
+        """
+        with self.lock:
+            if endpoint == "status":
+                return self.status()
+            if endpoint == "days":
+                return [{key: day[key] for key in ["DayNumber", "Title", "Unit", "Elements"]}
+                        for day in GlobalData.DayInfo["Days"].values()]
+            if endpoint in ("elements", "durations"):
+                id_list = self.id_list(params)
+                window = self.window(params)
+                if endpoint == "elements":
+                    extended = params.get("metrics", "false").lower() in ("1", "true", "yes")
+                    if extended and not self.responses:
+                        raise ValueError("metrics needs the server to be started with --metrics")
+                    return self.memoized(("elements", id_list, extended, window), lambda: json.loads(
+                        self.collection(id_list, window).get_dataframe(extended).to_json(orient="records",
+                                                                                         date_format="iso")))
+                delta_max = self.delta_max(params)
+                return self.memoized(("durations", id_list, delta_max, window),
+                                     lambda: self.collection(id_list, window).get_students_duration(delta_max))
+            if endpoint == "totals":
+                day_dict_list = self.day_dict_list(params.get("days", "all"))
+                delta_max = self.delta_max(params)
+                window = TimeWindow.parse_window(params.get("start"), params.get("end"))
+                day_numbers = tuple(day["DayNumber"] for day in day_dict_list)
+                return self.memoized(("totals", day_numbers, delta_max, window),
+                                     lambda: self.totals(day_dict_list, delta_max, window))
+            raise LookupError("Unknown endpoint: " + endpoint)
+
+    def status(self):
+        """
+        :return: a dict describing the loaded export and the memoized results
+        """
+        return {"data_path": self.source[0], "loaded_at": self.loaded_at.isoformat(timespec="seconds"),
+                "rows": len(GlobalData.raw_data), "students": GlobalData.identity.num_people,
+                "time_delta": GlobalData.delta_max, "cached_results": len(self.results), "hits": self.hits,
+                "misses": self.misses}
+
+    @staticmethod
+    def totals(day_dict_list, delta_max, window):
+        """
+        :param day_dict_list: a list of the day dictionary objects (from JSON file) to total up
+        :param delta_max: the Time_Delta in minutes
+        :param window: the (start, end) of the statements to look at
+        :return: every student's durations on each Day, Unit and in total, as a dict
+        """
+        data, interaction_matrix = GlobalData.window_data(*window)
+        day_results = analyze_days(day_dict_list, data, GlobalData.identity, delta_max, interaction_matrix)
+        return json.loads(total_durations(day_results, GlobalData.identity).to_json(orient="index"))
+
+    def memoized(self, key, compute):
+        """
+        :param key: a hashable key identifying the result
+        :param compute: a function taking no arguments that computes the result
+        :return: the result for ``key``, computed only if it isn't memoized already
+        """
+        if key in self.results:
+            self.hits += 1
+            self.results.move_to_end(key)
+            return self.results[key]
+        self.misses += 1
+        result = compute()
+        self.results[key] = result
+        if len(self.results) > MAX_CACHED_RESULTS:
+            self.results.popitem(last=False)
+        return result
+
+    def collection(self, id_list, window=(None, None)):
+        """
+        :param id_list: a tuple of H5P IDs
+        :param window: the (start, end) of the statements to look at
+        :return: an ElementCollection for ``id_list``, kept around so its expensive parts are only worked out once
+        """
+        key = (id_list, window)
+        if key in self.collections:
+            self.collections.move_to_end(key)
+        else:
+            data, interaction_matrix = GlobalData.window_data(*window)
+            self.collections[key] = ElementCollection(list(id_list), data, GlobalData.identity, interaction_matrix)
+            if len(self.collections) > MAX_CACHED_COLLECTIONS:
+                self.collections.popitem(last=False)
+        return self.collections[key]
+
+    def id_list(self, params):
+        """
+        :param params: the query's parameters, with either "ids" (a comma-separated list of H5P IDs) or "day" (a Day
+            number)
+        :return: a tuple of the H5P IDs asked for
+        """
+        if "ids" in params:
+            return tuple(int(item.strip()) for item in params["ids"].split(","))
+        if "day" in params:
+            return tuple(self.day_dict_list(params["day"])[0]["Elements"])
+        raise ValueError("Either ids or day is required")
+
+    def window(self, params):
+        """
+        :param params: the query's parameters, which may have a "start" and "end" date or time (see
+            ``TimeWindow.parse_window``)
+        :return: the (start, end) of the statements to look at, narrowed down to the Day's own window when asking about
+            a Day
+        """
+        start, end = TimeWindow.parse_window(params.get("start"), params.get("end"))
+        if "ids" not in params and "day" in params:
+            return TimeWindow.bounds(self.day_dict_list(params["day"])[0], start, end)
+        return start, end
+
+    def day_dict_list(self, day_num_list):
+        """
+        :param day_num_list: "all", or a comma-separated string of Day numbers
+        :return: a list of the day dictionary objects (from JSON file) asked for
+        """
+        day_dict_list = select_days(day_num_list)
+        if not day_dict_list:
+            raise LookupError("No such Day: " + day_num_list)
+        return day_dict_list
+
+    @staticmethod
+    def delta_max(params):
+        """
+        :param params: the query's parameters, which may have a "delta_max" in minutes
+        :return: the Time_Delta to use (the one from the JSON file if none was given)
+        :raises ValueError: if the delta_max isn't a whole number of minutes from 1 to ``MAX_DELTA_MAX``
+        """
+        delta_max = int(params.get("delta_max", GlobalData.delta_max))
+        if not 1 <= delta_max <= MAX_DELTA_MAX:
+            raise ValueError("delta_max must be from 1 to " + str(MAX_DELTA_MAX) + " minutes")
+        return delta_max
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Answers ``GET /<endpoint>?<params>`` requests with JSON from the server's QueryService.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            status, body = 200, self.server.service.query(url.path.strip("/") or "status", params)
+        except LookupError as e:
+            status, body = 404, {"error": str(e.args[0]) if e.args else str(e)}
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            traceback.print_exc()
+            status, body = 500, {"error": repr(e)}
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_server(service, host="127.0.0.1", port=8765):
+    """
+    :param service: the QueryService to answer requests with
+    :param host: the address to listen on (only local clients by default)
+    :param port: the port to listen on (0 picks a free one)
+    :return: a ThreadingHTTPServer, which starts answering requests once ``serve_forever`` is called
+    """
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    """
+    Loads an export and serves queries about it until interrupted.
+
+    :param argv: list of arguments (defaults to ``sys.argv[1:]``)
+    :return: the exit code
+    """
+    parser = argparse.ArgumentParser(description="Query server for the UW-Madison xAPI Data Analyzer. Loads an export "
+                                                 "once and answers questions about it as JSON over local HTTP.")
+    parser.add_argument("data_csv", help="the non-cleaned xAPI data .csv file (or raw xAPI statements), or a folder of "
+                                         "them (the newest one is used)")
+    parser.add_argument("day_element_json", help="the DayElement.json file")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument("--poll", type=float, default=10,
+                        help="seconds between checks for a newer export (default: 10, 0 turns reloading off)")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the cleaned data cache")
+    parser.add_argument("--metrics", action="store_true",
+                        help="keep the responses in memory too, so the elements endpoint can add the extra element "
+                             "metrics (metrics=1)")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    try:
+        service = QueryService(args.data_csv, args.day_element_json, use_cache=not args.no_cache,
+                               responses=args.metrics)
+    except FileNotFoundError as e:
+        Reporter.popup("ERROR: A provided file was not found: " + str(e.filename), title="Error")
+        return 1
+    except (json.JSONDecodeError, jsonschema.exceptions.ValidationError) as e:
+        Reporter.popup("ERROR: The DayElement.json file is invalid: " + str(getattr(e, "message", e)), title="Error")
+        return 1
+
+    if args.poll > 0:
+        threading.Thread(target=service.watch, args=(args.poll,), daemon=True).start()
+    server = make_server(service, args.host, args.port)
+    Reporter.popup("Serving " + service.source[0] + " on http://" + args.host + ":" + str(server.server_port),
+                   title="Ready")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import itertools
+import json
+from os import path
+import pandas as pd
+
+# pyarrow is optional: without it, newline-delimited statements are parsed with the (much slower) json module
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.json as pa_json
+except ImportError:
+    pa = None
+
+
+# Files with these extensions are read as raw xAPI statements rather than as a Learning Locker csv export
+STATEMENT_EXTENSIONS = (".json", ".jsonl", ".ndjson")
+# Where each column of the raw data csv is found in a statement, as paths of keys. The first path that's there wins, and
+# statements wrapped in a Learning Locker record ({"statement": {...}}) are unwrapped. The csv's Name is the actor's
+# account name (the uuid), so the actor's display name is only used for statements without an account.
+STATEMENT_FIELDS = {
+    "Name": [("actor", "account", "name"), ("actor", "name")],
+    "Verb": [("verb", "display", "en-US"), ("verb", "id")],
+    "object id": [("object", "id")],
+    "Question/Slide": [("object", "definition", "name", "en-US")],
+    "Timestamp": [("timestamp",)],
+    "Response": [("result", "response")],
+}
+# Verbs without a display name go by their IRI, cut down to the part after the last "/" (which is usually the verb)
+VERB_IRI_PREFIX = ".*/"
+# Bytes of newline-delimited statements parsed at a time by pyarrow
+BLOCK_SIZE = 16 * 1024 ** 2
+# Characters of a JSON array read in at a time
+READ_SIZE = 1024 ** 2
+
+
+def is_statement_file(data_path):
+    """
+    :param data_path: path to a raw data file
+    :return: True if the file holds raw xAPI statements, judging by its extension
+    """
+    return path.splitext(data_path)[1].lower() in STATEMENT_EXTENSIONS
+
+
+def read_statements(data_path, chunk_size):
+    """
+    Streams a file of raw xAPI statements, either newline-delimited JSON or one JSON array, as dataframes with the same
+    columns as the raw data csv (see ``STATEMENT_FIELDS``), so they can be cleaned just like csv chunks. Only a chunk
+    of statements is in memory at a time.
+
+    :param data_path: path to the statements file
+    :param chunk_size: max number of statements per dataframe (pyarrow may go by bytes instead)
+    :return: a generator of dataframes
+    """
+    with open(data_path, encoding="utf-8") as f:
+        first_character = f.read(1)
+        while first_character.isspace():
+            first_character = f.read(1)
+
+        if first_character == "[":
+            records = iterate_array(f)
+        elif pa is not None:
+            f.seek(0)
+            first_line = f.readline()
+            while first_line.isspace():
+                first_line = f.readline()
+            yield from read_ndjson_arrow(data_path, wrapped="statement" in json.loads(first_line))
+            return
+        else:
+            f.seek(0)
+            records = iterate_ndjson(f, chunk_size)
+
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                return
+            yield statements_frame(chunk)
+
+
+def iterate_ndjson(f, chunk_size):
+    """
+    :param f: a text file of newline-delimited JSON
+    :param chunk_size: number of lines parsed at a time
+    :return: a generator of the decoded statements
+    """
+    while True:
+        lines = [line for line in itertools.islice(f, chunk_size) if not line.isspace()]
+        if not lines:
+            return
+        # One call to the parser for the whole chunk is a lot faster than one per line
+        yield from json.loads("[" + ",".join(lines) + "]")
+
+
+def iterate_array(f):
+    """
+    :param f: a text file positioned just after the opening "[" of a JSON array
+    :return: a generator of the decoded items of the array, read in a bit at a time
+    :raises json.JSONDecodeError: if the array isn't valid JSON
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ","):
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            if position == len(buffer):
+                raise json.JSONDecodeError("Unterminated array", buffer, position)
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The next item runs past what was read so far (or the file is broken, if there's nothing left to read)
+            more = f.read(READ_SIZE)
+            if not more:
+                raise
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        yield item
+
+
+def statements_frame(statements):
+    """
+    :param statements: a list of decoded statements
+    :return: a dataframe with a column for each of ``STATEMENT_FIELDS``
+    """
+    columns = {}
+    for column, key_paths in STATEMENT_FIELDS.items():
+        values = []
+        for statement in statements:
+            statement = statement.get("statement", statement)
+            value = None
+            for key_path in key_paths:
+                value = statement
+                for key in key_path:
+                    value = value.get(key) if isinstance(value, dict) else None
+                if value is not None:
+                    break
+            values.append(value)
+        columns[column] = values
+    # Strings, like the csv's columns (see ``GlobalData.load_file``), even in a chunk where one is empty throughout
+    df = pd.DataFrame(columns, dtype=str)
+    df["Verb"] = df["Verb"].str.replace(VERB_IRI_PREFIX, "", regex=True)
+    return df
+
+
+def read_ndjson_arrow(data_path, wrapped=False):
+    """
+    Streams newline-delimited statements with pyarrow's JSON reader, which only parses the fields in
+    ``STATEMENT_FIELDS`` and skips over everything else.
+
+    :param data_path: path to the statements file
+    :param wrapped: True if the statements are wrapped in Learning Locker records (judging by the first one)
+    :return: a generator of dataframes
+    """
+    fields = statement_type()
+    schema = pa.schema([pa.field("statement", fields)] if wrapped else list(fields))
+    reader = pa_json.open_json(data_path, read_options=pa_json.ReadOptions(block_size=BLOCK_SIZE),
+                               parse_options=pa_json.ParseOptions(explicit_schema=schema,
+                                                                  unexpected_field_behavior="ignore"))
+    for batch in reader:
+        columns = {}
+        statements = batch.column("statement") if wrapped else pa.StructArray.from_arrays(batch.columns, fields=fields)
+        for column, key_paths in STATEMENT_FIELDS.items():
+            columns[column] = pc.coalesce(*[pc.struct_field(statements, list(key_path)) for key_path in key_paths])
+        columns["Verb"] = pc.replace_substring_regex(columns["Verb"], VERB_IRI_PREFIX, "")
+        yield pd.DataFrame({column: values.to_pandas() for column, values in columns.items()})
+
+
+def statement_type():
+    """
+    :return: a pyarrow struct type holding just the ``STATEMENT_FIELDS`` of a statement, as strings
+    """
+    tree = {}
+    for key_paths in STATEMENT_FIELDS.values():
+        for key_path in key_paths:
+            node = tree
+            for key in key_path[:-1]:
+                node = node.setdefault(key, {})
+            node[key_path[-1]] = None
+
+    def to_type(node):
+        return pa.struct([(key, pa.string() if child is None else to_type(child)) for key, child in node.items()])
+    return to_type(tree)
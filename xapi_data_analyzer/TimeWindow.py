@@ -0,0 +1,93 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+# Dates and times given without a UTC offset (in the GUI, on the command line or in DayElement.json) are in this time
+# zone, the same one the output folders are named in
+WINDOW_TIMEZONE = "America/Chicago"
+# A bare date like this one, which as the end of a window means the end of that day
+DATE_ONLY = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def parse_time(text, end=False):
+    """
+    :param text: an ISO 8601 date or date and time (e.g. "2021-03-01" or "2021-03-01T08:00-06:00"), or None/blank
+    :param end: if True, the time is the (exclusive) end of a window, so a bare date stands for the end of that day
+    :return: the time as a UTC pandas Timestamp, or None if ``text`` is blank
+    :raises ValueError: if ``text`` isn't a valid date or time
+    """
+    if text is None or not str(text).strip():
+        return None
+    text = str(text).strip()
+    time = pd.Timestamp(text)
+    if end and DATE_ONLY.match(text):
+        time += pd.Timedelta(days=1)
+    if time.tzinfo is None:
+        time = time.tz_localize(WINDOW_TIMEZONE)
+    return time.tz_convert("UTC")
+
+
+def parse_window(start_text, end_text):
+    """
+    :param start_text: the (inclusive) start of the window, as accepted by ``parse_time``, or None/blank
+    :param end_text: the (exclusive) end of the window, or None/blank
+    :return: a tuple of (start, end) as UTC Timestamps, either of which may be None
+    :raises ValueError: if either isn't a valid date or time, or the window is empty
+    """
+    start, end = parse_time(start_text), parse_time(end_text, end=True)
+    if start is not None and end is not None and start >= end:
+        raise ValueError("The start of the date range must be before its end")
+    return start, end
+
+
+def bounds(day=None, start=None, end=None):
+    """
+    :param day: a day dictionary object (from JSON file), whose optional "Start" and "End" limit the window further
+    :param start: the start of the window as a UTC Timestamp, or None
+    :param end: the end of the window as a UTC Timestamp, or None
+    :return: a tuple of (start, end) of the window the Day's statements are taken from (either may be None)
+    """
+    if day is not None:
+        day_start, day_end = parse_time(day.get("Start")), parse_time(day.get("End"), end=True)
+        start = max((time for time in (start, day_start) if time is not None), default=None)
+        end = min((time for time in (end, day_end) if time is not None), default=None)
+    return start, end
+
+
+def window_slice(timestamps, start=None, end=None):
+    """
+    Finds the rows from ``start`` up to (not including) ``end`` with two binary searches. The data is sorted by
+    descending timestamp, so they are always one contiguous run of rows.
+
+    :param timestamps: int64 nanosecond timestamps of the data, sorted in descending order (see
+        ``ElementCollection.timestamps_ns``)
+    :param start: the start of the window as a UTC Timestamp, or None for no start
+    :param end: the end of the window as a UTC Timestamp, or None for no end
+    :return: a slice of the positions of the rows in the window
+    """
+    # Reversed, the timestamps are in ascending order (a view, so nothing is copied)
+    ascending = timestamps[::-1]
+    num_rows = len(timestamps)
+    first = 0 if end is None else num_rows - int(np.searchsorted(ascending, end.value, side="left"))
+    last = num_rows if start is None else num_rows - int(np.searchsorted(ascending, start.value, side="left"))
+    return slice(first, max(first, last))
+
+
+def week_edges(first, last, start=None):
+    """
+    :param first: UTC Timestamp of the earliest statement to cover
+    :param last: UTC Timestamp of the latest statement to cover
+    :param start: UTC Timestamp the first week starts at (defaults to midnight of the Monday on or before ``first``, in
+        ``WINDOW_TIMEZONE``)
+    :return: a DatetimeIndex (in ``WINDOW_TIMEZONE``) of the start of every week up to ``last``, followed by the end of
+        the last week
+    """
+    if start is None:
+        first = first.tz_convert(WINDOW_TIMEZONE)
+        start = (first - pd.Timedelta(days=first.weekday())).normalize()
+    start = start.tz_convert(WINDOW_TIMEZONE)
+    # Weeks are seven calendar days, so they keep starting at the same time of day across daylight saving changes
+    local_span = last.tz_convert(WINDOW_TIMEZONE).tz_localize(None) - start.tz_localize(None)
+    num_weeks = local_span // pd.Timedelta(days=7) + 1
+    return pd.date_range(start, periods=max(num_weeks, 0) + 1, freq=pd.DateOffset(weeks=1))